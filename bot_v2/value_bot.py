@@ -6,6 +6,7 @@ from __future__ import annotations
 import argparse
 import json
 import os
+import sqlite3
 import sys
 import urllib.error
 import urllib.request
@@ -17,6 +18,7 @@ from dotenv import load_dotenv
 from supabase import Client, create_client
 
 
+DEFAULT_STORAGE_URL = "supabase"
 DEFAULT_DAYS = 3
 DEFAULT_MIN_EDGE_PCT = 10.0
 DEFAULT_LIMIT = 8
@@ -65,6 +67,11 @@ def parse_args() -> argparse.Namespace:
         action="store_true",
         help="Send result to Telegram (requires TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID).",
     )
+    parser.add_argument(
+        "--storage",
+        default=os.getenv("STORAGE_URL", DEFAULT_STORAGE_URL),
+        help="Where predictions are read from: supabase or sqlite:///<path> (worker's local database).",
+    )
     parser.add_argument(
         "--json",
         action="store_true",
@@ -73,14 +80,6 @@ def parse_args() -> argparse.Namespace:
     return parser.parse_args()
 
 
-def get_supabase() -> Client:
-    url = os.getenv("SUPABASE_URL")
-    key = os.getenv("SUPABASE_SERVICE_ROLE_KEY") or os.getenv("SUPABASE_KEY")
-    if not url or not key:
-        raise RuntimeError("Missing SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY/SUPABASE_KEY.")
-    return create_client(url, key)
-
-
 def implied_prob(decimal_odds: float | None) -> float | None:
     if decimal_odds is None or decimal_odds <= 1.0:
         return None
@@ -182,8 +181,10 @@ def compute_best_pick(parsed: dict[str, Any]) -> Pick | None:
     )
 
 
-def fetch_candidates(sb: Client, from_date: str, to_date: str, limit: int) -> list[dict[str, Any]]:
-    select_sql = """
+class SupabaseReader:
+    """Reads prediction candidates from Supabase (predictions joined with matches)."""
+
+    SELECT = """
         match_id,
         lambda_home,
         lambda_away,
@@ -202,30 +203,85 @@ def fetch_candidates(sb: Client, from_date: str, to_date: str, limit: int) -> li
         )
     """
 
-    try:
-        response = (
-            sb.table("predictions")
-            .select(select_sql)
-            .gte("matches.match_date", from_date)
-            .lte("matches.match_date", to_date)
-            .limit(max(limit, 50))
-            .execute()
-        )
-        return response.data or []
-    except Exception as exc:
-        print(
-            f"Warning: joined date filter failed ({exc}). Falling back to unfiltered fetch.",
-            file=sys.stderr,
-        )
-        response = sb.table("predictions").select(select_sql).limit(max(limit, 200)).execute()
-        rows = response.data or []
+    def __init__(self, sb: Client):
+        self.sb = sb
+
+    @classmethod
+    def from_env(cls) -> SupabaseReader:
+        url = os.getenv("SUPABASE_URL")
+        key = os.getenv("SUPABASE_SERVICE_ROLE_KEY") or os.getenv("SUPABASE_KEY")
+        if not url or not key:
+            raise RuntimeError("Missing SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY/SUPABASE_KEY.")
+        return cls(create_client(url, key))
+
+    def prediction_candidates(self, from_date: str, to_date: str, limit: int) -> list[dict[str, Any]]:
+        try:
+            response = (
+                self.sb.table("predictions")
+                .select(self.SELECT)
+                .gte("matches.match_date", from_date)
+                .lte("matches.match_date", to_date)
+                .limit(max(limit, 50))
+                .execute()
+            )
+            return response.data or []
+        except Exception as exc:
+            print(
+                f"Warning: joined date filter failed ({exc}). Falling back to unfiltered fetch.",
+                file=sys.stderr,
+            )
+            response = self.sb.table("predictions").select(self.SELECT).limit(max(limit, 200)).execute()
+            rows = response.data or []
+            return [
+                r
+                for r in rows
+                if from_date <= str((r.get("matches") or {}).get("match_date", "")) <= to_date
+            ]
+
+
+class SQLiteReader:
+    """Reads prediction candidates from the worker's local SQLite database (read-only)."""
+
+    MATCH_COLS = ("match_date", "home_team", "away_team", "status", "league")
+
+    def __init__(self, path: str):
+        if not os.path.exists(path):
+            raise RuntimeError(f"SQLite database not found: {path}")
+        self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        self.conn.row_factory = sqlite3.Row
+
+    def prediction_candidates(self, from_date: str, to_date: str, limit: int) -> list[dict[str, Any]]:
+        rows = self.conn.execute(
+            "select p.match_id, p.lambda_home, p.lambda_away, p.p_over_25, p.p_under_25, p.over_odds, p.under_odds, "
+            "       p.edge_over, p.edge_under, m.match_date, m.home_team, m.away_team, m.status, m.league "
+            "  from predictions p join matches m on m.id = p.match_id "
+            " where m.match_date >= ? and m.match_date <= ? limit ?",
+            (from_date, to_date, max(limit, 50)),
+        ).fetchall()
+        # isti shape kot Supabase join: stolpci tekme pod "matches"
         return [
-            r
+            {
+                **{k: r[k] for k in r.keys() if k not in self.MATCH_COLS},
+                "matches": {k: r[k] for k in self.MATCH_COLS},
+            }
             for r in rows
-            if from_date <= str((r.get("matches") or {}).get("match_date", "")) <= to_date
         ]
 
 
+def open_reader(url: str) -> SupabaseReader | SQLiteReader:
+    if url == "supabase":
+        return SupabaseReader.from_env()
+    if url.startswith("sqlite:///"):
+        return SQLiteReader(url[len("sqlite:///"):])
+    raise ValueError(f"unknown storage {url!r} (expected 'supabase' or 'sqlite:///<path>')")
+
+
+def fetch_candidates(
+    reader: SupabaseReader | SQLiteReader, from_date: str, to_date: str, limit: int
+) -> list[dict[str, Any]]:
+    return reader.prediction_candidates(from_date, to_date, limit)
+
+
 def build_picks(rows: list[dict[str, Any]], min_edge_pct: float, max_picks: int) -> list[Pick]:
     picks: list[Pick] = []
     for row in rows:
@@ -318,8 +374,8 @@ def main() -> int:
     from_date = today.isoformat()
     to_date = (today + timedelta(days=max(0, args.days))).isoformat()
 
-    sb = get_supabase()
-    rows = fetch_candidates(sb, from_date, to_date, args.limit)
+    reader = open_reader(args.storage)
+    rows = fetch_candidates(reader, from_date, to_date, args.limit)
     picks = build_picks(rows, min_edge_pct=args.min_edge, max_picks=args.limit)
 
     if args.json:
@@ -0,0 +1,326 @@
+"""Backtest the form model on finished matches, with parallel parameter sweeps.
+
+Every finished match is replayed with the form it would have had on its match
+date (MatchHistory windows end strictly before the date, standings are the
+latest snapshot before it), priced exactly like STEP 5 prices upcoming
+fixtures, and scored against the result and the last pre-match odds snapshot:
+
+  log-loss / Brier   P(Over 2.5) vs. the result, every replayed match
+  bets / hit rate    value signals (value % >= threshold) on matches with odds
+  ROI                profit per unit staked on those signals
+
+The data is pulled from storage (Supabase or a local SQLite file) once and kept
+in a local pickle, or read from a Parquet snapshot (snapshot.py), so sweeps run offline. Configurations are grouped by form window (form_n, long_n): each
+worker process builds the form inputs for a window once and then prices all
+weight / home advantage / boost combinations on it as numpy arrays.
+
+  python backtest.py --from 2023-08-01
+  python backtest.py --snapshot --league EPL
+  python backtest.py --grid form_n=3,4,5 --grid long_n=8,10 --grid form_weight=0.5:0.9:0.05 \\
+      --grid home_adv=1.0:1.2:0.05 --grid value_pct_threshold=5,10,15 --workers 8 --out sweep.csv
+"""
+
+import os
+import argparse
+import csv
+import itertools
+import math
+import pickle
+import time
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, fields, replace
+from datetime import date
+
+import numpy as np
+from dotenv import load_dotenv
+
+from history import MatchHistory
+from model import FormParams, form_inputs, lambdas
+from pricing import price_scorelines
+from snapshot import SNAPSHOT_DIR, Snapshot
+from storage import DEFAULT_URL as DEFAULT_STORAGE_URL, Storage, open_storage
+
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env"))
+
+DATASET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "backtest.pkl")
+CONFIGS_PER_TASK = 64
+MIN_BETS = 30   # manj stav = ROI je šum, pri rangiranju jih preskočimo
+
+
+# -------------------- Dataset --------------------
+def fetch_dataset(store: Storage) -> dict:
+    """Finished matches, per-match xG, standings snapshots and pre-match odds from
+    storage (or a Snapshot, which has the same read methods)."""
+    matches = store.finished_matches()
+    xg = {m["id"]: (m["home_xg"], m["away_xg"]) for m in matches
+          if m.get("home_xg") is not None and m.get("away_xg") is not None}
+
+    # zadnji snapshot, zajet najkasneje na dan tekme
+    odds = {}
+    for o in store.pre_match_odds_history():
+        if str(o["created_at"])[:10] <= str(o["match_date"])[:10]:
+            odds[o["match_id"]] = (o["over_odds"], o["under_odds"])
+
+    return {"fetched_at": time.time(), "matches": matches, "xg": xg, "standings": store.standings_history(), "odds": odds}
+
+
+def load_dataset(path: str, refresh: bool, storage_url: str, snapshot_dir: str = None) -> dict:
+    if snapshot_dir:
+        return fetch_dataset(Snapshot(snapshot_dir))
+    if not refresh and os.path.exists(path):
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    store = open_storage(storage_url)
+    print(f"Fetching backtest dataset from {store.name}...")
+    data = fetch_dataset(store)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "wb") as f:
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + ".tmp", path)
+    return data
+
+
+# -------------------- Replay --------------------
+@dataclass
+class Replay:
+    history: MatchHistory
+    home: list            # imena ekip po replayed tekmah
+    away: list
+    as_of: list           # date tekme
+    home_pos: np.ndarray  # lestvica pred tekmo (NaN = ni snapshota)
+    away_pos: np.ndarray
+    over: np.ndarray      # 1.0 = Over 2.5
+    over_odds: np.ndarray  # NaN = ni kvote
+    under_odds: np.ndarray
+
+
+def build_replay(data: dict, date_from: str = None, date_to: str = None, leagues=None) -> Replay:
+    history = MatchHistory()
+    for m in data["matches"]:
+        if m.get("home_goals") is None or m.get("away_goals") is None:
+            continue
+        history.add(m["id"], m["match_date"], m["home_team"], m["away_team"], m["home_goals"], m["away_goals"])
+    history.finalize()
+    for mid, (hx, ax) in data["xg"].items():
+        history.set_xg(mid, hx, ax)
+
+    # team -> (ordinali snapshotov, pozicije)
+    table = {}
+    for r in data["standings"]:
+        days, positions = table.setdefault(r["team_name"], ([], []))
+        days.append(date.fromisoformat(str(r["as_of_date"])[:10]).toordinal())
+        positions.append(r.get("position") or 0)
+
+    def position_before(team, day):
+        days, positions = table.get(team, ((), ()))
+        i = bisect_left(days, day)
+        return positions[i - 1] if i else math.nan
+
+    rows = []
+    for m in data["matches"]:
+        d = str(m["match_date"])[:10]
+        if m.get("home_goals") is None or m.get("away_goals") is None:
+            continue
+        if (date_from and d < date_from) or (date_to and d > date_to):
+            continue
+        if leagues and m.get("league") not in leagues:
+            continue
+        rows.append(m)
+
+    as_of = [date.fromisoformat(str(m["match_date"])[:10]) for m in rows]
+    odds = [data["odds"].get(m["id"], (None, None)) for m in rows]
+    return Replay(
+        history=history,
+        home=[m["home_team"] for m in rows],
+        away=[m["away_team"] for m in rows],
+        as_of=as_of,
+        home_pos=np.array([position_before(m["home_team"], d.toordinal()) for m, d in zip(rows, as_of)], dtype=float),
+        away_pos=np.array([position_before(m["away_team"], d.toordinal()) for m, d in zip(rows, as_of)], dtype=float),
+        over=np.array([m["home_goals"] + m["away_goals"] > 2.5 for m in rows], dtype=float),
+        over_odds=np.array([o[0] or np.nan for o in odds], dtype=float),
+        under_odds=np.array([o[1] or np.nan for o in odds], dtype=float),
+    )
+
+
+def window_inputs(replay: Replay, form_n: int, long_n: int):
+    """Form inputs of every replayed match for one (form_n, long_n) window, as arrays."""
+    params = FormParams(form_n=form_n, long_n=long_n)
+    home, away = [], []
+    for h, a, d in zip(replay.home, replay.away, replay.as_of):
+        home.append(form_inputs(replay.history, h, d, params)[0])
+        away.append(form_inputs(replay.history, a, d, params)[0])
+    return tuple(np.array(home, dtype=float).T), tuple(np.array(away, dtype=float).T)
+
+
+def score(replay: Replay, p_over, threshold: float) -> dict:
+    y = replay.over
+    p = np.clip(p_over, 1e-12, 1 - 1e-12)
+    out = {
+        "matches": len(y),
+        "log_loss": float(-np.mean(y * np.log(p) + (1 - y) * np.log(1 - p))) if len(y) else math.nan,
+        "brier": float(np.mean((p_over - y) ** 2)) if len(y) else math.nan,
+    }
+
+    # enako kot predict_match: value % = p / implied_prob - 1, stran z večjim value
+    with np.errstate(invalid="ignore"):
+        value_over = (p_over * replay.over_odds - 1.0) * 100.0
+        value_under = ((1.0 - p_over) * replay.under_odds - 1.0) * 100.0
+        vo = np.nan_to_num(value_over, nan=-999.0)
+        vu = np.nan_to_num(value_under, nan=-999.0)
+        bet = np.maximum(vo, vu) >= threshold
+        on_over = vo >= vu
+        won = np.where(on_over, y == 1.0, y == 0.0)
+        price = np.where(on_over, replay.over_odds, replay.under_odds)
+        profit = np.where(won, price - 1.0, -1.0)
+
+    bets = int(bet.sum())
+    out.update({
+        "with_odds": int((~np.isnan(replay.over_odds) & ~np.isnan(replay.under_odds)).sum()),
+        "bets": bets,
+        "hit_rate": float(won[bet].mean()) if bets else math.nan,
+        "profit": float(profit[bet].sum()) if bets else 0.0,
+        "roi": float(profit[bet].mean()) if bets else math.nan,
+    })
+    return out
+
+
+# -------------------- Sweep --------------------
+_replay = None
+_inputs = {}
+
+
+def _init_worker(replay: Replay):
+    global _replay
+    _replay = replay
+
+
+def evaluate(configs) -> list:
+    """Score a chunk of configurations that share one (form_n, long_n) window."""
+    results = []
+    # value_pct_threshold ne vpliva na lambde: en pricing za vse pragove
+    by_model = {}
+    for c in configs:
+        by_model.setdefault(replace(c, value_pct_threshold=0.0), []).append(c)
+
+    for model, group in by_model.items():
+        key = (model.form_n, model.long_n)
+        if not len(_replay.over):
+            p_over = np.zeros(0)
+        else:
+            if key not in _inputs:
+                _inputs[key] = window_inputs(_replay, *key)
+            home_inputs, away_inputs = _inputs[key]
+            lam_home, lam_away = lambdas(home_inputs, away_inputs, _replay.home_pos, _replay.away_pos, model)
+            p_over = price_scorelines(lam_home, lam_away)["over_2.5"]
+        for c in group:
+            results.append((c, score(_replay, p_over, c.value_pct_threshold)))
+    return results
+
+
+def parse_values(spec: str, kind):
+    """'3,4,5' or 'start:stop:step' (stop inclusive)."""
+    if ":" in spec:
+        start, stop, step = (float(x) for x in spec.split(":"))
+        n = int(round((stop - start) / step)) + 1
+        return [kind(round(start + i * step, 6)) for i in range(n)]
+    return [kind(x) for x in spec.split(",") if x.strip()]
+
+
+def build_grid(specs) -> list:
+    kinds = {f.name: type(f.default) for f in fields(FormParams)}
+    axes = {}
+    for spec in specs or []:
+        name, _, values = spec.partition("=")
+        name = name.strip()
+        if name not in kinds:
+            raise SystemExit(f"unknown parameter {name!r} (expected one of {', '.join(kinds)})")
+        axes[name] = parse_values(values, kinds[name])
+    names = list(axes)
+    return [FormParams(**dict(zip(names, combo))) for combo in itertools.product(*axes.values())] or [FormParams()]
+
+
+def chunks(configs: list, size: int):
+    """Chunks of at most `size` configs, each inside one form window (workers cache window inputs)."""
+    by_window = {}
+    for c in configs:
+        by_window.setdefault((c.form_n, c.long_n), []).append(c)
+    for group in by_window.values():
+        for i in range(0, len(group), size):
+            yield group[i:i + size]
+
+
+def run_sweep(replay: Replay, configs: list, workers: int) -> list:
+    tasks = list(chunks(configs, CONFIGS_PER_TASK))
+    if workers <= 1 or len(tasks) == 1:
+        _init_worker(replay)
+        return [r for t in tasks for r in evaluate(t)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(replay,)) as pool:
+        return [r for part in pool.map(evaluate, tasks) for r in part]
+
+
+# -------------------- Report --------------------
+def print_table(title: str, results: list):
+    print(f"\n{title}")
+    print(f"  {'params':<72} {'log-loss':>8} {'brier':>7} {'bets':>6} {'hit':>6} {'ROI':>7}")
+    for c, m in results:
+        label = " ".join(f"{k}={v}" for k, v in c.as_dict().items() if v != getattr(FormParams, k))
+        print(f"  {label or '(defaults)':<72} {m['log_loss']:8.4f} {m['brier']:7.4f} {m['bets']:6d} "
+              f"{m['hit_rate'] * 100 if m['bets'] else 0:5.1f}% {m['roi'] * 100 if m['bets'] else 0:+6.1f}%")
+
+
+def write_csv(path: str, results: list):
+    names = [f.name for f in fields(FormParams)]
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        metrics = list(results[0][1]) if results else []
+        w.writerow(names + metrics)
+        for c, m in results:
+            w.writerow([getattr(c, n) for n in names] + [m[k] for k in metrics])
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Backtest the form model on finished matches (parameter sweeps on a process pool).")
+    parser.add_argument("--from", dest="date_from", help="First match date to replay (YYYY-MM-DD).")
+    parser.add_argument("--to", dest="date_to", help="Last match date to replay (YYYY-MM-DD).")
+    parser.add_argument("--league", action="append", help="Only replay this league (repeatable).")
+    parser.add_argument("--grid", action="append", metavar="PARAM=VALUES",
+                        help="Sweep a FormParams field: comma list or start:stop:step (repeatable). Without --grid the current defaults are scored.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes.")
+    parser.add_argument("--dataset", default=DATASET_PATH, help="Local dataset pickle.")
+    parser.add_argument("--refresh", action="store_true", help="Re-fetch the dataset from storage.")
+    parser.add_argument("--storage", default=os.getenv("STORAGE_URL", DEFAULT_STORAGE_URL),
+                        help="Storage to fetch the dataset from: supabase or sqlite:///<path>.")
+    parser.add_argument("--snapshot", nargs="?", const=SNAPSHOT_DIR, metavar="DIR",
+                        help=f"Read the dataset from a Parquet snapshot instead (default dir {SNAPSHOT_DIR}).")
+    parser.add_argument("--top", type=int, default=15, help="Rows per ranking.")
+    parser.add_argument("--out", help="Write every configuration's metrics to this CSV.")
+    return parser.parse_args()
+
+
+def main(args: argparse.Namespace):
+    data = load_dataset(args.dataset, args.refresh, args.storage, args.snapshot)
+    replay = build_replay(data, args.date_from, args.date_to, set(args.league) if args.league else None)
+    configs = build_grid(args.grid)
+    print(f"Replaying {len(replay.over)} finished matches "
+          f"({int((~np.isnan(replay.over_odds)).sum())} with odds) x {len(configs)} configurations "
+          f"on {min(args.workers, len(configs))} worker(s)...")
+
+    t0 = time.perf_counter()
+    results = run_sweep(replay, configs, args.workers)
+    print(f"Done in {time.perf_counter() - t0:.1f}s")
+
+    print_table("Best log-loss (P(Over 2.5) calibration):", sorted(results, key=lambda r: r[1]["log_loss"])[:args.top])
+    ranked = [r for r in results if r[1]["bets"] >= MIN_BETS]
+    if ranked:
+        print_table(f"Best ROI (>= {MIN_BETS} bets):", sorted(ranked, key=lambda r: -r[1]["roi"])[:args.top])
+    else:
+        print(f"\nNo configuration with >= {MIN_BETS} value bets (missing odds for the replayed window?)")
+
+    if args.out:
+        write_csv(args.out, results)
+        print(f"\nWrote {len(results)} rows to {args.out}")
+
+
+if __name__ == "__main__":
+    main(parse_args())
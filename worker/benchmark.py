@@ -0,0 +1,410 @@
+"""Pipeline benchmark: synthetic leagues, recorded provider responses, local storage.
+
+Generates league seasons (--leagues x --teams, --matches per season), writes
+the provider responses the worker would get for them into a throw-away HTTP
+cache and runs the worker's stages against an in-memory SQLite Storage in
+replay mode - no network, no Supabase. The stages run one after another
+(the real run overlaps them in the task graph) so every call is attributed to
+exactly one stage:
+
+  understat     sync_state + league results + match upserts
+  fixtures      football-data fixtures / standings + fixture upserts
+  shots         shot import + xG aggregates
+  features      team_features
+  odds          The Odds API + snapshot dedup / linking
+  predictions   history, pricing, prediction run
+
+Two passes: "cold" (empty database) and "warm" (same responses again, i.e. a
+nightly run with nothing new). Per stage it records wall time (fastest of
+--repeat runs), storage calls and rows per method/table and provider requests
+per endpoint, and compares them with a stored baseline: more calls or rows
+than the baseline, or a stage slower than --time-tolerance x baseline, fails
+the run (exit code 1).
+
+  python benchmark.py                        # compare with benchmark_baseline.json
+  python benchmark.py --update-baseline      # record a new baseline
+  python benchmark.py --leagues 5 --teams 20 --matches 380 --no-timing
+
+Timings depend on the machine; record the baseline where the benchmark runs
+(or pass --no-timing to compare counts only). The scenario runs on a fixed
+date (--date, stored with the baseline): run.py's date.today() and
+datetime.now() are pinned to it, so the synthetic seasons, the played matches
+and the fixture / prediction windows - and with them the call counts - do not
+move with the calendar.
+"""
+
+import os
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import date, datetime, time as dtime, timedelta, timezone
+
+import aiohttp
+
+import run
+from http_cache import ResponseCache
+from storage.sqlite_backend import SQLiteStorage
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+STAGES = ("understat", "fixtures", "shots", "features", "odds", "predictions")
+PASSES = ("cold", "warm")
+TIME_SLACK = 0.05   # s; pod tem je razlika šum
+SCENARIO_DATE = "2026-10-18"
+SCENARIO_CLOCK = dtime(6, 0)   # UTC, pred prvim kickoffom dneva (15:00): nobena tekma še ni v teku
+
+
+# -------------------- Counting wrappers --------------------
+class CallLog:
+    """Calls / rows per stage and key ("db upsert matches", "http odds", ...)."""
+
+    def __init__(self):
+        self.stage = "setup"
+        self.calls = {}
+        self.rows = {}
+
+    def add(self, key: str, rows: int = 0):
+        self.calls.setdefault(self.stage, Counter())[key] += 1
+        self.rows.setdefault(self.stage, Counter())[key] += rows
+
+
+class CountingStorage:
+    """Storage proxy: forwards every call to `inner` and logs it. Each Storage
+    method is one request (or one paged read) against the hosted backend, so
+    call counts are the round trips the real run would make."""
+
+    def __init__(self, inner, log: CallLog):
+        self.inner = inner
+        self.log = log
+        self.name = f"{inner.name} (counting)"
+
+    def _call(self, method: str, *args, **kwargs):
+        out = getattr(self.inner, method)(*args, **kwargs)
+        self.log.add(f"db {method}", len(out) if isinstance(out, (list, dict)) else 0)
+        return out
+
+    def upsert(self, table, rows, on_conflict, ignore_duplicates=False):
+        self.log.add(f"db upsert {table}", len(rows))
+        return self.inner.upsert(table, rows, on_conflict, ignore_duplicates)
+
+    def insert(self, table, rows):
+        self.log.add(f"db insert {table}", len(rows))
+        return self.inner.insert(table, rows)
+
+    def __getattr__(self, method):
+        # ostale (bralne) metode Storage
+        return lambda *a, **kw: self._call(method, *a, **kw)
+
+
+class CountingCache(ResponseCache):
+    """Replay cache that logs one provider request per lookup."""
+
+    def __init__(self, root: str, log: CallLog):
+        super().__init__(root, "replay")
+        self.log = log
+
+    async def memo(self, namespace, key, fetch, limiter=None):
+        self.log.add(f"http {namespace}")
+        return await super().memo(namespace, key, fetch, limiter)
+
+    async def get_json(self, session, namespace, url, headers=None, key=None, limiter=None, cost=1):
+        self.log.add(f"http {namespace}")
+        return await super().get_json(session, namespace, url, headers=headers, key=key, limiter=limiter, cost=cost)
+
+
+# -------------------- Synthetic data --------------------
+def synthetic_leagues(n: int) -> dict:
+    return {
+        f"L{i}": {"understat": f"L{i}", "fd_code": f"F{i}", "odds_key": f"soccer_l{i}"}
+        for i in range(n)
+    }
+
+
+def season_schedule(rng: random.Random, league: str, season: int, teams: int, matches: int) -> list:
+    """(kickoff, home, away) - double round robin (circle method) from August, one round a week."""
+    names = [f"{league} Team {t:02d}" for t in range(teams)]
+    rng.shuffle(names)
+    ring = names + [None] * (len(names) % 2)
+    rounds = []
+    for _ in range(len(ring) - 1):
+        rounds.append([(ring[i], ring[-1 - i]) for i in range(len(ring) // 2) if ring[i] and ring[-1 - i]])
+        ring = [ring[0], ring[-1]] + ring[1:-1]
+    rounds += [[(a, h) for h, a in rnd] for rnd in rounds]
+
+    start = datetime(season, 8, 8, 15, 0)
+    out = []
+    for r in range(len(rounds) * (matches // max(1, sum(map(len, rounds))) + 1)):
+        for k, (home, away) in enumerate(rounds[r % len(rounds)]):
+            if len(out) == matches:
+                return out
+            out.append((start + timedelta(days=7 * r, hours=2 * (k % 3)), home, away))
+    return out
+
+
+def record_responses(cache: ResponseCache, leagues: dict, today: date, teams: int, matches: int, seed: int):
+    """Write every provider response the stages will ask for."""
+    rng = random.Random(seed)
+    next_id = 100000
+    for league, config in leagues.items():
+        upcoming = []
+        for season in (today.year - 1, today.year):
+            results = []
+            for kickoff, home, away in season_schedule(rng, league, season, teams, matches):
+                next_id += 1
+                played = kickoff.date() < today
+                hg, ag = (rng.randint(0, 4), rng.randint(0, 3)) if played else (None, None)
+                results.append({
+                    "id": str(next_id),
+                    "isResult": played,
+                    "h": {"title": home},
+                    "a": {"title": away},
+                    "goals": {"h": None if hg is None else str(hg), "a": None if ag is None else str(ag)},
+                    "datetime": kickoff.strftime("%Y-%m-%d %H:%M:%S"),
+                })
+                if played:
+                    cache.store("understat:shots", str(next_id), {
+                        side: [{"minute": str(rng.randint(1, 90)), "xG": str(round(rng.random() * 0.3, 4)),
+                                "result": "Goal" if j < goals else "MissedShots",
+                                "situation": "Penalty" if j == 0 and rng.random() < 0.1 else "OpenPlay"}
+                               for j in range(goals + rng.randint(6, 12))]
+                        for side, goals in (("h", hg), ("a", ag))
+                    })
+                elif kickoff.date() <= today + timedelta(days=30):
+                    upcoming.append((kickoff, home, away))
+            cache.store("understat:league", f"{config['understat']}/{season}", results)
+
+        date_from, date_to = today.isoformat(), (today + timedelta(days=30)).isoformat()
+        base = f"https://api.football-data.org/v4/competitions/{config['fd_code']}"
+        cache.store("football-data:matches", f"{base}/matches?dateFrom={date_from}&dateTo={date_to}", {"matches": [
+            {"utcDate": k.strftime("%Y-%m-%dT%H:%M:%SZ"), "homeTeam": {"name": h}, "awayTeam": {"name": a}}
+            for k, h, a in upcoming
+        ]})
+        names = sorted({t for _, h, a in upcoming for t in (h, a)})
+        cache.store("football-data:standings", f"{base}/standings", {"standings": [{"type": "TOTAL", "table": [
+            {"team": {"name": t}, "position": i + 1, "points": 40 - i, "playedGames": 10, "goalDifference": 10 - i}
+            for i, t in enumerate(names)
+        ]}]})
+
+        query = "regions=eu&markets=totals&oddsFormat=decimal"
+        cache.store("odds", f"{config['odds_key']}?{query}", [
+            {"home_team": h, "away_team": a, "commence_time": k.strftime("%Y-%m-%dT%H:%M:%SZ"), "bookmakers": [
+                {"key": f"bk{b}", "title": f"Book {b}", "markets": [{"key": "totals", "outcomes": [
+                    {"name": "Over", "point": 2.5, "price": round(1.7 + rng.random() * 0.5, 2)},
+                    {"name": "Under", "point": 2.5, "price": round(1.7 + rng.random() * 0.5, 2)},
+                ]}]}
+                for b in range(4)
+            ]}
+            for k, h, a in upcoming if k.date() <= today + timedelta(days=14)
+        ])
+
+
+@contextlib.contextmanager
+def pinned_clock(day: date):
+    """Run the worker as if it were `day` at SCENARIO_CLOCK UTC (the clock still ticks)."""
+    anchor = datetime.combine(day, SCENARIO_CLOCK)
+    started = time.monotonic()
+
+    class PinnedDate(date):
+        @classmethod
+        def today(cls):
+            return day
+
+    class PinnedDateTime(datetime):
+        @classmethod
+        def utcnow(cls):
+            return anchor + timedelta(seconds=time.monotonic() - started)
+
+        @classmethod
+        def now(cls, tz=None):
+            now = cls.utcnow()
+            return now.replace(tzinfo=timezone.utc).astimezone(tz) if tz else now
+
+    saved = run.date, run.datetime
+    run.date, run.datetime = PinnedDate, PinnedDateTime
+    try:
+        yield
+    finally:
+        run.date, run.datetime = saved
+
+
+# -------------------- Stages --------------------
+async def run_stages(log: CallLog, session, today: date, model: str) -> dict:
+    """One worker run, stage by stage -> stage -> seconds."""
+    seconds = {}
+
+    @contextlib.asynccontextmanager
+    async def stage(name):
+        log.stage = name
+        t0 = time.perf_counter()
+        yield
+        seconds[name] = time.perf_counter() - t0
+
+    log.stage = "setup"
+    run.aliases.load()
+
+    async with stage("understat"):
+        state = run.load_sync_state("understat")
+        await asyncio.gather(*(run.sync_understat_league(name, config, season, session, state, today)
+                               for name, config in run.LEAGUES_MAP.items() for season in (today.year - 1, today.year)))
+        run.flush_stage("STEP 1 understat")
+
+    async with stage("fixtures"):
+        fixtures = dict(zip(run.LEAGUES_MAP, await asyncio.gather(
+            *(run.fetch_fd_league(name, config, session, today) for name, config in run.LEAGUES_MAP.items()))))
+        run.write_fixtures(fixtures, today)
+        run.flush_stage("STEP 2 fixtures/standings")
+
+    async with stage("shots"):
+        await run.import_recent_shots(session)
+
+    async with stage("features"):
+        run.update_team_features(today)
+
+    async with stage("odds"):
+        odds = dict(zip(run.LEAGUES_MAP, await asyncio.gather(
+            *(run.fetch_odds_league(name, config, session) for name, config in run.LEAGUES_MAP.items()))))
+        run.store_odds(odds)
+
+    async with stage("predictions"):
+        run.run_predictions(today, model)
+    return seconds
+
+
+async def benchmark(args) -> dict:
+    today = date.fromisoformat(args.date)
+    leagues = synthetic_leagues(args.leagues)
+    cache_dir = tempfile.mkdtemp(prefix="ddtips-bench-")
+    try:
+        record_responses(ResponseCache(cache_dir, "record"), leagues, today, args.teams, args.matches, args.seed)
+
+        log = CallLog()
+        run.LEAGUES_MAP = leagues
+        run.db = CountingStorage(SQLiteStorage(":memory:"), log)
+        run.http_cache = CountingCache(cache_dir, log)
+        run.SHOTS_IMPORT_LIMIT = args.leagues * args.matches * 2
+
+        result = {}
+        async with aiohttp.ClientSession() as session:
+            for name in PASSES:
+                # vsak pass je nov proces workerja: prazni registri, isto stanje baze
+                run.aliases = run.AliasRegistry()
+                run.dirty_features = run.features.DirtyTeams()
+                log.calls, log.rows = {}, {}
+                out = io.StringIO()
+                with contextlib.redirect_stdout(sys.stdout if args.verbose else out), pinned_clock(today):
+                    seconds = await run_stages(log, session, today, args.model)
+                result[name] = {
+                    s: {
+                        "seconds": round(seconds[s], 4),
+                        "db_calls": sum(n for k, n in log.calls.get(s, {}).items() if k.startswith("db ")),
+                        "db_rows": sum(n for k, n in log.rows.get(s, {}).items() if k.startswith("db ")),
+                        "http_calls": sum(n for k, n in log.calls.get(s, {}).items() if k.startswith("http ")),
+                        "calls": dict(sorted(log.calls.get(s, {}).items())),
+                    }
+                    for s in STAGES
+                }
+        return result
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+# -------------------- Baseline --------------------
+def scenario(args) -> dict:
+    return {"leagues": args.leagues, "teams": args.teams, "matches": args.matches, "seed": args.seed, "model": args.model,
+            "date": args.date}
+
+
+def compare(result: dict, baseline: dict, time_tolerance: float, timing: bool) -> list:
+    """Regressions against the baseline as printable lines (empty = pass)."""
+    problems = []
+    for p in PASSES:
+        for s in STAGES:
+            now, base = result[p][s], baseline["passes"][p][s]
+            for metric in ("db_calls", "db_rows", "http_calls"):
+                if now[metric] > base[metric]:
+                    grown = {k: f"{base['calls'].get(k, 0)} -> {n}" for k, n in now["calls"].items()
+                             if n > base["calls"].get(k, 0)}
+                    problems.append(f"{p}/{s}: {metric} {base[metric]} -> {now[metric]}  {grown}")
+            limit = base["seconds"] * time_tolerance + TIME_SLACK
+            if timing and now["seconds"] > limit:
+                problems.append(f"{p}/{s}: {now['seconds']:.3f}s > {limit:.3f}s "
+                                f"(baseline {base['seconds']:.3f}s x {time_tolerance})")
+    return problems
+
+
+def print_result(result: dict, baseline: dict = None):
+    print(f"  {'pass/stage':<20} {'seconds':>9} {'db calls':>9} {'db rows':>9} {'http':>6}")
+    for p in PASSES:
+        for s in STAGES:
+            r = result[p][s]
+            b = (baseline or {}).get("passes", {}).get(p, {}).get(s)
+            ref = f"   (baseline {b['seconds']:.3f}s {b['db_calls']} {b['db_rows']} {b['http_calls']})" if b else ""
+            print(f"  {p + '/' + s:<20} {r['seconds']:9.3f} {r['db_calls']:9d} {r['db_rows']:9d} {r['http_calls']:6d}{ref}")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the worker stages on synthetic data (replayed providers, in-memory storage).")
+    parser.add_argument("--leagues", type=int, default=3, help="Synthetic leagues.")
+    parser.add_argument("--teams", type=int, default=20, help="Teams per league.")
+    parser.add_argument("--matches", type=int, default=380, help="Matches per league season (two seasons).")
+    parser.add_argument("--seed", type=int, default=7, help="Random seed for the synthetic data.")
+    parser.add_argument("--model", choices=run.PREDICTION_MODELS, default="form", help="Prediction model.")
+    parser.add_argument("--date", default=SCENARIO_DATE, help="Date the scenario runs on (YYYY-MM-DD).")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline JSON.")
+    parser.add_argument("--update-baseline", action="store_true", help="Write this run as the new baseline.")
+    parser.add_argument("--time-tolerance", type=float, default=1.5, help="Fail when a stage is slower than this x baseline.")
+    parser.add_argument("--no-timing", action="store_true", help="Compare call/row counts only.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of the whole scenario; each stage keeps its fastest time.")
+    parser.add_argument("--verbose", action="store_true", help="Show the worker's own output.")
+    return parser.parse_args()
+
+
+def main(args: argparse.Namespace) -> int:
+    print(f"Benchmark: {args.leagues} leagues x {args.teams} teams, {args.matches} matches/season, model {args.model}, date {args.date}")
+    result = asyncio.run(benchmark(args))
+    for _ in range(args.repeat - 1):
+        again = asyncio.run(benchmark(args))
+        for p in PASSES:
+            for s in STAGES:
+                if again[p][s]["calls"] != result[p][s]["calls"]:
+                    print(f"WARNING: {p}/{s} call counts differ between repeats")
+                result[p][s]["seconds"] = min(result[p][s]["seconds"], again[p][s]["seconds"])
+
+    if args.update_baseline:
+        print_result(result)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"scenario": scenario(args), "passes": result}, f, indent=1, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print_result(result)
+        print(f"No baseline at {args.baseline} (run with --update-baseline)")
+        return 1
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print_result(result, baseline)
+    if baseline.get("scenario") != scenario(args):
+        print(f"Baseline was recorded for {baseline.get('scenario')}; re-run with those options or --update-baseline")
+        return 1
+
+    problems = compare(result, baseline, args.time_tolerance, not args.no_timing)
+    if problems:
+        print(f"\nREGRESSION ({len(problems)}):")
+        for line in problems:
+            print(f"  {line}")
+        return 1
+    print("\nOK: no stage above baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
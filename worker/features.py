@@ -0,0 +1,103 @@
+"""Per-team rolling form features (table team_features).
+
+One row per team and match date, computed after that match: last-3 and last-10
+per-game goals / xG (the same numbers MatchHistory.form gives) plus
+exponentially weighted averages over all of the team's matches. A team's form
+before date D is its latest row with as_of_date < D - one indexed lookup for
+the web app or other readers (STEP 5 still computes form from MatchHistory).
+
+Rows are derived from MatchHistory. An incremental update recomputes a team
+from its earliest new or changed match onward, seeding the weighted averages
+from the stored row before it; a rebuild recomputes every team from its first
+match.
+"""
+
+import math
+import threading
+from bisect import bisect_left
+from datetime import date, timedelta
+
+from history import MatchHistory
+
+WINDOWS = (3, 10)
+EWM_ALPHA = 0.3   # teža zadnje tekme v eksponentnem povprečju
+EWM_KEYS = ("gf", "ga", "xgf", "xga")
+
+
+class DirtyTeams:
+    """Teams whose features need recomputing, with the earliest affected match date."""
+
+    def __init__(self):
+        self._since = {}
+        self._lock = threading.Lock()  # mark() kličejo tudi DB threadi
+
+    def mark(self, team: str, match_date):
+        if not team or not match_date:
+            return
+        d = str(match_date)[:10]
+        with self._lock:
+            if team not in self._since or d < self._since[team]:
+                self._since[team] = d
+
+    def drain(self) -> dict:
+        """team -> earliest date (ISO), and reset."""
+        with self._lock:
+            since, self._since = self._since, {}
+        return since
+
+    def __len__(self):
+        return len(self._since)
+
+
+def _start(history: MatchHistory, team: str, since: str = None) -> int:
+    if not since:
+        return 0
+    rows = history.team_rows(team)
+    days = [history.day[r] for r in rows]
+    return bisect_left(days, date.fromisoformat(since).toordinal())
+
+
+def team_feature_rows(history: MatchHistory, team: str, since: str = None, seed: dict = None,
+                      alpha: float = EWM_ALPHA) -> list:
+    """Feature rows for the team's matches on or after `since` (all of them when None).
+
+    `seed` is the stored row just before `since`; without it the weighted
+    averages restart from the team's first match, so pass since=None then.
+    """
+    rows = history.team_rows(team)
+    start = _start(history, team, since)
+    ewm = {k: (seed or {}).get(f"ewm_{k}_pm") for k in EWM_KEYS} if start else dict.fromkeys(EWM_KEYS)
+    tid = history.team_index(team)
+
+    out = []
+    for k in range(start, len(rows)):
+        r = rows[k]
+        if history.home_id[r] == tid:
+            vals = {"gf": history.home_goals[r], "ga": history.away_goals[r], "xgf": history.home_xg[r], "xga": history.away_xg[r]}
+        else:
+            vals = {"gf": history.away_goals[r], "ga": history.home_goals[r], "xgf": history.away_xg[r], "xga": history.home_xg[r]}
+        for key, x in vals.items():
+            if isinstance(x, float) and math.isnan(x):
+                continue   # tekma brez shotov ne premakne xG povprečja
+            ewm[key] = float(x) if ewm[key] is None else alpha * x + (1 - alpha) * ewm[key]
+
+        d = date.fromordinal(history.day[r])
+        row = {
+            "team_name": team,
+            "as_of_date": d.isoformat(),
+            "match_id": history.match_id[r],
+            "games": k + 1,
+        }
+        for n in WINDOWS:
+            f = history.form(team, d + timedelta(days=1), n)
+            row.update({
+                f"last{n}_games": f["games"],
+                f"last{n}_gf_pm": f["gf_pm"],
+                f"last{n}_ga_pm": f["ga_pm"],
+                f"last{n}_xgf_pm": f["xgf_pm"],
+                f"last{n}_xga_pm": f["xga_pm"],
+                f"last{n}_xg_coverage": f["xg_coverage"],
+            })
+        row.update({f"ewm_{key}_pm": ewm[key] for key in EWM_KEYS})
+        out.append(row)
+    return out
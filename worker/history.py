@@ -0,0 +1,157 @@
+"""Columnar in-memory store of finished matches, indexed per team.
+
+STEP 5 loads finished matches (and per-match xG) once, then every form window
+is a slice of the per-team index instead of a Supabase query.
+"""
+
+import math
+from array import array
+from bisect import bisect_left
+from datetime import date
+
+
+class MatchHistory:
+    def __init__(self):
+        # en vnos na tekmo, stolpci so kompaktni array-i
+        self.match_id = array("q")
+        self.day = array("l")          # date.toordinal()
+        self.home_id = array("l")
+        self.away_id = array("l")
+        self.home_goals = array("l")
+        self.away_goals = array("l")
+        self.home_xg = array("d")      # NaN = ni shotov za tekmo
+        self.away_xg = array("d")
+        self.league_id = array("l")     # -1 = liga ni znana
+
+        self.league_names = []
+        self._league_ids = {}
+
+        self.team_names = []
+        self._team_ids = {}
+        self._row_of_match = {}
+        # team_id -> (row indices, days), urejeno po datumu
+        self._team_rows = {}
+        self._team_days = {}
+
+    def __len__(self):
+        return len(self.match_id)
+
+    def _team_id(self, name: str) -> int:
+        tid = self._team_ids.get(name)
+        if tid is None:
+            tid = len(self.team_names)
+            self._team_ids[name] = tid
+            self.team_names.append(name)
+            self._team_rows[tid] = array("l")
+            self._team_days[tid] = array("l")
+        return tid
+
+    def _league_id(self, name: str) -> int:
+        if not name:
+            return -1
+        lid = self._league_ids.get(name)
+        if lid is None:
+            lid = len(self.league_names)
+            self._league_ids[name] = lid
+            self.league_names.append(name)
+        return lid
+
+    def add(self, match_id: int, match_date: str, home: str, away: str, home_goals: int, away_goals: int,
+            league: str = None):
+        """Append one finished match. Call finalize() after the last add()."""
+        row = len(self.match_id)
+        d = date.fromisoformat(str(match_date)[:10]).toordinal()
+        hid = self._team_id(home)
+        aid = self._team_id(away)
+
+        self.match_id.append(int(match_id))
+        self.day.append(d)
+        self.home_id.append(hid)
+        self.away_id.append(aid)
+        self.home_goals.append(int(home_goals))
+        self.away_goals.append(int(away_goals))
+        self.home_xg.append(math.nan)
+        self.away_xg.append(math.nan)
+        self.league_id.append(self._league_id(league))
+        self._row_of_match[int(match_id)] = row
+
+        for tid in (hid, aid):
+            self._team_rows[tid].append(row)
+            self._team_days[tid].append(d)
+
+    def finalize(self):
+        """Sort every team's index by date (rows may arrive in any order)."""
+        for tid, rows in self._team_rows.items():
+            days = self._team_days[tid]
+            if all(days[i] <= days[i + 1] for i in range(len(days) - 1)):
+                continue
+            order = sorted(range(len(rows)), key=lambda i: days[i])
+            self._team_rows[tid] = array("l", (rows[i] for i in order))
+            self._team_days[tid] = array("l", (days[i] for i in order))
+
+    def set_xg(self, match_id: int, home_xg: float, away_xg: float):
+        row = self._row_of_match.get(int(match_id))
+        if row is None:
+            return
+        self.home_xg[row] = home_xg
+        self.away_xg[row] = away_xg
+
+    def team_index(self, team: str):
+        """Id used in home_id / away_id, or None for an unknown team."""
+        return self._team_ids.get(team)
+
+    def team_rows(self, team: str):
+        """Row indices of all the team's matches (oldest first)."""
+        tid = self._team_ids.get(team)
+        return self._team_rows[tid] if tid is not None else array("l")
+
+    def window(self, team: str, as_of: date, n: int):
+        """Row indices of the team's last n matches strictly before as_of (oldest first)."""
+        tid = self._team_ids.get(team)
+        if tid is None or n <= 0:
+            return array("l")
+        days = self._team_days[tid]
+        hi = bisect_left(days, as_of.toordinal())
+        return self._team_rows[tid][max(0, hi - n):hi]
+
+    def recent_match_ids(self, teams, as_of: date, n: int) -> set:
+        ids = set()
+        for t in teams:
+            for row in self.window(t, as_of, n):
+                ids.add(self.match_id[row])
+        return ids
+
+    def form(self, team: str, as_of: date, n: int):
+        """Per-game goals/xG averages over the window; same shape as the old compute_form."""
+        rows = self.window(team, as_of, n)
+        if not rows:
+            return None
+
+        tid = self._team_ids[team]
+        total_gf = total_ga = 0
+        total_xgf = total_xga = 0.0
+        have_xg = 0
+
+        for row in rows:
+            if self.home_id[row] == tid:
+                gf, ga = self.home_goals[row], self.away_goals[row]
+                xgf, xga = self.home_xg[row], self.away_xg[row]
+            else:
+                gf, ga = self.away_goals[row], self.home_goals[row]
+                xgf, xga = self.away_xg[row], self.home_xg[row]
+            total_gf += gf
+            total_ga += ga
+            if not math.isnan(xgf):
+                total_xgf += xgf
+                total_xga += xga
+                have_xg += 1
+
+        games = len(rows)
+        return {
+            "games": games,
+            "gf_pm": total_gf / games,
+            "ga_pm": total_ga / games,
+            "xgf_pm": (total_xgf / have_xg) if have_xg else None,
+            "xga_pm": (total_xga / have_xg) if have_xg else None,
+            "xg_coverage": have_xg / games
+        }
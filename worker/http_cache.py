@@ -0,0 +1,175 @@
+"""On-disk response cache for provider HTTP calls (Understat, football-data, The Odds API).
+
+Modes:
+  off     - no caching, every call goes to the network
+  cache   - serve entries younger than their TTL, otherwise fetch (conditional
+            request with ETag / Last-Modified when we have them) and store
+  record  - always fetch and store, ignore TTLs
+  replay  - never touch the network; serve whatever was recorded, a miss raises
+            CacheMiss. Gives fast, deterministic offline runs.
+
+A record run also stores when it ran (recorded_at.json); a replay runs as of
+that time, so the date-dependent requests (season, fixture window) and the
+in-play split of odds events come out as they were recorded.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+MODES = ("off", "cache", "record", "replay")
+RECORDED_AT = "recorded_at.json"
+
+
+class CacheMiss(RuntimeError):
+    pass
+
+
+class ResponseCache:
+    def __init__(self, root: str, mode: str = "cache", ttls: dict = None, metrics=None):
+        if mode not in MODES:
+            raise ValueError(f"unknown HTTP cache mode {mode!r} (expected one of {', '.join(MODES)})")
+        self.root = root
+        self.mode = mode
+        self.ttls = ttls or {}
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.metrics = metrics   # metrics.RunMetrics: requesti / bajti na providerja
+
+    def _path(self, namespace: str, key: str) -> str:
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.root, namespace.replace(":", "_"), digest + ".json")
+
+    def save_recorded_at(self, iso: str):
+        """record: remember the run's start time (ISO, UTC) for later replays."""
+        if self.mode != "record":
+            return
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, RECORDED_AT), "w", encoding="utf-8") as f:
+            json.dump({"recorded_at": iso}, f)
+
+    def recorded_at(self):
+        """ISO start time of the recording run, None when unknown (older recordings)."""
+        try:
+            with open(os.path.join(self.root, RECORDED_AT), encoding="utf-8") as f:
+                return json.load(f).get("recorded_at")
+        except (OSError, ValueError):
+            return None
+
+    def load(self, namespace: str, key: str):
+        if self.mode == "off":
+            return None
+        try:
+            with open(self._path(namespace, key), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def store(self, namespace: str, key: str, body, etag: str = None, last_modified: str = None):
+        if self.mode in ("off", "replay"):
+            return
+        path = self._path(namespace, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {"key": key, "fetched_at": time.time(), "etag": etag, "last_modified": last_modified, "body": body}
+        # atomičen zapis, da sočasni taski ne berejo pol datoteke
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def touch(self, namespace: str, key: str, entry: dict):
+        """304 Not Modified: keep the body, restart the TTL."""
+        self.store(namespace, key, entry["body"], entry.get("etag"), entry.get("last_modified"))
+
+    def fresh(self, namespace: str, entry) -> bool:
+        if not entry:
+            return False
+        if self.mode == "replay":
+            return True
+        if self.mode != "cache":
+            return False
+        return time.time() - entry.get("fetched_at", 0) < self.ttls.get(namespace, 0)
+
+    def cached(self, namespace: str, key: str):
+        """(entry, usable) - usable entries can be returned without any network call."""
+        entry = self.load(namespace, key)
+        if self.fresh(namespace, entry):
+            self.hits += 1
+            if self.metrics:
+                self.metrics.http(namespace, 200, cached=True)
+            return entry, True
+        if self.mode == "replay":
+            raise CacheMiss(f"no recorded response for {namespace} {key}")
+        self.misses += 1
+        return entry, False
+
+    async def memo(self, namespace: str, key: str, fetch, limiter=None):
+        """Cache the JSON-serializable result of `fetch()` (for library calls such as Understat)."""
+        entry, usable = self.cached(namespace, key)
+        if usable:
+            return entry["body"]
+        if limiter:
+            await limiter.acquire()
+        try:
+            body = await fetch()
+        except BaseException:
+            if limiter:
+                limiter.release()
+            raise
+        if self.metrics:
+            # knjižnica ne da surovega odgovora: velikost dekodiranega JSON-a
+            self.metrics.http(namespace, 200, len(json.dumps(body)))
+        self.store(namespace, key, body)
+        return body
+
+    async def get_json(self, session, namespace: str, url: str, headers: dict = None, key: str = None, limiter=None,
+                       cost: int = 1):
+        """GET url as JSON through the cache -> (status, json body or error text).
+
+        `key` overrides the cache key (e.g. the URL without the API key).
+        `limiter` (ratelimit.ProviderLimiter) paces network requests and reads
+        the response's quota headers (a request that raises before its response
+        releases its reservation); cache hits do not touch it. `cost` is the
+        request's quota cost (The Odds API: 0 for /events).
+        Only 200 responses are stored.
+        """
+        key = key or url
+        entry, usable = self.cached(namespace, key)
+        if usable:
+            return 200, entry["body"]
+
+        hdrs = dict(headers or {})
+        if entry and entry.get("etag"):
+            hdrs["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            hdrs["If-Modified-Since"] = entry["last_modified"]
+
+        if limiter:
+            await limiter.acquire(cost)
+        observed = False
+        try:
+            async with session.get(url, headers=hdrs) as r:
+                if limiter:
+                    limiter.observe(r.status, r.headers, cost)
+                observed = True
+                if self.metrics:
+                    self.metrics.http(namespace, r.status, len(await r.read()))
+                if r.status == 304 and entry:
+                    self.revalidated += 1
+                    self.touch(namespace, key, entry)
+                    return 200, entry["body"]
+                if r.status != 200:
+                    return r.status, await r.text()
+                body = await r.json()
+                self.store(namespace, key, body, r.headers.get("ETag"), r.headers.get("Last-Modified"))
+                return 200, body
+        except BaseException:
+            if limiter and not observed:
+                limiter.release(cost)   # brez odgovora (timeout, prekinjena povezava): kvota ni porabljena
+            raise
+
+    def stats(self) -> str:
+        return f"HTTP cache ({self.mode}): {self.hits} hits, {self.misses} misses, {self.revalidated} revalidated (304)"
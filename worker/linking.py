@@ -0,0 +1,83 @@
+"""In-memory fixture index for linking odds events to matches.id.
+
+Loaded once per odds stage. Lookups try, in order: exact names, normalized
+names, then a memoized fuzzy match, each on the kickoff date and the days
+either side (an evening kickoff in one feed can be after UTC midnight in
+another).
+"""
+
+from datetime import date, timedelta
+from difflib import SequenceMatcher
+
+
+def norm_team(s: str) -> str:
+    s = (s or "").lower().strip()
+    # remove common suffixes
+    for suf in [" fc", " afc", " f.c.", " c.f.", " cf", " as", " ssc"]:
+        if s.endswith(suf):
+            s = s[: -len(suf)].strip()
+    s = s.replace("&", "and")
+    s = s.replace("utd", "united")
+    s = " ".join(s.split())
+    return s
+
+
+def name_similarity(a: str, b: str) -> float:
+    if a == b:
+        return 1.0
+    # "wolves" / "wolverhampton wanderers", "inter" / "inter milan"
+    if a and b and (a.startswith(b) or b.startswith(a)):
+        return 0.9
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def _shift(match_date: str, days: int) -> str:
+    return (date.fromisoformat(match_date) + timedelta(days=days)).isoformat()
+
+
+class FixtureIndex:
+    def __init__(self, rows, fuzzy_cutoff: float = 0.8):
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self._exact = {}
+        self._norm = {}
+        self._by_date = {}
+        self._memo = {}
+        for r in rows:
+            d = str(r["match_date"])[:10]
+            nh, na = norm_team(r["home_team"]), norm_team(r["away_team"])
+            self._exact.setdefault((d, r["home_team"], r["away_team"]), r["id"])
+            self._norm.setdefault((d, nh, na), r["id"])
+            self._by_date.setdefault(d, []).append((nh, na, r["id"]))
+
+    def __len__(self):
+        return len(self._exact)
+
+    def find(self, match_date: str, home: str, away: str):
+        """matches.id for the event, or None."""
+        if not match_date or not home or not away:
+            return None
+        nh, na = norm_team(home), norm_team(away)
+        key = (match_date, nh, na)
+        if key in self._memo:
+            return self._memo[key]
+
+        dates = (match_date, _shift(match_date, -1), _shift(match_date, 1))
+        found = None
+        for d in dates:
+            found = self._exact.get((d, home, away)) or self._norm.get((d, nh, na))
+            if found:
+                break
+        if not found:
+            found = self._fuzzy(dates, nh, na)
+        self._memo[key] = found
+        return found
+
+    def _fuzzy(self, dates, nh: str, na: str):
+        best, best_score = None, self.fuzzy_cutoff
+        for d in dates:
+            for ch, ca, mid in self._by_date.get(d, []):
+                # obe ekipi morata biti podobni
+                score = min(name_similarity(nh, ch), name_similarity(na, ca))
+                if score > best_score or (score == best_score and best is None):
+                    best, best_score = mid, score
+        return best
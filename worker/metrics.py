@@ -0,0 +1,350 @@
+"""Run instrumentation: per pipeline task (stage / league) wall time, provider
+HTTP requests and bytes, storage reads / writes per table, retries and peak
+memory, written at the end of the run as a JSON report and optionally as a
+Prometheus textfile (node_exporter textfile collector).
+
+Attribution follows the task: TaskGraph sets current_task for each task, and
+offload() / the write-behind thread run their calls in a copy of the caller's
+context, so a storage call made from a DB thread still counts for the task
+that queued it. Anything outside the graph counts as "main".
+
+Profiling (--profile TASK): cProfile of one task - its coroutine on the event
+loop thread (which also sees whatever else the loop runs meanwhile) plus every
+call it offloads to a DB thread - merged into one .prof file.
+"""
+
+import contextvars
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:   # Windows
+    resource = None
+
+current_task = contextvars.ContextVar("current_task", default="main")
+
+# Storage metoda -> (tabela, read|write); upsert / insert / export_rows nosijo tabelo v argumentu
+STORAGE_CALLS = {
+    "team_aliases": ("team_aliases", "read"),
+    "sync_state": ("sync_state", "read"),
+    "understat_fingerprints": ("matches", "read"),
+    "matches_between": ("matches", "read"),
+    "latest_finished_matches": ("matches", "read"),
+    "finished_matches": ("matches", "read"),
+    "shot_candidates": ("matches", "read"),
+    "finished_understat_match_ids": ("matches", "read"),
+    "refresh_match_xg": ("matches", "write"),
+    "team_feature_rows": ("team_features", "read"),
+    "clear_team_features": ("team_features", "write"),
+    "latest_standings": ("standings", "read"),
+    "standings_history": ("standings", "read"),
+    "odds_snapshots_between": ("odds_snapshots", "read"),
+    "touch_odds_snapshots": ("odds_snapshots", "write"),
+    "latest_odds": ("odds_snapshots", "read"),
+    "pre_match_odds_history": ("odds_snapshots", "read"),
+    "latest_model_fits": ("model_fits", "read"),
+    "create_prediction_run": ("prediction_runs", "write"),
+    "set_prediction_run_status": ("prediction_runs", "write"),
+    "publish_prediction_run": ("predictions", "write"),
+    "prediction_fingerprints": ("predictions", "read"),
+}
+
+
+def peak_rss_bytes(children: bool = False) -> int:
+    """Process high-water mark RSS (ru_maxrss; KiB on Linux, bytes on macOS)."""
+    if resource is None:
+        return 0
+    rss = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def _new_task() -> dict:
+    return {"http": {}, "db": {}, "retries": {}}
+
+
+class RunMetrics:
+    def __init__(self, leagues=()):
+        self.leagues = set(leagues)
+        self.started_at = datetime.now(timezone.utc)
+        self.tasks = {}
+        self._lock = threading.Lock()   # štejejo event loop, DB threadi in writer
+        self.profile_target = None
+        self.profile_dir = None
+        self._profiles = []
+        self._loop_profile = None
+
+    def reset(self):
+        """Start a new report window (daemon: one per cycle)."""
+        with self._lock:
+            self.started_at = datetime.now(timezone.utc)
+            self.tasks = {}
+
+    def _task(self) -> dict:
+        name = current_task.get()
+        task = self.tasks.get(name)
+        if task is None:
+            task = self.tasks[name] = _new_task()
+        return task
+
+    # -------------------- recording --------------------
+    def http(self, namespace: str, status: int, nbytes: int = 0, cached: bool = False):
+        provider = namespace.split(":")[0]
+        with self._lock:
+            p = self._task()["http"].setdefault(provider, {"requests": 0, "bytes": 0, "cached": 0, "errors": 0})
+            if cached:
+                p["cached"] += 1
+                return
+            p["requests"] += 1
+            p["bytes"] += nbytes
+            if status and status >= 400:
+                p["errors"] += 1
+
+    def db(self, table: str, op: str, rows: int = 0):
+        with self._lock:
+            t = self._task()["db"].setdefault(table, {"reads": 0, "rows_read": 0, "writes": 0, "rows_written": 0})
+            if op == "read":
+                t["reads"] += 1
+                t["rows_read"] += rows
+            else:
+                t["writes"] += 1
+                t["rows_written"] += rows
+
+    def retry(self, name: str):
+        with self._lock:
+            r = self._task()["retries"]
+            r[name] = r.get(name, 0) + 1
+
+    # -------------------- TaskGraph hooks --------------------
+    def task_started(self, name: str):
+        """Called inside the task's own asyncio context."""
+        current_task.set(name)
+        if self.profiling(name):
+            prof = cProfile.Profile()
+            try:
+                prof.enable()
+                self._loop_profile = prof
+            except ValueError:
+                pass   # 3.12+: en profiler na proces (sys.monitoring)
+
+    def task_finished(self, name: str, timing: dict):
+        if self._loop_profile is not None and self.profiling(name):
+            self._loop_profile.disable()
+            self._profiles.append(self._loop_profile)
+            self._loop_profile = None
+        with self._lock:
+            task = self.tasks.setdefault(name, _new_task())
+            task.update(timing)
+            # high-water mark ob koncu taska: kjer skoči, tam je vrh
+            task["peak_rss_mb"] = round(peak_rss_bytes() / 2 ** 20, 1)
+
+    # -------------------- profiling --------------------
+    def enable_profiling(self, target: str, out_dir: str):
+        self.profile_target = target
+        self.profile_dir = out_dir
+
+    def profiling(self, name: str = None) -> bool:
+        return self.profile_target is not None and (name or current_task.get()) == self.profile_target
+
+    def profiled_call(self, fn, *args, **kwargs):
+        """Run fn under its own profiler (DB thread) and keep the stats for the dump."""
+        prof = cProfile.Profile()
+        try:
+            prof.enable()
+        except ValueError:
+            return fn(*args, **kwargs)   # 3.12+: loop profiler že teče in vidi tudi ta thread
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            prof.disable()
+            with self._lock:
+                self._profiles.append(prof)
+
+    def dump_profile(self, top: int = 25):
+        if not self.profile_target:
+            return None
+        if not self._profiles:
+            print(f"  Profile: task {self.profile_target!r} did not run")
+            return None
+        os.makedirs(self.profile_dir, exist_ok=True)
+        path = os.path.join(self.profile_dir, self.profile_target.replace(":", "_") + ".prof")
+        stats = pstats.Stats(self._profiles[0])
+        for prof in self._profiles[1:]:
+            stats.add(prof)
+        stats.dump_stats(path)
+        out = io.StringIO()
+        pstats.Stats(path, stream=out).sort_stats("cumulative").print_stats(top)
+        print(f"\n=== PROFILE {self.profile_target} -> {path} ===")
+        print(out.getvalue())
+        return path
+
+    # -------------------- report --------------------
+    def _split(self, name: str):
+        parts = name.split(":")
+        league = next((p for p in parts[1:] if p in self.leagues), None)
+        return parts[0], league
+
+    def report(self, wall: float, monitor=None, **extra) -> dict:
+        tasks = {}
+        stages = {}
+        providers = {}
+        tables = {}
+        for name, t in sorted(self.tasks.items(), key=lambda kv: kv[1].get("start", -1)):
+            stage, league = self._split(name)
+            tasks[name] = {"stage": stage, "league": league, **t}
+            s = stages.setdefault(stage, {"tasks": 0, "seconds": 0.0, "http_requests": 0, "http_bytes": 0,
+                                          "db_reads": 0, "db_writes": 0, "retries": 0, "failed": 0})
+            s["tasks"] += 1
+            s["seconds"] += t.get("seconds", 0.0)
+            s["failed"] += t.get("status") == "failed"
+            s["retries"] += sum(t["retries"].values())
+            for provider, h in t["http"].items():
+                s["http_requests"] += h["requests"]
+                s["http_bytes"] += h["bytes"]
+                total = providers.setdefault(provider, dict.fromkeys(h, 0))
+                for k, v in h.items():
+                    total[k] += v
+            for table, d in t["db"].items():
+                s["db_reads"] += d["reads"]
+                s["db_writes"] += d["writes"]
+                total = tables.setdefault(table, dict.fromkeys(d, 0))
+                for k, v in d.items():
+                    total[k] += v
+
+        return {
+            "started_at": self.started_at.isoformat(),
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+            "wall_seconds": round(wall, 3),
+            **extra,
+            "peak_rss_mb": round(peak_rss_bytes() / 2 ** 20, 1),
+            "peak_rss_children_mb": round(peak_rss_bytes(children=True) / 2 ** 20, 1),
+            "event_loop": {
+                "blocked_seconds": round(monitor.blocked, 3),
+                "stalls": monitor.stalls,
+                "max_stall_seconds": round(monitor.max_stall, 3),
+            } if monitor else None,
+            "stages": stages,
+            "providers": providers,
+            "tables": tables,
+            "tasks": tasks,
+        }
+
+    def summary(self, report: dict):
+        print(f"  peak RSS {report['peak_rss_mb']:.0f} MB (children {report['peak_rss_children_mb']:.0f} MB)")
+        for provider, h in sorted(report["providers"].items()):
+            print(f"  http {provider:<14} {h['requests']:5d} requests {h['bytes'] / 1e6:8.2f} MB  "
+                  f"{h['cached']:5d} cached  {h['errors']:3d} errors")
+        for table, d in sorted(report["tables"].items()):
+            print(f"  db   {table:<18} {d['reads']:4d} reads ({d['rows_read']:7d} rows)  "
+                  f"{d['writes']:4d} writes ({d['rows_written']:7d} rows)")
+        retries = {n: c for t in report["tasks"].values() for n, c in t["retries"].items()}
+        if retries:
+            print(f"  retries: {', '.join(f'{n} x{c}' for n, c in sorted(retries.items()))}")
+
+
+def write_json(path: str, report: dict):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=1, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+
+
+def _labels(**labels) -> str:
+    parts = []
+    for k, v in labels.items():
+        if v is None:
+            continue
+        v = str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{k}="{v}"')
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def write_prometheus(path: str, report: dict, prefix: str = "ddtips_worker"):
+    """Prometheus text exposition format, written atomically (textfile collector)."""
+    metrics = {}   # ime -> (help, [(labels, value)])
+
+    def add(name, help_text, value, **labels):
+        metrics.setdefault(name, (help_text, []))[1].append((_labels(**labels), value))
+
+    add("run_seconds", "Wall time of the last worker run.", report["wall_seconds"])
+    add("last_run_timestamp_seconds", "Unix time the last worker run finished.", time.time())
+    add("peak_rss_bytes", "Peak resident memory of the worker process.", int(report["peak_rss_mb"] * 2 ** 20))
+    add("peak_rss_children_bytes", "Peak resident memory of child processes (model fits).", int(report["peak_rss_children_mb"] * 2 ** 20))
+    for name, t in report["tasks"].items():
+        labels = {"task": name, "stage": t["stage"], "league": t["league"]}
+        if "seconds" in t:
+            add("task_seconds", "Run time per pipeline task.", round(t["seconds"], 4), **labels)
+            add("task_failed", "1 when the pipeline task failed.", int(t.get("status") == "failed"), **labels)
+        for provider, h in t["http"].items():
+            add("http_requests", "Provider HTTP requests (cache hits excluded).", h["requests"], provider=provider, **labels)
+            add("http_bytes", "Provider response bytes.", h["bytes"], provider=provider, **labels)
+            add("http_cached", "Provider calls served from the response cache.", h["cached"], provider=provider, **labels)
+            add("http_errors", "Provider responses with status >= 400.", h["errors"], provider=provider, **labels)
+        for table, d in t["db"].items():
+            add("db_operations", "Storage calls per table.", d["reads"], table=table, op="read", **labels)
+            add("db_operations", "Storage calls per table.", d["writes"], table=table, op="write", **labels)
+            add("db_rows", "Rows read / written per table.", d["rows_read"], table=table, op="read", **labels)
+            add("db_rows", "Rows read / written per table.", d["rows_written"], table=table, op="write", **labels)
+        for name_, count in t["retries"].items():
+            add("retries", "Retried provider calls.", count, call=name_, **labels)
+
+    lines = []
+    for name, (help_text, samples) in metrics.items():
+        lines.append(f"# HELP {prefix}_{name} {help_text}")
+        lines.append(f"# TYPE {prefix}_{name} gauge")
+        lines.extend(f"{prefix}_{name}{labels} {value}" for labels, value in samples)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(path + ".tmp", path)
+
+
+class MeteredStorage:
+    """Storage proxy that records every call in RunMetrics (table, read/write, rows)."""
+
+    def __init__(self, inner, metrics: RunMetrics):
+        self.inner = inner
+        self.metrics = metrics
+        self.name = inner.name
+
+    def upsert(self, table, rows, on_conflict, ignore_duplicates=False):
+        out = self.inner.upsert(table, rows, on_conflict, ignore_duplicates)
+        self.metrics.db(table, "write", len(rows))
+        return out
+
+    def insert(self, table, rows):
+        out = self.inner.insert(table, rows)
+        self.metrics.db(table, "write", len(rows))
+        return out
+
+    def export_rows(self, table, columns, match_ids=None, after_id=None):
+        out = self.inner.export_rows(table, columns, match_ids, after_id)
+        self.metrics.db(table, "read", len(out))
+        return out
+
+    def __getattr__(self, method):
+        fn = getattr(self.inner, method)
+        if method not in STORAGE_CALLS:
+            return fn
+        table, op = STORAGE_CALLS[method]
+
+        def call(*args, **kwargs):
+            out = fn(*args, **kwargs)
+            if isinstance(out, (list, dict)):
+                rows = len(out)
+            elif method in ("refresh_match_xg", "publish_prediction_run"):
+                rows = out or 0                 # vrneta število vrstic
+            elif method == "touch_odds_snapshots":
+                rows = len(args[0])
+            else:
+                rows = int(op == "write")
+            self.metrics.db(table, op, rows)
+            return out
+        return call
@@ -0,0 +1,85 @@
+"""Form model: point-in-time form windows -> Poisson lambdas.
+
+Shared by run.py (STEP 5) and backtest.py, so a backtest measures exactly the
+model the worker predicts with. lambdas() works on floats as well as on numpy
+arrays (one entry per fixture), which is what lets a parameter sweep reuse
+the same form windows for every weight / home advantage / boost combination.
+"""
+
+from dataclasses import asdict, dataclass
+from datetime import date
+
+import numpy as np
+
+from history import MatchHistory
+
+# ekipa brez odigranih tekem v zgodovini
+DEFAULT_FORM = {"gf_pm": 1.35, "ga_pm": 1.35, "xgf_pm": None, "xga_pm": None}
+
+
+@dataclass(frozen=True)
+class FormParams:
+    form_n: int = 3               # heavy weight (form)
+    long_n: int = 10              # light weight (stability)
+    form_weight: float = 0.75
+    home_adv: float = 1.10
+    bottom_pos: int = 17          # position >= bottom_pos: boj za obstanek
+    bottom_boost: float = 1.06
+    top_pos: int = 6              # position <= top_pos: boj za Evropo / naslov
+    top_boost: float = 1.04
+    value_pct_threshold: float = 10.0
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+def _xg_or_goals(form: dict, key_xg: str, key_g: str) -> float:
+    if form and form.get(key_xg) is not None:
+        return float(form[key_xg])
+    return float(form[key_g])
+
+
+def form_inputs(history: MatchHistory, team: str, as_of: date, params: FormParams):
+    """((att_short, def_short, att_long, def_long), short form dict) for a team as of a date.
+
+    xG per game where the window has shots, goals otherwise; a team without a
+    long window falls back to its short one.
+    """
+    f_short = history.form(team, as_of, params.form_n) or DEFAULT_FORM
+    f_long = history.form(team, as_of, params.long_n)
+    att_s = _xg_or_goals(f_short, "xgf_pm", "gf_pm")
+    def_s = _xg_or_goals(f_short, "xga_pm", "ga_pm")
+    att_l = _xg_or_goals(f_long, "xgf_pm", "gf_pm") if f_long else att_s
+    def_l = _xg_or_goals(f_long, "xga_pm", "ga_pm") if f_long else def_s
+    return (att_s, def_s, att_l, def_l), f_short
+
+
+def standings_position(standings_map: dict, team: str) -> float:
+    """Table position, 0 when the row has none, NaN when the team has no standings row."""
+    r = standings_map.get(team)
+    if not r:
+        return float("nan")
+    return r.get("position") or 0
+
+
+def must_win_adjust(position, params: FormParams):
+    # NaN (ni v lestvici) ne ustreza nobenemu pogoju -> 1.00
+    position = np.asarray(position, dtype=float)
+    return np.where(position >= params.bottom_pos, params.bottom_boost,
+                    np.where(position <= params.top_pos, params.top_boost, 1.00))
+
+
+def lambdas(home_inputs, away_inputs, home_pos, away_pos, params: FormParams):
+    """(lam_home, lam_away) from form_inputs() tuples; every element may be an array."""
+    w = params.form_weight
+    h_att_s, h_def_s, h_att_l, h_def_l = home_inputs
+    a_att_s, a_def_s, a_att_l, a_def_l = away_inputs
+
+    home_att = w * h_att_s + (1 - w) * h_att_l
+    home_def = w * h_def_s + (1 - w) * h_def_l
+    away_att = w * a_att_s + (1 - w) * a_att_l
+    away_def = w * a_def_s + (1 - w) * a_def_l
+
+    lam_home = ((home_att + away_def) / 2.0) * params.home_adv * must_win_adjust(home_pos, params)
+    lam_away = ((away_att + home_def) / 2.0) * must_win_adjust(away_pos, params)
+    return lam_home, lam_away
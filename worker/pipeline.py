@@ -0,0 +1,122 @@
+"""Small dependency-aware task graph for the worker pipeline.
+
+Tasks are zero-argument coroutine functions. A task starts once all of its
+dependencies have finished and a slot for its provider is free. Dependencies
+are soft: a failed task is reported, but its dependents still run (same as the
+old sequential loop, where one league's error never stopped the run).
+"""
+
+import asyncio
+import time
+
+
+class LoopMonitor:
+    """Measures event-loop blocked time: a ticker sleeps `interval` seconds and
+    every wake-up later than `tolerance` past schedule counts as a stall."""
+
+    def __init__(self, interval: float = 0.01, tolerance: float = 0.005):
+        self.interval = interval
+        self.tolerance = tolerance
+        self.blocked = 0.0
+        self.max_stall = 0.0
+        self.stalls = 0
+        self._task = None
+
+    async def _tick(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = loop.time() - expected
+            if lag > self.tolerance:
+                self.blocked += lag
+                self.stalls += 1
+                self.max_stall = max(self.max_stall, lag)
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._tick())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+class TaskGraph:
+    def __init__(self, limits: dict = None, metrics=None):
+        self.limits = limits or {}      # provider -> max hkratnih taskov
+        self.metrics = metrics          # metrics.RunMetrics: task_started / task_finished
+        self.results = {}
+        self.timings = {}
+        self.monitor = LoopMonitor()
+        self._tasks = {}
+
+    def add(self, name: str, fn, deps=(), provider: str = None):
+        if name in self._tasks:
+            raise ValueError(f"duplicate task {name!r}")
+        missing = [d for d in deps if d not in self._tasks]
+        if missing:
+            # odvisnosti morajo biti dodane prej, zato cikel ni možen
+            raise ValueError(f"task {name!r} depends on unknown task(s): {', '.join(missing)}")
+        self._tasks[name] = (fn, tuple(deps), provider)
+
+    def names(self, prefix: str):
+        return [n for n in self._tasks if n.startswith(prefix)]
+
+    async def run(self):
+        sems = {p: asyncio.Semaphore(n) for p, n in self.limits.items()}
+        futures = {}
+        t0 = time.perf_counter()
+
+        async def run_one(name):
+            fn, deps, provider = self._tasks[name]
+            if deps:
+                await asyncio.gather(*(futures[d] for d in deps))
+            ready = time.perf_counter()
+            sem = sems.get(provider)
+            if sem is not None:
+                await sem.acquire()
+            started = time.perf_counter()
+            if self.metrics:
+                self.metrics.task_started(name)
+            status, error = "ok", None
+            try:
+                self.results[name] = await fn()
+            except Exception as e:
+                status, error = "failed", str(e)
+                print(f"    ❌ ERROR {name}: {e}")
+            finally:
+                if sem is not None:
+                    sem.release()
+            self.timings[name] = {
+                "provider": provider,
+                "status": status,
+                "error": error,
+                "start": started - t0,
+                "waited": started - ready,
+                "seconds": time.perf_counter() - started,
+            }
+            if self.metrics:
+                self.metrics.task_finished(name, self.timings[name])
+
+        self.monitor.start()
+        try:
+            for name in self._tasks:
+                futures[name] = asyncio.ensure_future(run_one(name))
+            await asyncio.gather(*futures.values())
+        finally:
+            await self.monitor.stop()
+        return time.perf_counter() - t0
+
+    def summary(self, wall: float):
+        print(f"\n=== RUN SUMMARY (wall {wall:.1f}s, sum of tasks {sum(t['seconds'] for t in self.timings.values()):.1f}s) ===")
+        for name, t in sorted(self.timings.items(), key=lambda kv: kv[1]["start"]):
+            flag = "" if t["status"] == "ok" else f"  FAILED: {t['error'][:80]}"
+            print(f"  {name:<34} {t['provider'] or '-':<14} start {t['start']:6.1f}s  wait {t['waited']:5.1f}s  run {t['seconds']:6.1f}s{flag}")
+        m = self.monitor
+        print(f"  event loop blocked {m.blocked:.2f}s ({m.blocked / wall * 100 if wall else 0:.1f}% of wall), "
+              f"{m.stalls} stalls > {m.tolerance * 1000:.0f}ms, max {m.max_stall * 1000:.0f}ms")
@@ -0,0 +1,121 @@
+"""Vectorized scoreline-matrix pricing.
+
+price_scorelines() takes arrays of (lambda_home, lambda_away) for every
+fixture in a run, builds the truncated scoreline probability matrices in one
+pass and prices Over/Under, 1X2, BTTS and Asian totals from them.
+"""
+
+import math
+
+import numpy as np
+
+MAX_GOALS = 10                                    # matrika 0..10 x 0..10
+TOTAL_LINES = (0.5, 1.5, 2.5, 3.5, 4.5, 5.5)
+ASIAN_LINES = tuple(x / 4 for x in range(2, 23))  # 0.5, 0.75, ... 5.5
+
+_LOG_FACT = np.array([math.lgamma(k + 1) for k in range(MAX_GOALS + 1)])
+
+
+def poisson_pmf(lam, max_goals: int = MAX_GOALS):
+    """(n,) lambdas -> (n, max_goals + 1) Poisson pmf."""
+    lam = np.clip(np.asarray(lam, dtype=float), 1e-9, None)[:, None]
+    k = np.arange(max_goals + 1)
+    return np.exp(k * np.log(lam) - lam - _LOG_FACT[:max_goals + 1])
+
+
+def scoreline_matrices(lam_home, lam_away, max_goals: int = MAX_GOALS, rho=None):
+    """(n, G, G) matrices, M[i, h, a] = P(home scores h, away scores a).
+
+    `rho` (scalar or (n,)) applies the Dixon-Coles low-score correction to
+    0-0, 0-1, 1-0 and 1-1; it keeps the matrix summing to 1.
+    """
+    mats = poisson_pmf(lam_home, max_goals)[:, :, None] * poisson_pmf(lam_away, max_goals)[:, None, :]
+    if rho is not None:
+        lh = np.asarray(lam_home, dtype=float)
+        la = np.asarray(lam_away, dtype=float)
+        rho = np.broadcast_to(np.asarray(rho, dtype=float), lh.shape)
+        mats[:, 0, 0] *= 1.0 - lh * la * rho
+        mats[:, 0, 1] *= 1.0 + lh * rho
+        mats[:, 1, 0] *= 1.0 + la * rho
+        mats[:, 1, 1] *= 1.0 - rho
+    return mats
+
+
+def total_goals_dist(mats):
+    """(n, G, G) -> (n, 2G - 1) distribution of home + away goals."""
+    n, g, _ = mats.shape
+    tot = np.add.outer(np.arange(g), np.arange(g)).ravel()
+    onehot = np.zeros((g * g, 2 * g - 1))
+    onehot[np.arange(g * g), tot] = 1.0
+    return mats.reshape(n, g * g) @ onehot
+
+
+def _asian_half_lines(line: float):
+    # quarter line = pol vložka na vsaki sosednji liniji
+    frac = line % 1
+    if frac in (0.25, 0.75):
+        return (line - 0.25, line + 0.25)
+    return (line,)
+
+
+def asian_total_odds(cdf, line: float):
+    """Fair decimal odds (over, under) for an Asian total from the total-goals cdf.
+
+    Break-even o solves sum(P_win * (o - 1) - P_lose) = 0 over the half lines,
+    so pushes on whole lines are handled automatically.
+    """
+    win_over = lose_over = 0.0
+    for half in _asian_half_lines(line):
+        k = math.floor(half)
+        win_over = win_over + (1.0 - cdf[:, k])
+        if half != k:
+            lose_over = lose_over + cdf[:, k]
+        elif k > 0:
+            lose_over = lose_over + cdf[:, k - 1]   # total == k je push
+    with np.errstate(divide="ignore", invalid="ignore"):
+        over = np.where(win_over > 0, 1.0 + lose_over / win_over, np.inf)
+        under = np.where(lose_over > 0, 1.0 + win_over / lose_over, np.inf)
+    return over, under
+
+
+def price_scorelines(lam_home, lam_away, max_goals: int = MAX_GOALS, rho=None) -> dict:
+    """Price every market for n fixtures at once; every value is an (n,) array."""
+    mats = scoreline_matrices(lam_home, lam_away, max_goals, rho)
+    cdf = np.cumsum(total_goals_dist(mats), axis=1)
+
+    out = {}
+    for line in TOTAL_LINES:
+        under = cdf[:, int(line)]
+        out[f"under_{line}"] = under
+        out[f"over_{line}"] = 1.0 - under   # rep nad matriko gre k overju
+
+    draw = np.trace(mats, axis1=1, axis2=2)
+    home = np.tril(mats, -1).sum(axis=(1, 2))
+    away = np.triu(mats, 1).sum(axis=(1, 2))
+    norm = home + draw + away
+    out["home"], out["draw"], out["away"] = home / norm, draw / norm, away / norm
+
+    btts_no = mats[:, 0, :].sum(axis=1) + mats[:, :, 0].sum(axis=1) - mats[:, 0, 0]
+    out["btts_yes"] = 1.0 - btts_no
+    out["btts_no"] = btts_no
+
+    for line in ASIAN_LINES:
+        out[f"ah_over_{line}"], out[f"ah_under_{line}"] = asian_total_odds(cdf, line)
+    return out
+
+
+def markets_for(prices: dict, i: int) -> dict:
+    """JSON-friendly markets for fixture i (stored in predictions.markets)."""
+    def r(x):
+        x = float(x)
+        return round(x, 4) if math.isfinite(x) else None
+
+    return {
+        "ou": {str(line): {"over": r(prices[f"over_{line}"][i]), "under": r(prices[f"under_{line}"][i])} for line in TOTAL_LINES},
+        "1x2": {"home": r(prices["home"][i]), "draw": r(prices["draw"][i]), "away": r(prices["away"][i])},
+        "btts": {"yes": r(prices["btts_yes"][i]), "no": r(prices["btts_no"][i])},
+        "asian_fair_odds": {
+            str(line): {"over": r(prices[f"ah_over_{line}"][i]), "under": r(prices[f"ah_under_{line}"][i])}
+            for line in ASIAN_LINES
+        },
+    }
@@ -0,0 +1,275 @@
+"""Per-provider request pacing and the odds quota budget.
+
+One ProviderLimiter per provider is shared by every task that calls it and
+is only consulted for real network requests (cache hits are free). Before a
+request it waits for whichever comes last:
+
+  min_interval   spacing between request starts (Understat politeness)
+  per_minute     sliding 60 s window (football-data free tier: 10/min)
+  quota headers  remaining == 0 until the advertised reset
+                 (football-data X-Requests-Available-Minute / X-RequestCounter-Reset)
+  Retry-After    or the reset header after a 429
+
+OddsBudget caps The Odds API usage per day and month (each request costs
+markets x regions credits, x-requests-last). Usage is kept in a small JSON
+file, and the month's figure is corrected from x-requests-used / -remaining on
+every response. A reservation is refunded when the request gets no response
+or an uncharged error, so retries don't spend it twice. settle() only marks the
+state dirty; the caller writes it with save() off the event loop. plan()
+decides before a run which leagues fit: when the budget is low only priority-1
+leagues are fetched.
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import date, datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+
+
+class RateLimited(RuntimeError):
+    """A 429 (or quota) response; the limiter already knows how long to wait."""
+
+    def __init__(self, provider: str, retry_after: float = None):
+        super().__init__(f"{provider} rate limited" + (f", retry after {retry_after:.0f}s" if retry_after else ""))
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+class QuotaExhausted(RuntimeError):
+    pass
+
+
+def _headers(headers) -> dict:
+    return {str(k).lower(): v for k, v in (headers or {}).items()}
+
+
+def _number(v):
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_after_seconds(headers) -> float:
+    """Retry-After as seconds (delta-seconds or HTTP date), None when absent."""
+    v = _headers(headers).get("retry-after")
+    if v is None:
+        return None
+    secs = _number(v)
+    if secs is not None:
+        return max(0.0, secs)
+    try:
+        return max(0.0, (parsedate_to_datetime(v) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class ProviderLimiter:
+    def __init__(self, name: str, min_interval: float = 0.0, per_minute: int = None,
+                 remaining_header: str = None, reset_header: str = None, backoff: float = 10.0, quota=None):
+        self.name = name
+        self.min_interval = min_interval
+        self.per_minute = per_minute
+        self.remaining_header = remaining_header
+        self.reset_header = reset_header
+        self.backoff = backoff          # 429 brez Retry-After / reset glave
+        self.quota = quota              # OddsBudget: reserve() pred requestom, settle() po njem
+        self.remaining = None
+        self.reset_at = 0.0
+        self.blocked_until = 0.0
+        self.requests = 0
+        self.waited = 0.0
+        self.rate_limited = 0
+        self._next = 0.0
+        self._window = deque()
+        self._lock = None               # asyncio.Lock, ustvarjen v tekočem loopu
+
+    def _delay(self, now: float) -> float:
+        wait = max(self.blocked_until, self._next) - now
+        if self.remaining is not None and self.remaining <= 0 and self.reset_at > now:
+            wait = max(wait, self.reset_at - now)
+        if self.per_minute:
+            while self._window and now - self._window[0] >= 60:
+                self._window.popleft()
+            if len(self._window) >= self.per_minute:
+                wait = max(wait, self._window[0] + 60 - now)
+        return max(0.0, wait)
+
+    async def acquire(self, cost: int = 1):
+        """Wait for a request slot (callers queue in order)."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self.quota is not None:
+                self.quota.reserve(cost)
+            wait = self._delay(time.monotonic())
+            if wait > 0:
+                self.waited += wait
+                try:
+                    await asyncio.sleep(wait)
+                except BaseException:
+                    self.release(cost)   # preklican pred requestom
+                    raise
+            now = time.monotonic()
+            self._next = now + self.min_interval
+            if self.per_minute:
+                self._window.append(now)
+            if self.remaining is not None:
+                self.remaining -= 1     # sočasni taski ne smejo prehiteti glave naslednjega odgovora
+            self.requests += 1
+
+    def release(self, cost: int = 1):
+        """Give back the quota reserved by acquire() for a request that got no response."""
+        if self.quota is not None:
+            self.quota.refund(cost)
+
+    def observe(self, status: int, headers=None, cost: int = 1):
+        """Update pacing from a response's status and quota headers (`cost` as passed to acquire)."""
+        h = _headers(headers)
+        now = time.monotonic()
+        if self.remaining_header and _number(h.get(self.remaining_header.lower())) is not None:
+            self.remaining = _number(h[self.remaining_header.lower()])
+        if self.reset_header and _number(h.get(self.reset_header.lower())) is not None:
+            self.reset_at = now + _number(h[self.reset_header.lower()])
+        retry_after = retry_after_seconds(h)
+        if status == 429:
+            self.rate_limited += 1
+            if retry_after is None:
+                retry_after = self.reset_at - now if self.reset_at > now else self.backoff
+            self.remaining = 0
+        if retry_after is not None:
+            self.blocked_until = max(self.blocked_until, now + retry_after)
+        if self.quota is not None:
+            self.quota.settle(status, h, cost)
+        return retry_after
+
+    def stats(self) -> str:
+        s = f"{self.name}: {self.requests} requests, waited {self.waited:.1f}s, {self.rate_limited}x 429"
+        if self.remaining is not None:
+            s += f", {self.remaining:.0f} left in window"
+        return s
+
+
+class OddsBudget:
+    """Daily / monthly request budget for The Odds API (0 = no cap)."""
+
+    def __init__(self, path: str, daily: int = 0, monthly: int = 0, reserve: int = 0):
+        self.path = path
+        self.daily = daily
+        self.monthly = monthly
+        self.reserve_low = reserve      # pod toliko preostalimi krediti samo prioriteta 1
+        self.state = {}
+        self.dirty = False              # settle() spremeni stanje, save() ga zapiše
+        self._save_lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self.state = json.load(f)
+        except (OSError, ValueError):
+            self.state = {}
+        self._roll()
+
+    def save(self):
+        """Write the state file (blocking: async callers run it in a thread)."""
+        with self._save_lock:
+            self.dirty = False
+            state = dict(self.state)    # kopija: event loop ga medtem lahko spreminja
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            os.replace(self.path + ".tmp", self.path)
+
+    def _roll(self):
+        today = date.today()
+        if self.state.get("day") != today.isoformat():
+            self.state.update(day=today.isoformat(), day_used=0)
+        if self.state.get("month") != today.strftime("%Y-%m"):
+            self.state.update(month=today.strftime("%Y-%m"), month_used=0, provider_remaining=None)
+
+    def available(self) -> float:
+        """Credits that may still be spent now (inf when nothing caps it)."""
+        self._roll()
+        left = [float("inf")]
+        if self.daily:
+            left.append(self.daily - self.state["day_used"])
+        if self.monthly:
+            left.append(self.monthly - self.state["month_used"])
+        if self.state.get("provider_remaining") is not None:
+            left.append(self.state["provider_remaining"])
+        return max(0.0, min(left))
+
+    def month_left(self) -> float:
+        left = [float("inf")]
+        if self.monthly:
+            left.append(self.monthly - self.state["month_used"])
+        if self.state.get("provider_remaining") is not None:
+            left.append(self.state["provider_remaining"])
+        return max(0.0, min(left))
+
+    def plan(self, leagues: dict, cost: int = 1):
+        """Split {league: priority} into (fetch, skipped {league: reason}), highest priority first."""
+        left = self.available()
+        low = self.month_left() < self.reserve_low
+        fetch, skipped = [], {}
+        for league, priority in sorted(leagues.items(), key=lambda kv: (kv[1], kv[0])):
+            if low and priority > 1:
+                skipped[league] = f"budget low ({self.month_left():.0f} left this month), priority {priority}"
+            elif cost > left:
+                skipped[league] = f"budget exhausted ({left:.0f} left)"
+            else:
+                fetch.append(league)
+                left -= cost
+        return fetch, skipped
+
+    def reserve(self, cost: int = 1):
+        if cost > self.available():
+            raise QuotaExhausted(f"odds budget exhausted ({self.describe()})")
+        self.state["day_used"] += cost
+        self.state["month_used"] += cost
+
+    def refund(self, cost: int = 1):
+        """Undo reserve() for a request the provider did not charge."""
+        self.state["day_used"] = max(0, self.state["day_used"] - cost)
+        self.state["month_used"] = max(0, self.state["month_used"] - cost)
+
+    def settle(self, status: int, headers: dict, reserved: int = 1):
+        """Correct the counters from the response's quota headers."""
+        used = _number(headers.get("x-requests-used"))
+        remaining = _number(headers.get("x-requests-remaining"))
+        last = _number(headers.get("x-requests-last"))
+        if last is not None:
+            self.state["day_used"] += int(last) - reserved
+        elif status >= 400:
+            self.refund(reserved)       # napake (429, 5xx) brez x-requests-last provider ne zaračuna
+        if used is not None:
+            self.state["month_used"] = int(used)      # provider je avtoritativen
+        if remaining is not None:
+            self.state["provider_remaining"] = int(remaining)
+        self.state["updated_at"] = datetime.now(timezone.utc).isoformat()
+        self.dirty = True
+
+    def hourly_rate(self) -> float:
+        """Credits per hour that make the daily and monthly budget last until they reset (inf = no cap)."""
+        now = datetime.now()
+        day_end = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+        month_end = datetime(now.year + now.month // 12, now.month % 12 + 1, 1)
+        rates = [float("inf")]
+        if self.daily:
+            rates.append(max(0.0, self.daily - self.state["day_used"]) / max((day_end - now).total_seconds() / 3600, 1 / 60))
+        if self.month_left() != float("inf"):
+            rates.append(self.month_left() / max((month_end - now).total_seconds() / 3600, 1 / 60))
+        return min(rates)
+
+    def describe(self) -> str:
+        s = self.state
+        parts = [f"today {s['day_used']}" + (f"/{self.daily}" if self.daily else ""),
+                 f"month {s['month_used']}" + (f"/{self.monthly}" if self.monthly else "")]
+        if s.get("provider_remaining") is not None:
+            parts.append(f"provider remaining {s['provider_remaining']}")
+        return ", ".join(parts)
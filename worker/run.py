@@ -1,28 +1,67 @@
 import os
-import math
 import asyncio
-from datetime import date, timedelta
+import argparse
+import contextvars
+import hashlib
+import math
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+from datetime import date, datetime, timedelta, timezone
+from functools import partial
 
 from dotenv import load_dotenv
 import aiohttp
 from understat import Understat
-from supabase import create_client
+
+import dixon_coles
+import features
+from history import MatchHistory
+from linking import FixtureIndex
+import metrics
+from metrics import MeteredStorage, RunMetrics
+from model import FormParams, form_inputs, lambdas, standings_position
+from http_cache import MODES as HTTP_CACHE_MODES, CacheMiss, ResponseCache
+from ratelimit import OddsBudget, ProviderLimiter, QuotaExhausted, RateLimited
+from pipeline import TaskGraph
+from pricing import markets_for, price_scorelines
+from scheduling import (DEFAULT_ODDS_TIERS, KickoffCalendar, StageSchedule, odds_interval, parse_duration, parse_tiers,
+                        utc)
+from snapshot import Snapshot
+from storage import DEFAULT_URL as DEFAULT_STORAGE_URL, Storage, open_storage
 
 # -------------------- ENV --------------------
 # Naloži .env datoteko iz iste mape, kjer je skripta
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), ".env"))
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY") or os.getenv("SUPABASE_KEY") # Podpora za oba imena
+STORAGE_URL = os.getenv("STORAGE_URL", DEFAULT_STORAGE_URL)   # supabase | sqlite:///<pot>
 FOOTBALL_DATA_API_KEY = os.getenv("FOOTBALL_DATA_API_KEY")
 
 ODDS_PROVIDER = (os.getenv("ODDS_PROVIDER") or "").strip().lower()
 ODDS_API_KEY = os.getenv("ODDS_API_KEY")
 
-if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
-    raise RuntimeError("Missing SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY in .env")
+# Storage (storage/): odpre ga main() glede na --storage, ne ob importu
+db: Storage = None
+# --history-snapshot: končane tekme za form okna STEP 5 iz Parquet snapshota namesto iz storage;
+# features in Dixon-Coles fit se zapišeta v storage, zato vedno bereta storage
+history_source = None
+
+# storage klici so sinhroni: iz async kode jih pošljemo v omejen thread pool.
+DB_THREADS = int(os.getenv("DB_THREADS", 4))
+db_executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix="db")
 
-sb = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+
+async def offload(fn, *args, **kwargs):
+    """Run a blocking DB call in the DB thread pool without stalling the event loop.
+
+    The call runs in a copy of the caller's context, so run_metrics counts it
+    for the pipeline task that made it.
+    """
+    call = partial(fn, *args, **kwargs)
+    if run_metrics.profiling():
+        call = partial(run_metrics.profiled_call, call)
+    return await asyncio.get_running_loop().run_in_executor(db_executor, partial(contextvars.copy_context().run, call))
 
 
 # -------------------- CONFIG --------------------
@@ -31,40 +70,113 @@ LONG_N = 10       # light weight (stability)
 FORM_WEIGHT = 0.75
 HOME_ADV = 1.10
 
-SHOTS_IMPORT_LIMIT = 120
+SHOTS_IMPORT_LIMIT = int(os.getenv("SHOTS_IMPORT_LIMIT", 120))
+SHOTS_CONCURRENCY = int(os.getenv("SHOTS_CONCURRENCY", 4))        # hkratni Understat shot requesti
+UNDERSTAT_DELAY = float(os.getenv("UNDERSTAT_DELAY", 0.2))        # min. razmik med requesti na understat.com
+UNDERSTAT_FULL_SYNC = os.getenv("UNDERSTAT_FULL_SYNC") == "1"     # ignoriraj fingerprinte/watermarke
+UNDERSTAT_CLOSED_AFTER_DAYS = 60  # sezona brez novih rezultatov toliko dni = zaključena, ne prenašamo več
 PREDICT_FINISHED_DEMO_N = 20
 VALUE_PCT_THRESHOLD = 10.0
+PREDICTION_MODELS = ("form", "dixon-coles")
+PREDICTION_MODEL = os.getenv("PREDICTION_MODEL", "form")
+MODEL_FIT_WORKERS = int(os.getenv("MODEL_FIT_WORKERS", os.cpu_count() or 1))  # procesi za Dixon-Coles fit po ligah
+# must_win_adjust faktorji so v model.FormParams (bottom_*/top_*)
+FORM_PARAMS = FormParams(
+    form_n=FORM_N,
+    long_n=LONG_N,
+    form_weight=FORM_WEIGHT,
+    home_adv=HOME_ADV,
+    value_pct_threshold=VALUE_PCT_THRESHOLD,
+)
+PREDICTION_RETENTION_DAYS = int(os.getenv("PREDICTION_RETENTION_DAYS", 30))  # koliko dni hranimo stare prediction rune
+
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", 500))  # vrstic na en bulk upsert/insert
+
+# --- HTTP cache (glej http_cache.py) ---
+HTTP_CACHE_DIR = os.getenv("HTTP_CACHE_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "http")
+HTTP_CACHE_MODE = os.getenv("HTTP_CACHE_MODE", "cache")   # off | cache | record | replay
+HTTP_CACHE_TTL = {                                        # sekunde, na endpoint
+    "understat:league": 3600,
+    "understat:shots": 30 * 24 * 3600,   # shoti končane tekme se ne spreminjajo
+    "football-data:matches": 1800,
+    "football-data:standings": 3600,
+    "odds": 300,
+    "odds:events": 1800,   # /events ne porabi kvote
+    "odds:live": 0,        # live poll vedno z mreže
+}
+
+# --- Run report (glej metrics.py) ---
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+RUN_REPORT_PATH = os.getenv("RUN_REPORT_PATH") or os.path.join(CACHE_DIR, "run_report.json")
+PROM_TEXTFILE = os.getenv("PROM_TEXTFILE")                  # npr. /var/lib/node_exporter/textfile/ddtips.prom
+PROFILE_DIR = os.getenv("PROFILE_DIR") or os.path.join(CACHE_DIR, "profile")
+
+# --- Rate limiti in odds kvota (glej ratelimit.py) ---
+FD_REQUESTS_PER_MINUTE = int(os.getenv("FD_REQUESTS_PER_MINUTE", 10))   # free tier
+FD_MAX_429_RETRIES = int(os.getenv("FD_MAX_429_RETRIES", 3))
+ODDS_DAILY_BUDGET = int(os.getenv("ODDS_DAILY_BUDGET", 0))              # krediti na dan, 0 = brez meje
+ODDS_MONTHLY_BUDGET = int(os.getenv("ODDS_MONTHLY_BUDGET", 500))        # free plan: 500 kreditov / mesec
+ODDS_BUDGET_RESERVE = int(os.getenv("ODDS_BUDGET_RESERVE", 50))         # pod tem samo lige z odds_priority 1
+ODDS_BUDGET_PATH = os.getenv("ODDS_BUDGET_PATH") or os.path.join(CACHE_DIR, "odds_budget.json")
+
+# --- Daemon (--daemon, glej scheduling.py) ---
+STAGES = ("history", "fixtures", "odds", "predictions")
+DAEMON_HISTORY_HOUR = int(os.getenv("DAEMON_HISTORY_HOUR", 4))                            # UTC, nočni Understat sync
+DAEMON_FIXTURES_INTERVAL = parse_duration(os.getenv("DAEMON_FIXTURES_INTERVAL", "24h"))   # fixtures + standings
+DAEMON_ODDS_TIERS = parse_tiers(os.getenv("DAEMON_ODDS_TIERS", DEFAULT_ODDS_TIERS))       # do kickoffa:interval
+DAEMON_MAX_SLEEP = parse_duration(os.getenv("DAEMON_MAX_SLEEP", "5m"))
+
+# --- Live odds (--live) ---
+LIVE_WINDOW = parse_duration(os.getenv("LIVE_WINDOW", "15m"))                  # poll tudi tekme, ki se začnejo v tem času
+LIVE_POLL_INTERVAL = parse_duration(os.getenv("LIVE_POLL_INTERVAL", "10s"))    # najkrajši razmik med polli
+LIVE_BUDGET_SHARE = float(os.getenv("LIVE_BUDGET_SHARE", 0.5))                 # delež urne odds kvote za live
+LIVE_EVENTS_INTERVAL = parse_duration(os.getenv("LIVE_EVENTS_INTERVAL", "30m"))  # osvežitev seznama eventov
+
+# največ hkratnih taskov na providerja v pipeline grafu
+PROVIDER_CONCURRENCY = {
+    "understat": int(os.getenv("UNDERSTAT_CONCURRENCY", 4)),
+    "football-data": 2,   # tempo drži limiters["football-data"]
+    "odds": 3,
+}
 
 # --- KONFIGURACIJA LIG ---
 # Povezava med imeni v Understat, Football-Data in TheOddsAPI
+# odds_priority: 1 = kvote tudi ko odds budget pade pod ODDS_BUDGET_RESERVE
 LEAGUES_MAP = {
     "EPL": {
         "understat": "EPL",
         "fd_code": "PL",
-        "odds_key": "soccer_epl"
+        "odds_key": "soccer_epl",
+        "odds_priority": 1
     },
     "La_liga": {
         "understat": "La_liga",
         "fd_code": "PD",
-        "odds_key": "soccer_spain_la_liga"
+        "odds_key": "soccer_spain_la_liga",
+        "odds_priority": 1
     },
     "Bundesliga": {
         "understat": "Bundesliga",
         "fd_code": "BL1",
-        "odds_key": "soccer_germany_bundesliga"
+        "odds_key": "soccer_germany_bundesliga",
+        "odds_priority": 2
     },
     "Serie_A": {
         "understat": "Serie_A",
         "fd_code": "SA",
-        "odds_key": "soccer_italy_serie_a"
+        "odds_key": "soccer_italy_serie_a",
+        "odds_priority": 2
     },
     "Ligue_1": {
         "understat": "Ligue_1",
         "fd_code": "FL1",
-        "odds_key": "soccer_france_ligue_1"
+        "odds_key": "soccer_france_ligue_1",
+        "odds_priority": 3
     }
 }
 
+run_metrics = RunMetrics(LEAGUES_MAP)
+
 
 # -------------------- Helpers --------------------
 def safe_float(x, default=0.0) -> float:
@@ -76,17 +188,6 @@ def safe_float(x, default=0.0) -> float:
         return default
 
 
-def poisson_cdf(k: int, lam: float) -> float:
-    s = 0.0
-    for i in range(k + 1):
-        s += math.exp(-lam) * (lam ** i) / math.factorial(i)
-    return s
-
-
-def p_over_25(lam_total: float) -> float:
-    return 1.0 - poisson_cdf(2, lam_total)
-
-
 def implied_prob(decimal_odds: float) -> float:
     if not decimal_odds or decimal_odds <= 1.0:
         return 0.0
@@ -97,75 +198,66 @@ def normalize_team_name(name: str) -> str:
     return (name or "").strip()
 
 
-def norm_team(s: str) -> str:
-    s = (s or "").lower().strip()
-    # remove common suffixes
-    for suf in [" fc", " afc", " f.c.", " c.f.", " cf", " as", " ssc"]:
-        if s.endswith(suf):
-            s = s[: -len(suf)].strip()
-    s = s.replace("&", "and")
-    s = s.replace("utd", "united")
-    s = " ".join(s.split())
-    return s
-
-
-def upsert_alias(source: str, source_name: str, canonical: str):
-    sb.table("team_aliases").upsert(
-        {"source": source, "source_name": source_name, "canonical_name": canonical},
-        on_conflict="source,source_name",
-    ).execute()
-
-
-def canonical_from_alias(source: str, source_name: str) -> str:
-    row = (
-        sb.table("team_aliases")
-        .select("canonical_name")
-        .eq("source", source)
-        .eq("source_name", source_name)
-        .limit(1)
-        .execute()
-        .data
-    )
-    if row:
-        return row[0]["canonical_name"]
-    return source_name
+class AliasRegistry:
+    """team_aliases loaded once per run; names are resolved in memory and
+    newly seen (source, source_name) pairs are written in one bulk upsert."""
+
+    def __init__(self):
+        self._canonical = {}
+        self._pending = {}
+        self._loaded = False
+        self._lock = threading.Lock()  # resolve() kličejo tudi DB threadi
+
+    def load(self):
+        rows = db.team_aliases()
+        self._canonical = {(r["source"], r["source_name"]): r["canonical_name"] for r in rows}
+        self._loaded = True
+        return len(self._canonical)
+
+    def resolve(self, source: str, source_name: str) -> str:
+        if not self._loaded:
+            self.load()
+        key = (source, source_name)
+        with self._lock:
+            canonical = self._canonical.get(key)
+            if canonical is None:
+                # nova ekipa: kanonično ime = ime iz vira (kot prej v upsert_alias)
+                canonical = source_name
+                self._canonical[key] = canonical
+                if source_name:
+                    self._pending[key] = canonical
+        return canonical
+
+    def flush(self) -> int:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        rows = [
+            {"source": s, "source_name": n, "canonical_name": c}
+            for (s, n), c in pending.items()
+        ]
+        # ignore_duplicates: ročno popravljenih aliasov ne povozimo
+        try:
+            db.upsert("team_aliases", rows, on_conflict="source,source_name", ignore_duplicates=True)
+        except Exception:
+            with self._lock:
+                for k, v in pending.items():
+                    self._pending.setdefault(k, v)
+            raise
+        return len(rows)
 
 
-def find_match_id(match_date: str, home: str, away: str):
-    """Find matches.id for a given date+teams."""
-    if not match_date or not home or not away:
-        return None
+aliases = AliasRegistry()
 
-    # 1) exact match
-    q = (
-        sb.table("matches")
-        .select("id")
-        .eq("match_date", match_date)
-        .eq("home_team", home)
-        .eq("away_team", away)
-        .limit(1)
-        .execute()
-        .data
-    )
-    if q:
-        return q[0]["id"]
-
-    # 2) normalized fallback
-    rows = (
-        sb.table("matches")
-        .select("id, home_team, away_team")
-        .eq("match_date", match_date)
-        .limit(80)
-        .execute()
-        .data
-        or []
-    )
-    nh, na = norm_team(home), norm_team(away)
-    for r in rows:
-        if norm_team(r["home_team"]) == nh and norm_team(r["away_team"]) == na:
-            return r["id"]
 
-    return None
+def flush_aliases():
+    try:
+        n = aliases.flush()
+        if n:
+            print(f"    Stored {n} new team aliases")
+    except Exception as e:
+        print(f"    ❌ ERROR storing team aliases: {e}")
 
 
 # -------------------- Retry wrapper --------------------
@@ -174,47 +266,87 @@ async def retry(coro_fn, tries=3, base_sleep=1.0, name="call"):
     for i in range(tries):
         try:
             return await coro_fn()
+        except (CacheMiss, QuotaExhausted):
+            raise  # replay / porabljena kvota: ponovni poskus ne pomaga
+        except RateLimited as e:
+            last = e
+            run_metrics.retry(name)
+            # limiter sam počaka do Retry-After / reseta, brez dodatnega backoffa
         except Exception as e:
             last = e
+            run_metrics.retry(name)
             # print(f"Retry {i+1}/{tries} for {name} failed: {e}")
             await asyncio.sleep(base_sleep * (2 ** i))
     raise last
 
 
+# -------------------- Providers --------------------
+http_cache = ResponseCache(HTTP_CACHE_DIR, HTTP_CACHE_MODE, HTTP_CACHE_TTL, metrics=run_metrics)
+kickoffs = KickoffCalendar()   # daemon: kdaj je naslednja tekma lige (odds_key)
+clock_shift = timedelta(0)     # replay: run teče ob času snemanja (main)
+
+
+def now_utc() -> datetime:
+    """Current UTC time; in replay, as of the recorded run's start."""
+    return datetime.now(timezone.utc) + clock_shift
+odds_budget = OddsBudget(ODDS_BUDGET_PATH, ODDS_DAILY_BUDGET, ODDS_MONTHLY_BUDGET, ODDS_BUDGET_RESERVE)
+
+# en limiter na providerja, skupen vsem taskom; šteje samo prave network requeste
+limiters = {
+    "understat": ProviderLimiter("understat", min_interval=UNDERSTAT_DELAY),
+    "football-data": ProviderLimiter("football-data", per_minute=FD_REQUESTS_PER_MINUTE,
+                                     remaining_header="X-Requests-Available-Minute",
+                                     reset_header="X-RequestCounter-Reset"),
+    "odds": ProviderLimiter("odds", quota=odds_budget),
+}
+
+
+def fd_enabled() -> bool:
+    # replay ne rabi ključev, vse je posneto
+    return bool(FOOTBALL_DATA_API_KEY) or http_cache.mode == "replay"
+
+
+def odds_enabled() -> bool:
+    return (ODDS_PROVIDER == "theoddsapi" and bool(ODDS_API_KEY)) or http_cache.mode == "replay"
+
+
 # -------------------- Understat fetch --------------------
 async def fetch_understat_league_matches(league_name: str, season_year: int, session: aiohttp.ClientSession):
     """Fetch matches for a specific league from Understat."""
     us = Understat(session)
-    return await us.get_league_results(league_name, season_year)
+    return await http_cache.memo("understat:league", f"{league_name}/{season_year}",
+                                 lambda: us.get_league_results(league_name, season_year), limiters["understat"])
 
 
 async def fetch_match_shots_understat(understat_match_id: str, session: aiohttp.ClientSession):
     us = Understat(session)
-    return await us.get_match_shots(understat_match_id)
+    return await http_cache.memo("understat:shots", str(understat_match_id),
+                                 lambda: us.get_match_shots(understat_match_id), limiters["understat"])
 
 
 # -------------------- football-data.org --------------------
-async def fd_get_json(url: str, session: aiohttp.ClientSession):
-    if not FOOTBALL_DATA_API_KEY:
+async def fd_get_json(url: str, session: aiohttp.ClientSession, namespace: str = "football-data:matches"):
+    if not fd_enabled():
         return None
-    headers = {"X-Auth-Token": FOOTBALL_DATA_API_KEY}
-    async with session.get(url, headers=headers) as r:
-        if r.status != 200:
-            txt = await r.text()
-            # 429 = Too Many Requests
-            if r.status == 429:
-                print("⚠️ Football-Data API rate limit reached. Waiting 10s...")
-                await asyncio.sleep(10)
-                return await fd_get_json(url, session) # Rekurzivni retry
-            raise RuntimeError(f"football-data.org {r.status}: {txt[:200]}")
-        return await r.json()
-
-
-async def fetch_fd_fixtures(league_code: str, session: aiohttp.ClientSession, days_ahead: int = 30):
-    if not FOOTBALL_DATA_API_KEY:
+    headers = {"X-Auth-Token": FOOTBALL_DATA_API_KEY or ""}
+    limiter = limiters["football-data"]
+    for attempt in range(FD_MAX_429_RETRIES + 1):
+        status, body = await http_cache.get_json(session, namespace, url, headers=headers, limiter=limiter)
+        if status == 200:
+            return body
+        if status != 429:
+            raise RuntimeError(f"football-data.org {status}: {str(body)[:200]}")
+        # 429: limiter je iz glav (X-RequestCounter-Reset / Retry-After) že nastavil čakanje
+        print(f"⚠️ Football-Data API rate limit reached ({attempt + 1}/{FD_MAX_429_RETRIES + 1}), waiting for the counter reset...")
+        run_metrics.retry("football-data 429")
+    raise RateLimited("football-data")
+
+
+async def fetch_fd_fixtures(league_code: str, session: aiohttp.ClientSession, today: date, days_ahead: int = 30):
+    if not fd_enabled():
         return []
-    date_from = date.today().isoformat()
-    date_to = (date.today() + timedelta(days=days_ahead)).isoformat()
+    date_from = today.isoformat()
+    date_to = (today + timedelta(days=days_ahead)).isoformat()
     # URL sedaj sprejme kodo lige (npr. PL, PD, BL1...)
     url = f"https://api.football-data.org/v4/competitions/{league_code}/matches?dateFrom={date_from}&dateTo={date_to}"
     j = await fd_get_json(url, session)
@@ -222,10 +354,10 @@ async def fetch_fd_fixtures(league_code: str, session: aiohttp.ClientSession, da
 
 
 async def fetch_fd_standings(league_code: str, session: aiohttp.ClientSession):
-    if not FOOTBALL_DATA_API_KEY:
+    if not fd_enabled():
         return []
     url = f"https://api.football-data.org/v4/competitions/{league_code}/standings"
-    j = await fd_get_json(url, session)
+    j = await fd_get_json(url, session, "football-data:standings")
     standings = (j or {}).get("standings", [])
     for s in standings:
         if s.get("type") == "TOTAL":
@@ -234,18 +366,178 @@ async def fetch_fd_standings(league_code: str, session: aiohttp.ClientSession):
 
 
 # -------------------- DB upserts --------------------
-def upsert_match_understat(season_year: int, league_name: str, m: dict):
+def _row_label(row: dict) -> str:
+    keys = ("id", "match_id", "understat_match_id", "match_date", "home_team", "away_team", "team_name")
+    return ", ".join(f"{k}={row[k]}" for k in keys if row.get(k) is not None)
+
+
+class WriteBuffer:
+    """Write-behind buffer for worker table writes.
+
+    Rows are collected per (table, conflict key) and sent as chunked bulk
+    upserts/inserts. A bucket that reaches batch_size is handed to the single
+    background writer thread (so writes overlap with fetches and keep their
+    order); flush() sends the rest and waits, and every stage calls it on exit.
+
+    Each pipeline stage has its own buffer (see stage_writes), so flush() only
+    waits for that stage's rows and its counters and failures are its own.
+    """
+
+    def __init__(self, batch_size: int = WRITE_BATCH_SIZE):
+        self.batch_size = max(1, batch_size)
+        self._upserts = {}   # (table, on_conflict) -> {conflict values: row}
+        self._inserts = {}   # table -> [row]
+        self._lock = threading.Lock()
+        self._inflight = []
+        self.requests = 0
+        self.written = 0
+        self.failed = []     # (table, row label, error)
+
+    def upsert(self, table: str, row: dict, on_conflict: str):
+        cols = [c.strip() for c in on_conflict.split(",")]
+        with self._lock:
+            bucket = self._upserts.setdefault((table, on_conflict), {})
+            # isti ključ dvakrat v enem batchu PostgREST zavrne, zadnja vrstica zmaga
+            bucket[tuple(row.get(c) for c in cols)] = row
+            if len(bucket) < self.batch_size:
+                return
+            rows = list(self._upserts.pop((table, on_conflict)).values())
+        self._submit(table, rows, self._upsert_fn(table, on_conflict))
+
+    def insert(self, table: str, row: dict):
+        with self._lock:
+            bucket = self._inserts.setdefault(table, [])
+            bucket.append(row)
+            if len(bucket) < self.batch_size:
+                return
+            rows = self._inserts.pop(table)
+        self._submit(table, rows, self._insert_fn(table))
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(len(b) for b in self._upserts.values()) + sum(len(b) for b in self._inserts.values())
+
+    def flush(self):
+        """Send everything buffered and block until the writer is idle."""
+        with self._lock:
+            upserts, self._upserts = self._upserts, {}
+            inserts, self._inserts = self._inserts, {}
+        for (table, on_conflict), bucket in upserts.items():
+            self._submit(table, list(bucket.values()), self._upsert_fn(table, on_conflict))
+        for table, rows in inserts.items():
+            self._submit(table, rows, self._insert_fn(table))
+        with self._lock:
+            inflight, self._inflight = self._inflight, []
+        wait_futures(inflight)
+
+    @staticmethod
+    def _upsert_fn(table: str, on_conflict: str):
+        return lambda chunk: db.upsert(table, chunk, on_conflict)
+
+    @staticmethod
+    def _insert_fn(table: str):
+        return lambda chunk: db.insert(table, chunk)
+
+    def _submit(self, table: str, rows: list, write):
+        if not rows:
+            return
+        # writer thread šteje zapise za task, ki jih je poslal
+        fut = db_writer.submit(contextvars.copy_context().run, self._send, table, rows, write)
+        with self._lock:
+            self._inflight.append(fut)
+
+    def _send(self, table: str, rows: list, write):
+        # PostgREST rabi enake stolpce v vseh vrsticah enega requesta
+        groups = {}
+        for r in rows:
+            groups.setdefault(tuple(sorted(r)), []).append(r)
+
+        for group in groups.values():
+            for i in range(0, len(group), self.batch_size):
+                chunk = group[i:i + self.batch_size]
+                try:
+                    self.requests += 1
+                    write(chunk)
+                    self.written += len(chunk)
+                except Exception:
+                    # chunk je padel: po vrsticah, da vemo katere so krive
+                    for r in chunk:
+                        try:
+                            self.requests += 1
+                            write([r])
+                            self.written += 1
+                        except Exception as e:
+                            self.failed.append((table, _row_label(r), str(e)[:200]))
+
+    def report(self, label: str):
+        print(f"    {label}: wrote {self.written} rows in {self.requests} requests")
+        if self.failed:
+            print(f"    ❌ {len(self.failed)} rows failed:")
+            for table, row, err in self.failed[:20]:
+                print(f"       {table} [{row}]: {err}")
+            if len(self.failed) > 20:
+                print(f"       ... and {len(self.failed) - 20} more")
+        self.requests = 0
+        self.written = 0
+        self.failed = []
+
+
+class StageWrites:
+    """`writes`: the WriteBuffer of the running stage (set by stage_writes),
+    or a shared default buffer outside the task graph."""
+
+    def __init__(self):
+        self.default = WriteBuffer()
+
+    def __getattr__(self, name):
+        return getattr(current_writes.get() or self.default, name)
+
+
+def stage_writes(buf: WriteBuffer, fn):
+    """Wrap a task so it (and everything it offloads) writes through `buf`."""
+    async def task():
+        current_writes.set(buf)   # task ima svoj context, drugih taskov ne prizadene
+        return await fn()
+    return task
+
+
+# en writer thread za vse buffre: zapisi ohranijo vrstni red tudi med stagei
+db_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+current_writes = contextvars.ContextVar("current_writes", default=None)
+writes = StageWrites()
+dirty_features = features.DirtyTeams()   # ekipe z novo/spremenjeno končano tekmo ali xG v tem runu
+
+
+def flush_stage(label: str):
+    """Stage-end flush of buffered aliases and table rows."""
+    flush_aliases()
+    try:
+        writes.flush()
+    except Exception as e:
+        print(f"    ❌ ERROR flushing writes: {e}")
+    writes.report(label)
+
+
+def understat_fingerprint(m: dict, home: str, away: str) -> str:
+    goals = m.get("goals") or {}
+    key = "|".join(str(v) for v in (m.get("datetime"), goals.get("h"), goals.get("a"), m.get("isResult"), home, away))
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def upsert_match_understat(season_year: int, league_name: str, m: dict, known_fps: dict = None) -> bool:
+    """Queue the match upsert; returns False when its fingerprint is unchanged (skipped)."""
     understat_id = str(m.get("id"))
     dt_str = m.get("datetime")
     match_date = dt_str.split(" ")[0] if dt_str else None
 
     home_src = (m.get("h") or {}).get("title") or ""
     away_src = (m.get("a") or {}).get("title") or ""
-    home = canonical_from_alias("understat", home_src)
-    away = canonical_from_alias("understat", away_src)
+    home = aliases.resolve("understat", home_src)
+    away = aliases.resolve("understat", away_src)
 
-    upsert_alias("understat", home_src, home)
-    upsert_alias("understat", away_src, away)
+    fp = understat_fingerprint(m, home, away)
+    if known_fps is not None and known_fps.get(understat_id) == fp:
+        return False
 
     hg = (m.get("goals") or {}).get("h")
     ag = (m.get("goals") or {}).get("a")
@@ -260,13 +552,77 @@ def upsert_match_understat(season_year: int, league_name: str, m: dict):
         "away_goals": ag,
         "understat_match_id": understat_id,
         "status": status,
-        "league": league_name # Dodano: shranjujemo ime lige
+        "league": league_name, # Dodano: shranjujemo ime lige
+        "understat_fp": fp
     }
 
-    sb.table("matches").upsert(payload, on_conflict="understat_match_id").execute()
+    writes.upsert("matches", payload, on_conflict="understat_match_id")
+    if status == "FINISHED":
+        dirty_features.mark(home, match_date)
+        dirty_features.mark(away, match_date)
+    return True
+
+
+def load_sync_state(source: str) -> dict:
+    """(league, season) -> sync_state row."""
+    rows = db.sync_state(source)
+    return {(r["league"], r["season"]): r for r in rows}
+
+
+def load_understat_fingerprints(league_name: str, season_year: int) -> dict:
+    return db.understat_fingerprints(league_name, season_year)
+
+
+def season_closed(state: dict, today: date) -> bool:
+    wm = (state or {}).get("watermark")
+    if not wm:
+        return False
+    last = datetime.strptime(wm[:10], "%Y-%m-%d").date()
+    return (today - last).days > UNDERSTAT_CLOSED_AFTER_DAYS
+
+
+async def sync_understat_league(league_name: str, config: dict, season: int, session: aiohttp.ClientSession,
+                                sync_state: dict, today: date):
+    """STEP 1 for one league/season: write only new or changed matches."""
+    state = sync_state.get((league_name, season))
+    if not UNDERSTAT_FULL_SYNC and season_closed(state, today):
+        print(f"    {league_name} {season}: season closed (last result {state['watermark'][:10]}), skipped")
+        return
+
+    matches = await retry(lambda: fetch_understat_league_matches(config["understat"], season, session), tries=3, base_sleep=1.0, name=f"understat_{league_name}")
+    if not matches:
+        return
+
+    # alias resolve + buffering je CPU delo: ne na event loopu
+    await offload(store_understat_season, league_name, season, matches, state)
+
 
+def store_understat_season(league_name: str, season: int, matches: list, state: dict):
+    """Queue the new/changed matches of one fetched league/season and its sync_state row."""
+    known_fps = None if UNDERSTAT_FULL_SYNC else load_understat_fingerprints(league_name, season)
+    written = sum(1 for m in matches if upsert_match_understat(season, league_name, m, known_fps))
+    print(f"    {league_name} {season}: fetched {len(matches)} matches ({written} new/changed, {len(matches) - written} unchanged skipped)")
 
-def upsert_fixture_fd(fd_match: dict, league_name: str):
+    finished = [m.get("datetime") for m in matches if m.get("datetime") and (m.get("goals") or {}).get("h") is not None]
+    watermark = max(finished) if finished else None
+    if written or not state or state.get("watermark") != watermark:
+        writes.upsert("sync_state", {
+            "source": "understat",
+            "league": league_name,
+            "season": season,
+            "watermark": watermark,
+            "match_count": len(matches),
+            "synced_at": datetime.utcnow().isoformat(),
+        }, on_conflict="source,league,season")
+
+
+def load_match_ids(date_from: str, date_to: str) -> dict:
+    """(match_date, home_team, away_team) -> matches.id for the date window."""
+    rows = db.matches_between(date_from, date_to)
+    return {(r["match_date"], r["home_team"], r["away_team"]): r["id"] for r in rows}
+
+
+def upsert_fixture_fd(fd_match: dict, league_name: str, existing_ids: dict):
     utc_date = fd_match.get("utcDate")
     if not utc_date:
         return
@@ -274,11 +630,8 @@ def upsert_fixture_fd(fd_match: dict, league_name: str):
 
     home_src = ((fd_match.get("homeTeam") or {}).get("name")) or ""
     away_src = ((fd_match.get("awayTeam") or {}).get("name")) or ""
-    home = canonical_from_alias("football-data", home_src)
-    away = canonical_from_alias("football-data", away_src)
-
-    upsert_alias("football-data", home_src, home)
-    upsert_alias("football-data", away_src, away)
+    home = aliases.resolve("football-data", home_src)
+    away = aliases.resolve("football-data", away_src)
 
     payload = {
         "season": int(d[:4]),
@@ -290,154 +643,158 @@ def upsert_fixture_fd(fd_match: dict, league_name: str):
     }
 
     # Preverimo če obstaja, da ne povozimo understat ID-ja
-    existing = (
-        sb.table("matches")
-        .select("id")
-        .eq("match_date", d)
-        .eq("home_team", home)
-        .eq("away_team", away)
-        .limit(1)
-        .execute()
-        .data
-    )
-    if existing:
-        sb.table("matches").update(payload).eq("id", existing[0]["id"]).execute()
+    existing_id = existing_ids.get((d, home, away))
+    if existing_id:
+        writes.upsert("matches", {"id": existing_id, **payload}, on_conflict="id")
     else:
-        sb.table("matches").insert(payload).execute()
+        writes.insert("matches", payload)
 
 
 def store_shots(db_match_id: int, shots_json: dict, home_team: str, away_team: str):
-    rows = []
+    # kandidati v STEP 3 so samo tekme brez shotov, zato brez delete
     for side_key, team_name in [("h", home_team), ("a", away_team)]:
         for s in shots_json.get(side_key, []):
             minute = int(s.get("minute", 0))
             xg = safe_float(s.get("xG", 0.0))
             is_goal = (str(s.get("result", "")).lower() == "goal")
-            rows.append({
+            writes.insert("shots", {
                 "match_id": db_match_id,
                 "team_name": team_name,
                 "minute": minute,
                 "xg": xg,
-                "is_goal": is_goal
+                "is_goal": is_goal,
+                "situation": s.get("situation"),
             })
 
-    sb.table("shots").delete().eq("match_id", db_match_id).execute()
-    if rows:
-        sb.table("shots").insert(rows).execute()
 
+def refresh_match_xg(match_ids) -> int:
+    """Recompute matches.home_xg/away_xg/npxg/shots from stored shots (server side)."""
+    return db.refresh_match_xg(list(match_ids))
 
-# -------------------- Form metrics --------------------
-def last_n_matches(team: str, as_of: date, n: int):
-    as_of_str = as_of.isoformat()
-    return (
-        sb.table("matches")
-        .select("id, match_date, home_team, away_team, home_goals, away_goals, status")
-        .eq("status", "FINISHED")
-        .lt("match_date", as_of_str)
-        .or_(f"home_team.eq.{team},away_team.eq.{team}")
-        .order("match_date", desc=True)
-        .limit(n)
-        .execute()
-        .data
-        or []
-    )
 
+def backfill_match_xg():
+    """One-off: fill the per-match xG columns for every finished Understat match from existing shots."""
+    ids = db.finished_understat_match_ids()
+    n = refresh_match_xg(ids)
+    print(f"Backfilled xG aggregates for {n}/{len(ids)} finished matches")
 
-def xg_for_against_for_match(match_id: int, team: str):
-    shots = (
-        sb.table("shots")
-        .select("team_name, xg")
-        .eq("match_id", match_id)
-        .execute()
-        .data
-        or []
-    )
-    if not shots:
-        return None, None
-    xg_for = 0.0
-    xg_against = 0.0
-    for s in shots:
-        tn = s["team_name"]
-        xg = safe_float(s["xg"])
-        if tn == team:
-            xg_for += xg
-        else:
-            xg_against += xg
-    return xg_for, xg_against
 
+def load_shot_candidates(limit: int):
+    """Latest finished Understat matches that have no shots yet (one query, shot count included)."""
+    rows = db.shot_candidates(limit)
+    return [m for m in rows if not m.pop("shot_count", 0)], len(rows)
 
-def goals_for_against(match: dict, team: str):
-    home = match["home_team"]
-    away = match["away_team"]
-    hg = match.get("home_goals")
-    ag = match.get("away_goals")
-    if hg is None or ag is None:
-        return 0, 0
-    if team == home:
-        return int(hg), int(ag)
-    return int(ag), int(hg)
 
+async def import_shots(candidates: list, session: aiohttp.ClientSession):
+    """Fetch Understat shots concurrently (bounded + paced); rows go to the write buffer.
 
-def compute_form(team: str, as_of: date, n: int):
-    ms = last_n_matches(team, as_of, n)
-    if not ms:
-        return None
+    Returns the ids of the matches whose shots were queued.
+    """
+    sem = asyncio.Semaphore(SHOTS_CONCURRENCY)
 
-    total_xgf = 0.0
-    total_xga = 0.0
-    total_gf = 0
-    total_ga = 0
-    have_xg = 0
-
-    for m in ms:
-        gf, ga = goals_for_against(m, team)
-        total_gf += gf
-        total_ga += ga
-
-        xgf, xga = xg_for_against_for_match(m["id"], team)
-        if xgf is not None:
-            total_xgf += xgf
-            total_xga += (xga or 0.0)
-            have_xg += 1
-
-    games = len(ms)
-    return {
-        "games": games,
-        "gf_pm": total_gf / games,
-        "ga_pm": total_ga / games,
-        "xgf_pm": (total_xgf / have_xg) if have_xg else None,
-        "xga_pm": (total_xga / have_xg) if have_xg else None,
-        "xg_coverage": have_xg / games
-    }
+    async def one(m):
+        understat_id = m["understat_match_id"]
 
+        async with sem:
+            try:
+                # tempo drži limiters["understat"], skupen z league fetchi
+                shots_json = await retry(lambda: fetch_match_shots_understat(understat_id, session),
+                                         tries=3, base_sleep=1.0, name="shots")
+            except Exception as e:
+                print(f"  ❌ ERROR shots id={understat_id}: {e}")
+                return None
+        await offload(store_shots, m["id"], shots_json, m["home_team"], m["away_team"])
+        dirty_features.mark(m["home_team"], m["match_date"])
+        dirty_features.mark(m["away_team"], m["match_date"])
+        return m["id"]
 
-def blend_form(form3: dict, form10: dict):
-    def pick_xg_or_goals(f, key_xg, key_g):
-        if f and f.get(key_xg) is not None:
-            return float(f[key_xg])
-        return float(f[key_g])
+    results = await asyncio.gather(*(one(m) for m in candidates))
+    return [mid for mid in results if mid is not None]
 
-    xgf3 = pick_xg_or_goals(form3, "xgf_pm", "gf_pm")
-    xga3 = pick_xg_or_goals(form3, "xga_pm", "ga_pm")
-    xgf10 = pick_xg_or_goals(form10, "xgf_pm", "gf_pm") if form10 else xgf3
-    xga10 = pick_xg_or_goals(form10, "xga_pm", "ga_pm") if form10 else xga3
 
-    xgf = FORM_WEIGHT * xgf3 + (1 - FORM_WEIGHT) * xgf10
-    xga = FORM_WEIGHT * xga3 + (1 - FORM_WEIGHT) * xga10
-    return xgf, xga
+# -------------------- Form metrics --------------------
+# daemon: as_of -> MatchHistory, ostane v spominu do naslednjega history/fixtures cikla
+history_cache = None
+
+
+def load_finished_matches(as_of: date, snapshot: bool = False) -> MatchHistory:
+    """All finished matches before `as_of`, with their per-match xG (refresh_match_xg).
+
+    `snapshot` reads them from --history-snapshot when one is given."""
+    source = history_source if snapshot and history_source else db
+    key = as_of.isoformat() if source is db else f"snapshot:{as_of.isoformat()}"
+    if history_cache is not None and key in history_cache:
+        return history_cache[key]
+    history = MatchHistory()
+    for m in source.finished_matches(before=as_of.isoformat()):
+        hg, ag = m.get("home_goals"), m.get("away_goals")
+        if hg is None or ag is None:
+            hg, ag = 0, 0
+        history.add(m["id"], m["match_date"], m["home_team"], m["away_team"], hg, ag, m.get("league"))
+        if m.get("home_xg") is not None and m.get("away_xg") is not None:
+            history.set_xg(m["id"], m["home_xg"], m["away_xg"])
+    history.finalize()
+    if history_cache is not None:
+        history_cache[key] = history
+    return history
+
+
+def load_match_history(as_of: date, teams, n: int = LONG_N) -> MatchHistory:
+    """Load finished matches (and their xG) once for every form window of the run."""
+    history = load_finished_matches(as_of, snapshot=True)
+    ids = history.recent_match_ids(teams, as_of, n)
+    with_xg = sum(1 for i in range(len(history)) if history.match_id[i] in ids and not math.isnan(history.home_xg[i]))
+    print(f"    History: {len(history)} finished matches, xG for {with_xg}/{len(ids)} form-window matches")
+    return history
+
+
+# -------------------- Team features --------------------
+def load_feature_seeds(since: dict) -> dict:
+    """team -> stored team_features row just before its `since` date (EWM seed)."""
+    if not since:
+        return {}
+    # sezonski premor je krajši od leta, starejši seed ne rabimo
+    lower = (date.fromisoformat(min(since.values())) - timedelta(days=365)).isoformat()
+    seeds = {}
+    for r in db.team_feature_rows(list(since), lower):
+        if str(r["as_of_date"])[:10] < since[r["team_name"]]:
+            seeds[r["team_name"]] = r   # naraščajoče po datumu: ostane zadnji pred since
+    return seeds
+
+
+def update_team_features(today: date, rebuild: bool = False):
+    """Recompute team_features for teams marked dirty in this run (or for every team)."""
+    dirty = dirty_features.drain()
+    if not dirty and not rebuild:
+        print("    Features: no new finished matches")
+        return
+    try:
+        history = load_finished_matches(today + timedelta(days=1))
+        if rebuild:
+            since, seeds = dict.fromkeys(history.team_names), {}
+            db.clear_team_features()
+        else:
+            seeds = load_feature_seeds(dirty)
+            # brez seeda (nova ekipa ali tabela še ni zgrajena) ekipo izračunamo od začetka
+            since = {t: (d if t in seeds else None) for t, d in dirty.items()}
+
+        n = 0
+        for team, d in since.items():
+            for row in features.team_feature_rows(history, team, d, seeds.get(team)):
+                writes.upsert("team_features", row, on_conflict="team_name,as_of_date")
+                n += 1
+        print(f"    Features: {n} rows for {len(since)} teams ({'rebuild' if rebuild else 'incremental'})")
+    except Exception:
+        for team, d in dirty.items():
+            dirty_features.mark(team, d)   # naslednji run poskusi znova
+        raise
+    finally:
+        flush_stage("features")
 
 
 # -------------------- Standings motivation --------------------
 def load_latest_standings_map():
-    rows = (
-        sb.table("standings")
-        .select("team_name, position, points, played, goal_diff, as_of_date")
-        .order("as_of_date", desc=True)
-        .limit(200) # Povečan limit, ker imamo zdaj 5 lig
-        .execute()
-        .data
-        or []
-    )
+    rows = db.latest_standings(200)  # Povečan limit, ker imamo zdaj 5 lig
     m = {}
     for r in rows:
         # Če ekipa že obstaja v mapi, jo povozi samo če je datum novejši (zaradi orderja bo prvi že najnovejši)
@@ -446,53 +803,72 @@ def load_latest_standings_map():
     return m
 
 
-def must_win_adjust(team: str, standings_map: dict) -> float:
-    r = standings_map.get(team)
-    if not r:
-        return 1.00
-    pos = r.get("position") or 0
-    if pos >= 17:
-        return 1.06
-    if pos <= 6:
-        return 1.04
-    return 1.00
+# -------------------- Odds (The Odds API) --------------------
+ODDS_QUERY = "regions=eu&markets=totals&oddsFormat=decimal"
 
 
-# -------------------- Odds (The Odds API) --------------------
 async def fetch_odds_totals_25(sport_key: str, session: aiohttp.ClientSession):
     """
     Fetch odds for a specific sport key (league).
     """
-    if ODDS_PROVIDER != "theoddsapi" or not ODDS_API_KEY:
+    if not odds_enabled():
         return []
 
-    url = (
-        f"https://api.the-odds-api.com/v4/sports/{sport_key}/odds/"
-        f"?apiKey={ODDS_API_KEY}&regions=eu&markets=totals&oddsFormat=decimal"
-    )
+    url = f"https://api.the-odds-api.com/v4/sports/{sport_key}/odds/?apiKey={ODDS_API_KEY}&{ODDS_QUERY}"
 
     print(f"   Fetching odds for {sport_key}...")
-    async with session.get(url) as r:
-        if r.status != 200:
-            txt = await r.text()
-            print(f"   Odds Error {r.status}: {txt[:100]}")
-            return []
-        data = await r.json()
-
+    # ključ cache-a brez apiKey
+    status, data = await odds_get_json(session, "odds", url, f"{sport_key}?{ODDS_QUERY}")
+    if status == 429:
+        raise RateLimited("odds")   # retry() ponovi, ko limiter spusti
+    if status != 200:
+        print(f"   Odds Error {status}: {str(data)[:100]}")
+        return []
+    return parse_odds_events(data, sport_key, now_utc())
+
+
+async def fetch_odds_events(sport_key: str, session: aiohttp.ClientSession) -> list:
+    """Upcoming and in-play events of a league (The Odds API /events, free of quota)."""
+    url = f"https://api.the-odds-api.com/v4/sports/{sport_key}/events?apiKey={ODDS_API_KEY}"
+    status, data = await odds_get_json(session, "odds:events", url, f"{sport_key}/events", cost=0)
+    if status == 429:
+        raise RateLimited("odds")
+    if status != 200:
+        raise RuntimeError(f"odds events {status}: {str(data)[:100]}")
+    return data
+
+
+async def fetch_live_odds(sport_key: str, event_ids: list, session: aiohttp.ClientSession) -> list:
+    """Odds for the given events only: same credits as a league fetch, a fraction of the payload."""
+    ids = ",".join(sorted(event_ids))
+    url = f"https://api.the-odds-api.com/v4/sports/{sport_key}/odds/?apiKey={ODDS_API_KEY}&{ODDS_QUERY}&eventIds={ids}"
+    status, data = await odds_get_json(session, "odds:live", url, f"{sport_key}?{ODDS_QUERY}&eventIds={ids}")
+    if status == 429:
+        raise RateLimited("odds")
+    if status != 200:
+        raise RuntimeError(f"live odds {status}: {str(data)[:100]}")
+    return parse_odds_events(data, sport_key, now_utc())
+
+
+def parse_odds_events(data: list, sport_key: str, now: datetime) -> list:
+    """Best Over/Under 2.5 price per event; events that already kicked off are is_live."""
     out = []
 
     for ev in data:
         home_src = ev.get("home_team") or ""
         away_src = ev.get("away_team") or ""
-        home = canonical_from_alias("odds", home_src)
-        away = canonical_from_alias("odds", away_src)
-        upsert_alias("odds", home_src, home)
-        upsert_alias("odds", away_src, away)
+        home = aliases.resolve("odds", home_src)
+        away = aliases.resolve("odds", away_src)
 
         commence = ev.get("commence_time") or ""
+        kickoffs.add(sport_key, ev.get("id") or commence, commence)
         md = commence.split("T")[0] if "T" in commence else None
         if not md:
             continue
+        try:
+            live = utc(commence) <= now
+        except ValueError:
+            live = False
 
         best_over = None
         best_under = None
@@ -529,9 +905,8 @@ async def fetch_odds_totals_25(sport_key: str, session: aiohttp.ClientSession):
                         best_under_bk = bname
 
         if best_over and best_under:
-            mid = find_match_id(md, home, away)
             out.append({
-                "match_id": mid,
+                "match_id": None,  # povežemo v link_odds_rows, ko so tekme v bazi
                 "match_date": md,
                 "home_team": home,
                 "away_team": away,
@@ -540,54 +915,146 @@ async def fetch_odds_totals_25(sport_key: str, session: aiohttp.ClientSession):
                 "line": 2.5,
                 "over_odds": best_over,
                 "under_odds": best_under,
-                "is_live": False
+                "is_live": live
             })
 
     return out
 
 
-def store_odds_snapshot(row: dict):
-    sb.table("odds_snapshots").insert(row).execute()
+def load_fixture_index(date_from: str, date_to: str) -> FixtureIndex:
+    return FixtureIndex(db.matches_between(date_from, date_to))
 
 
-def latest_odds_for_match_id(match_id: int):
-    if not match_id:
-        return None
-    rows = (
-        sb.table("odds_snapshots")
-        .select("over_odds, under_odds, bookmaker, created_at")
-        .eq("match_id", match_id)
-        .order("created_at", desc=True)
-        .limit(1)
-        .execute()
-        .data
-        or []
-    )
-    return rows[0] if rows else None
+def link_odds_rows(rows: list, index: FixtureIndex) -> list:
+    """Set match_id on every odds row; returns the rows that could not be linked."""
+    unlinked = []
+    for r in rows:
+        r["match_id"] = index.find(r["match_date"], r["home_team"], r["away_team"])
+        if not r["match_id"]:
+            unlinked.append(r)
+    return unlinked
+
+
+def odds_key(row: dict) -> tuple:
+    return (row["match_date"], row["home_team"], row["away_team"], row.get("market"),
+            float(row.get("line") or 0), bool(row.get("is_live")))
+
+
+def load_latest_odds(date_from: str, date_to: str) -> dict:
+    """odds_key -> latest stored snapshot for events in the date window."""
+    rows = db.odds_snapshots_between(date_from, date_to)
+    latest = {}
+    for r in rows:
+        latest.setdefault(odds_key(r), r)
+    return latest
+
+
+def odds_changed(prev: dict, row: dict) -> bool:
+    if not prev:
+        return True
+    if safe_float(prev.get("over_odds"), None) != row["over_odds"] or safe_float(prev.get("under_odds"), None) != row["under_odds"]:
+        return True
+    if prev.get("bookmaker") != row["bookmaker"]:
+        return True
+    # tekma je šele zdaj povezana -> nova točka, da jo najde predikcija
+    return not prev.get("match_id") and bool(row.get("match_id"))
+
+
+def store_odds_snapshot(row: dict, latest: dict, seen_ids: list, now: str) -> bool:
+    """Queue a new point only when price/bookmaker moved; otherwise remember the
+    stored row so its last_seen_at gets bumped. Returns True when queued."""
+    key = odds_key(row)
+    prev = latest.get(key)
+    if not odds_changed(prev, row):
+        if prev.get("id"):
+            seen_ids.append(prev["id"])
+        return False
+    row["last_seen_at"] = now
+    writes.insert("odds_snapshots", row)
+    latest[key] = row
+    return True
+
+
+def touch_odds_last_seen(ids: list, now: str):
+    db.touch_odds_snapshots(ids, now)
+
+
+def load_latest_odds_map(match_ids) -> dict:
+    """match_id -> latest odds snapshot, for the whole prediction window at once (view latest_odds)."""
+    return db.latest_odds(list(match_ids))
 
 
 # -------------------- Prediction --------------------
-def predict_match(match_row: dict, as_of: date, standings_map: dict):
+def model_lambdas(match_row: dict, as_of: date, standings_map: dict, history: MatchHistory, fits: dict = None) -> dict:
+    """Form model lambdas, or Dixon-Coles ones when `fits` has a fit for the match's league.
+
+    The last-FORM_N form is always computed, it goes into the report either way.
+    """
     home = match_row["home_team"]
     away = match_row["away_team"]
 
-    f3_home = compute_form(home, as_of, FORM_N) or {"gf_pm": 1.35, "ga_pm": 1.35, "xgf_pm": None, "xga_pm": None}
-    f10_home = compute_form(home, as_of, LONG_N)
-    f3_away = compute_form(away, as_of, FORM_N) or {"gf_pm": 1.35, "ga_pm": 1.35, "xgf_pm": None, "xga_pm": None}
-    f10_away = compute_form(away, as_of, LONG_N)
+    home_inputs, f3_home = form_inputs(history, home, as_of, FORM_PARAMS)
+    away_inputs, f3_away = form_inputs(history, away, as_of, FORM_PARAMS)
+
+    fit = (fits or {}).get(match_row.get("league"))
+    if fit:
+        lam_home, lam_away = dixon_coles.lambdas(fit, home, away)
+        return {"lam_home": lam_home, "lam_away": lam_away, "rho": fit["rho"], "label": "Dixon-Coles",
+                "f3_home": f3_home, "f3_away": f3_away}
+
+    lam_home, lam_away = lambdas(
+        home_inputs, away_inputs,
+        standings_position(standings_map, home), standings_position(standings_map, away),
+        FORM_PARAMS,
+    )
+    return {"lam_home": float(lam_home), "lam_away": float(lam_away), "rho": 0.0, "label": f"forma zadnje {FORM_N}",
+            "f3_home": f3_home, "f3_away": f3_away}
+
 
-    home_att, home_def = blend_form(f3_home, f10_home)
-    away_att, away_def = blend_form(f3_away, f10_away)
+# povečaj, ko se spremeni izračun napovedi: vsi fingerprinti postanejo novi
+PREDICTION_FP_VERSION = 1
 
-    lam_home = ((home_att + away_def) / 2.0) * HOME_ADV
-    lam_away = ((away_att + home_def) / 2.0)
 
-    lam_home *= must_win_adjust(home, standings_map)
-    lam_away *= must_win_adjust(away, standings_map)
+def prediction_fingerprint(match_row: dict, as_of: date, model: str, params: dict, history: MatchHistory,
+                           standings_map: dict, odds_map: dict, fits: dict = None) -> str:
+    """Hash of everything a prediction is computed from.
+
+    Both teams' last LONG_N matches (ids, goals, xG), the match's latest pre-match
+    odds, both standings rows and the model parameters (for Dixon-Coles the
+    fitted ratings the match uses). `as_of` only matters through those windows,
+    so an unchanged fixture keeps its fingerprint from day to day.
+    """
+    home, away = match_row["home_team"], match_row["away_team"]
+    parts = [PREDICTION_FP_VERSION, model, sorted(params.items()),
+             match_row["id"], match_row.get("match_date"), match_row.get("league"), home, away]
+    for team in (home, away):
+        parts.append([(history.match_id[r], history.home_goals[r], history.away_goals[r],
+                       round(history.home_xg[r], 6), round(history.away_xg[r], 6))
+                      for r in history.window(team, as_of, LONG_N)])
+        st = standings_map.get(team) or {}
+        parts.append([st.get(k) for k in ("position", "points", "played", "goal_diff")])
+    o = odds_map.get(match_row["id"]) or {}
+    parts.append([safe_float(o.get("over_odds"), None), safe_float(o.get("under_odds"), None)])
+    fit = (fits or {}).get(match_row.get("league"))
+    if fit:
+        # refit iste zgodovine se premakne za ~1e-6 (warm start): na 3 decimalke (~0.1 % lambde),
+        # da šum optimizatorja ne sproži ponovnega izračuna
+        parts.append([[round(v, 3) for v in fit["teams"].get(t, (0.0, 0.0))] for t in (home, away)] +
+                     [round(fit["home_adv"], 3), round(fit["rho"], 3)])
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def predict_match(match_row: dict, model: dict, prices: dict, i: int, run_id: int, odds_map: dict,
+                  input_fp: str = None):
+    """Odds, value % and report for fixture i of a batch priced by price_scorelines()."""
+    home = match_row["home_team"]
+    away = match_row["away_team"]
+    lam_home, lam_away = model["lam_home"], model["lam_away"]
+    f3_home, f3_away = model["f3_home"], model["f3_away"]
 
     lam_total = lam_home + lam_away
-    p_over = p_over_25(lam_total)
-    p_under = 1.0 - p_over
+    p_over = float(prices["over_2.5"][i])
+    p_under = float(prices["under_2.5"][i])
 
     # odds + value%
     over_odds = None
@@ -596,7 +1063,7 @@ def predict_match(match_row: dict, as_of: date, standings_map: dict):
     value_under_pct = None
     value_side = None
 
-    o = latest_odds_for_match_id(match_row["id"])
+    o = odds_map.get(match_row["id"])
     if o:
         over_odds = safe_float(o.get("over_odds"), None)
         under_odds = safe_float(o.get("under_odds"), None)
@@ -617,7 +1084,7 @@ def predict_match(match_row: dict, as_of: date, standings_map: dict):
             value_side = "OVER" if (value_over_pct or -999) >= (value_under_pct or -999) else "UNDER"
 
     report_lines = [
-        f"Napoved (forma zadnje {FORM_N}): λ_total={lam_total:.2f} (λ {home}={lam_home:.2f}, λ {away}={lam_away:.2f})",
+        f"Napoved ({model['label']}): λ_total={lam_total:.2f} (λ {home}={lam_home:.2f}, λ {away}={lam_away:.2f})",
         f"P(Over 2.5)={p_over:.2f} · P(Under 2.5)={p_under:.2f}",
         f"{home} zadnje {FORM_N}: xG/tekma ~ {f3_home.get('xgf_pm') if f3_home.get('xgf_pm') is not None else f3_home.get('gf_pm'):.2f} za · {f3_home.get('xga_pm') if f3_home.get('xga_pm') is not None else f3_home.get('ga_pm'):.2f} proti",
         f"{away} zadnje {FORM_N}: xG/tekma ~ {f3_away.get('xgf_pm') if f3_away.get('xgf_pm') is not None else f3_away.get('gf_pm'):.2f} za · {f3_away.get('xga_pm') if f3_away.get('xga_pm') is not None else f3_away.get('ga_pm'):.2f} proti",
@@ -632,8 +1099,8 @@ def predict_match(match_row: dict, as_of: date, standings_map: dict):
 
     report = "\n".join(report_lines)
 
-    sb.table("predictions").delete().eq("match_id", match_row["id"]).execute()
-    sb.table("predictions").insert({
+    writes.insert("prediction_history", {
+        "run_id": run_id,
         "match_id": match_row["id"],
         "lambda_home": lam_home,
         "lambda_away": lam_away,
@@ -645,177 +1112,690 @@ def predict_match(match_row: dict, as_of: date, standings_map: dict):
         "edge_over": value_over_pct / 100.0 if value_over_pct is not None else None,
         "edge_under": value_under_pct / 100.0 if value_under_pct is not None else None,
         "value_side": value_side,
-    }).execute()
+        "markets": markets_for(prices, i),
+        "input_fp": input_fp,
+    })
+
+
+def model_params(model: str) -> dict:
+    params = FORM_PARAMS.as_dict()
+    if model == "dixon-coles":
+        params.update({"xi": dixon_coles.XI, "window_days": dixon_coles.WINDOW_DAYS})
+    return params
+
+
+def load_model_fits(model: str) -> dict:
+    """league -> params of the latest stored fit (warm start for the next one)."""
+    return db.latest_model_fits(model)
+
+
+def fit_dixon_coles(history: MatchHistory, as_of: date) -> dict:
+    """Refit every league (process pool, warm-started); fits are stored in model_fits."""
+    t0 = time.perf_counter()
+    jobs = dixon_coles.league_jobs(history, as_of.toordinal(), load_model_fits("dixon-coles"))
+    fits = dixon_coles.fit_leagues(jobs, MODEL_FIT_WORKERS)
+    for league, fit in fits.items():
+        writes.insert("model_fits", {
+            "model": "dixon-coles",
+            "league": league,
+            "as_of": as_of.isoformat(),
+            "params": {k: fit[k] for k in ("teams", "home_adv", "rho", "xi")},
+            "matches": fit["matches"],
+            "log_lik": fit["log_lik"],
+        })
+        print(f"    Dixon-Coles {league}: {fit['matches']} matches, {len(fit['teams'])} teams, "
+              f"home {fit['home_adv']:+.3f}, rho {fit['rho']:+.3f}, {fit['iterations']} it"
+              f"{' (warm)' if fit['warm_start'] else ''}{'' if fit['converged'] else ' NOT CONVERGED'}")
+    print(f"    Dixon-Coles fit: {len(fits)} leagues in {time.perf_counter() - t0:.1f}s")
+    return fits
+
+
+def start_prediction_run(fixtures: int, model: str) -> int:
+    run_id = db.create_prediction_run({
+        "status": "building",
+        "model": model,
+        "params": model_params(model),
+        "fixtures": fixtures,
+    })
+    print(f"    Prediction run #{run_id}")
+    return run_id
+
+
+def publish_prediction_run(run_id: int):
+    """Flush the run's rows, then swap them into predictions in one transaction."""
+    try:
+        writes.flush()
+        failed = [f for f in writes.failed if f[0] == "prediction_history"]
+    except Exception as e:
+        failed = [("prediction_history", f"run #{run_id}", str(e)[:200])]
+    writes.report("STEP 5 predictions")
+    if failed:
+        # nepopoln run ne sme postati trenutni set
+        db.set_prediction_run_status(run_id, "failed")
+        print(f"    ❌ Prediction run #{run_id} NOT published ({len(failed)} rows failed)")
+        return
+    n = db.publish_prediction_run(run_id, PREDICTION_RETENTION_DAYS)
+    print(f"    Published prediction run #{run_id} ({n} predictions, keeping {PREDICTION_RETENTION_DAYS} days of runs)")
 
 
-# -------------------- Main --------------------
-async def main():
-    today = date.today()
-    seasons = [today.year - 1, today.year]
-    timeout = aiohttp.ClientTimeout(total=60) # Povečan timeout
+def predict_matches(upcoming: list, as_of: date, standings_map: dict, history: MatchHistory, run_id: int,
+                    fits: dict = None, odds_map: dict = None, fingerprints: dict = None):
+    """Lambdas per fixture, then one vectorized pricing pass for the whole batch."""
+    batch = []
+    for m in upcoming:
+        try:
+            batch.append((m, model_lambdas(m, as_of, standings_map, history, fits)))
+        except Exception as e:
+            print(f"  ❌ ERROR predicting match_id={m.get('id')}: {e}")
+    if not batch:
+        return
 
-    print("=== STARTING WORKER ===")
+    if odds_map is None:
+        odds_map = load_latest_odds_map(m["id"] for m, _ in batch)
+    prices = price_scorelines(
+        [model["lam_home"] for _, model in batch],
+        [model["lam_away"] for _, model in batch],
+        rho=[model["rho"] for _, model in batch],
+    )
+    for i, (m, model) in enumerate(batch):
+        try:
+            predict_match(m, model, prices, i, run_id, odds_map, (fingerprints or {}).get(m["id"]))
+        except Exception as e:
+            print(f"  ❌ ERROR predicting match_id={m.get('id')}: {e}")
 
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        
-        # --- 1. UNDERSTAT HISTORY (za vse lige) ---
-        print("\nSTEP 1: Fetching Understat history for ALL leagues...")
-        for league_name, config in LEAGUES_MAP.items():
-            print(f" -> Processing league: {league_name}")
-            for season in seasons:
-                try:
-                    matches = await retry(lambda: fetch_understat_league_matches(config["understat"], season, session), tries=3, base_sleep=1.0, name=f"understat_{league_name}")
-                    if matches:
-                        print(f"    Fetched {len(matches)} matches for season {season}")
-                    for m in matches:
-                        upsert_match_understat(season, league_name, m)
-                except Exception as e:
-                    print(f"    ❌ ERROR fetching Understat {league_name} season {season}: {e}")
-                    continue
-        print("STEP 1 DONE.")
-
-        # --- 2. FIXTURES & STANDINGS (football-data.org) ---
-        if FOOTBALL_DATA_API_KEY:
-            print("\nSTEP 2: Fetching fixtures & standings from football-data.org...")
-            for league_name, config in LEAGUES_MAP.items():
-                fd_code = config["fd_code"]
-                print(f" -> Processing {league_name} (Code: {fd_code})")
-                
-                # Fixtures
-                try:
-                    fixtures = await fetch_fd_fixtures(fd_code, session, days_ahead=30)
-                    print(f"    Found {len(fixtures)} upcoming fixtures")
-                    for fx in fixtures:
-                        upsert_fixture_fd(fx, league_name)
-                except Exception as e:
-                    print(f"    ❌ ERROR fixtures for {league_name}: {e}")
 
-                # Standings
-                try:
-                    table = await fetch_fd_standings(fd_code, session)
-                    as_of = today.isoformat()
-                    season_int = today.year
-                    rows = []
-                    for r in table:
-                        tname = normalize_team_name((r.get("team") or {}).get("name") or "")
-                        tcanon = canonical_from_alias("football-data", tname)
-                        upsert_alias("football-data", tname, tcanon)
-                        rows.append({
-                            "season": season_int,
-                            "as_of_date": as_of,
-                            "team_name": tcanon,
-                            "position": r.get("position"),
-                            "points": r.get("points"),
-                            "played": r.get("playedGames"),
-                            "goal_diff": r.get("goalDifference"),
-                        })
-                    if rows:
-                        for rr in rows:
-                            sb.table("standings").upsert(rr, on_conflict="season,as_of_date,team_name").execute()
-                except Exception as e:
-                    print(f"    ❌ ERROR standings for {league_name}: {e}")
-            print("STEP 2 DONE.")
-        else:
-            print("STEP 2 SKIP: API key missing.")
-
-        # --- 3. SHOTS DATA (Understat) ---
-        print(f"\nSTEP 3: Import shots for last {SHOTS_IMPORT_LIMIT} finished matches...")
-        finished = (
-            sb.table("matches")
-            .select("id, understat_match_id, home_team, away_team, match_date")
-            .eq("status", "FINISHED")
-            .order("match_date", desc=True)
-            .limit(SHOTS_IMPORT_LIMIT)
-            .execute()
-            .data
-            or []
+# -------------------- Stages --------------------
+async def fetch_fd_league(league_name: str, config: dict, session: aiohttp.ClientSession, today: date):
+    """Fixtures + standings for one league. Standings are queued right away,
+    fixtures are returned and written once Understat matches are flushed."""
+    fd_code = config["fd_code"]
+    fixtures = []
+    try:
+        fixtures = await fetch_fd_fixtures(fd_code, session, today, days_ahead=30)
+        for fx in fixtures:
+            kickoffs.add(config.get("odds_key"), ("fd", fx.get("id") or fx.get("utcDate")), fx.get("utcDate"))
+        print(f"    {league_name} ({fd_code}): found {len(fixtures)} upcoming fixtures")
+    except CacheMiss:
+        raise   # replay brez posnetka: task mora pasti, ne tiho brez fixtures
+    except Exception as e:
+        print(f"    ❌ ERROR fixtures for {league_name}: {e}")
+
+    try:
+        table = await fetch_fd_standings(fd_code, session)
+        as_of = today.isoformat()
+        season_int = today.year
+        for r in table:
+            tname = normalize_team_name((r.get("team") or {}).get("name") or "")
+            tcanon = aliases.resolve("football-data", tname)
+            writes.upsert("standings", {
+                "season": season_int,
+                "as_of_date": as_of,
+                "team_name": tcanon,
+                "position": r.get("position"),
+                "points": r.get("points"),
+                "played": r.get("playedGames"),
+                "goal_diff": r.get("goalDifference"),
+            }, on_conflict="season,as_of_date,team_name")
+    except CacheMiss:
+        raise
+    except Exception as e:
+        print(f"    ❌ ERROR standings for {league_name}: {e}")
+    return fixtures
+
+
+def write_fixtures(fixtures_by_league: dict, today: date):
+    existing_ids = load_match_ids(today.isoformat(), (today + timedelta(days=30)).isoformat())
+    for league_name, fixtures in fixtures_by_league.items():
+        for fx in fixtures or []:
+            upsert_fixture_fd(fx, league_name, existing_ids)
+
+
+async def import_recent_shots(session: aiohttp.ClientSession):
+    print(f"    Shots: checking last {SHOTS_IMPORT_LIMIT} finished matches")
+    imported = []
+    try:
+        candidates, checked = await offload(load_shot_candidates, SHOTS_IMPORT_LIMIT)
+        print(f"    Shots: {checked - len(candidates)} already imported, fetching {len(candidates)} (concurrency {SHOTS_CONCURRENCY})")
+        imported = await import_shots(candidates, session)
+        print(f"    Shots: imported {len(imported)}/{len(candidates)} matches")
+    finally:
+        await offload(flush_stage, "STEP 3 shots")
+    if imported:
+        n = await offload(refresh_match_xg, imported)
+        print(f"    Shots: xG aggregates stored for {n} matches")
+
+
+async def odds_get_json(session: aiohttp.ClientSession, namespace: str, url: str, key: str, cost: int = 1):
+    """The Odds API GET through the cache and odds limiter; the budget file is written in the DB pool."""
+    try:
+        return await http_cache.get_json(session, namespace, url, key=key, limiter=limiters["odds"], cost=cost)
+    finally:
+        if odds_budget.dirty:
+            await offload(odds_budget.save)
+
+
+async def fetch_odds_league(league_name: str, config: dict, session: aiohttp.ClientSession):
+    odds_key = config["odds_key"]
+    try:
+        return await retry(lambda: fetch_odds_totals_25(odds_key, session), tries=3, base_sleep=1.0, name=f"odds_{league_name}")
+    except QuotaExhausted as e:
+        print(f"   SKIP odds for {league_name}: {e}")
+        return []
+
+
+def store_odds(odds_by_league: dict):
+    all_rows = [r for rows in odds_by_league.values() for r in (rows or [])]
+    if not all_rows:
+        return
+    now = datetime.utcnow().isoformat()
+    date_from = min(r["match_date"] for r in all_rows)
+    date_to = max(r["match_date"] for r in all_rows)
+    latest = load_latest_odds(date_from, date_to)
+    # ±1 dan zaradi začetkov okoli polnoči UTC
+    index = load_fixture_index(
+        (date.fromisoformat(date_from) - timedelta(days=1)).isoformat(),
+        (date.fromisoformat(date_to) + timedelta(days=1)).isoformat(),
+    )
+    seen_ids = []
+    unlinked = []
+    try:
+        for league_name, odds_rows in odds_by_league.items():
+            odds_rows = odds_rows or []
+            league_unlinked = link_odds_rows(odds_rows, index)
+            unlinked.extend(league_unlinked)
+            changed = sum(1 for r in odds_rows if store_odds_snapshot(r, latest, seen_ids, now))
+            print(f"    {league_name}: {len(odds_rows)} odds, {changed} changed stored, {len(odds_rows) - changed} unchanged (Linked to matches: {len(odds_rows) - len(league_unlinked)})")
+        touch_odds_last_seen(seen_ids, now)
+
+        linked = len(all_rows) - len(unlinked)
+        print(f"    Odds linking: {linked}/{len(all_rows)} events linked ({linked / len(all_rows) * 100:.0f}%)")
+        for r in unlinked[:20]:
+            print(f"       unlinked: {r['match_date']} {r['home_team']} vs {r['away_team']}")
+        if len(unlinked) > 20:
+            print(f"       ... and {len(unlinked) - 20} more")
+    finally:
+        flush_stage("STEP 4 odds")
+
+
+class LiveOddsState:
+    """Latest stored snapshots and the fixture index for the live window, kept
+    between polls so a poll only costs the fetch and the changed rows."""
+
+    def __init__(self):
+        self.window = None
+        self.latest = {}
+        self.index = None
+
+    def load(self, dates: set):
+        date_from, date_to = min(dates), max(dates)
+        self.latest = load_latest_odds(date_from, date_to)
+        self.index = load_fixture_index(
+            (date.fromisoformat(date_from) - timedelta(days=1)).isoformat(),
+            (date.fromisoformat(date_to) + timedelta(days=1)).isoformat(),
         )
+        self.window = (date_from, date_to)
+
+    def store(self, rows: list) -> int:
+        """Queue changed prices as one batch, bump last_seen_at of the rest; returns rows stored."""
+        dates = {r["match_date"] for r in rows}
+        if not dates:
+            return 0
+        if self.window is None or min(dates) < self.window[0] or max(dates) > self.window[1]:
+            self.load(dates)
+        now = datetime.utcnow().isoformat()
+        seen_ids = []
+        link_odds_rows(rows, self.index)
+        changed = sum(1 for r in rows if store_odds_snapshot(r, self.latest, seen_ids, now))
+        try:
+            touch_odds_last_seen(seen_ids, now)
+        finally:
+            flush_aliases()   # aliasi, ki jih je ustvaril link_odds_rows
+            writes.flush()
+        return changed
+
+
+# daemon: (history, as_of, fits) - za isto zgodovino se Dixon-Coles ne fitta znova
+dc_fit_cache = None
+
+
+def load_fits(history: MatchHistory, as_of: date) -> dict:
+    global dc_fit_cache
+    if history_cache is not None and dc_fit_cache and dc_fit_cache[0] is history and dc_fit_cache[1] == as_of:
+        print("    Dixon-Coles: history unchanged, reusing this process's fits")
+        return dc_fit_cache[2]
+    fits = fit_dixon_coles(history, as_of)
+    if history_cache is not None:
+        dc_fit_cache = (history, as_of, fits)
+    return fits
 
-        for m in finished:
-            db_match_id = m["id"]
-            # Preverimo, če že imamo shote
-            existing = sb.table("shots").select("id").eq("match_id", db_match_id).limit(1).execute().data
-            if existing:
-                continue
-            
-            understat_id = m.get("understat_match_id")
-            if not understat_id:
-                continue
-            
-            try:
-                # Malo pavze da ne ubijemo API-ja
-                # await asyncio.sleep(0.2) 
-                shots_json = await retry(lambda: fetch_match_shots_understat(understat_id, session), tries=3, base_sleep=1.0, name="shots")
-                store_shots(db_match_id, shots_json, m["home_team"], m["away_team"])
-            except Exception as e:
-                print(f"  ❌ ERROR shots id={understat_id}: {e}")
-        print("STEP 3 DONE.")
-
-        # --- 4. ODDS SNAPSHOTS ---
-        if ODDS_PROVIDER and ODDS_API_KEY:
-            print(f"\nSTEP 4: Fetching Odds ({ODDS_PROVIDER})...")
-            
-            for league_name, config in LEAGUES_MAP.items():
-                odds_key = config["odds_key"]
-                try:
-                    odds_rows = await retry(lambda: fetch_odds_totals_25(odds_key, session), tries=3, base_sleep=1.0, name=f"odds_{league_name}")
-                    
-                    linked_count = 0
-                    for r in odds_rows:
-                        if r.get("match_id"):
-                            linked_count += 1
-                        store_odds_snapshot(r)
-                    print(f"    {league_name}: Stored {len(odds_rows)} odds (Linked to matches: {linked_count})")
-                    
-                except Exception as e:
-                    print(f"    ❌ ERROR odds for {league_name}: {e}")
-            print("STEP 4 DONE.")
-        else:
-            print("STEP 4 SKIP: Odds API key missing.")
 
-    # --- 5. PREDICTIONS ---
+def run_predictions(today: date, model: str = PREDICTION_MODEL, force: bool = False):
+    """Predict upcoming fixtures whose input fingerprint changed (all with `force`)."""
+    # run ima svoj buffer: publish čaka samo na svoje vrstice in vidi samo svoje napake
+    token = current_writes.set(WriteBuffer())
+    try:
+        _run_predictions(today, model, force)
+    finally:
+        current_writes.reset(token)
+
+
+def _run_predictions(today: date, model: str, force: bool):
     standings_map = load_latest_standings_map()
     date_from = today.isoformat()
     date_to = (today + timedelta(days=30)).isoformat()
 
     # Najdi tekme za napoved (danes + 30 dni)
-    upcoming = (
-        sb.table("matches")
-        .select("id, match_date, home_team, away_team, status, league")
-        .gte("match_date", date_from)
-        .lte("match_date", date_to)
-        .order("match_date", desc=False)
-        .execute()
-        .data
-        or []
-    )
-    
+    upcoming = db.matches_between(date_from, date_to)
+
     # Če ni prihodnjih tekem, za demo vzemi zadnje končane
-    is_demo = False
     if not upcoming:
-        is_demo = True
-        upcoming = (
-            sb.table("matches")
-            .select("id, match_date, home_team, away_team, status, league")
-            .eq("status", "FINISHED")
-            .order("match_date", desc=True)
-            .limit(PREDICT_FINISHED_DEMO_N)
-            .execute()
-            .data
-            or []
-        )
+        upcoming = db.latest_finished_matches(PREDICT_FINISHED_DEMO_N)
         print(f"\nSTEP 5: Predicting {len(upcoming)} matches (DEMO MODE - last finished)...")
     else:
         print(f"\nSTEP 5: Predicting {len(upcoming)} upcoming matches...")
 
-    for m in upcoming:
+    teams = {m["home_team"] for m in upcoming} | {m["away_team"] for m in upcoming}
+    history = load_match_history(today, teams, LONG_N)
+
+    fits = None
+    if model == "dixon-coles":
+        # fit se shrani v model_fits: iz storage, ne iz (zastarelega) snapshota
+        fits = load_fits(load_finished_matches(today) if history_source else history, today)
+
+    odds_map = load_latest_odds_map(m["id"] for m in upcoming)
+    params = model_params(model)
+    fingerprints = {m["id"]: prediction_fingerprint(m, today, model, params, history, standings_map, odds_map, fits)
+                    for m in upcoming}
+    if not force:
+        stored = db.prediction_fingerprints(list(fingerprints))
+        upcoming = [m for m in upcoming if stored.get(m["id"]) != fingerprints[m["id"]]]
+    print(f"    Inputs changed for {len(upcoming)}/{len(fingerprints)} fixtures{' (--force)' if force else ''}")
+    if not upcoming:
+        print("    Predictions up to date, no run published")
+        flush_stage("STEP 5 predictions")   # model_fits
+        return
+
+    run_id = start_prediction_run(len(upcoming), model)
+    predict_matches(upcoming, today, standings_map, history, run_id, fits, odds_map, fingerprints)
+    publish_prediction_run(run_id)
+
+
+# -------------------- Main --------------------
+def build_pipeline(session: aiohttp.ClientSession, today: date, model: str = PREDICTION_MODEL,
+                   rebuild_features: bool = False, stages=STAGES, odds_leagues=None, force: bool = False) -> TaskGraph:
+    """
+    understat:<league>:<season> ─┐                ┌─> features
+    fd:<league> ─────────────────┼─> matches ─┬─> shots ─────┐
+    odds:<league> ───────────────┼────────────┴─> odds:link ─┼─> predictions
+
+    `stages` picks a subset (history = understat + shots + features, fixtures,
+    odds, predictions) for daemon cycles; `odds_leagues` limits the odds tasks.
+
+    Stages that run concurrently write through their own WriteBuffer, so each
+    stage's flush and report cover only its rows; understat, fd and matches
+    share one (matches flushes what the fetch tasks queued).
+    """
+    seasons = [today.year - 1, today.year]
+    g = TaskGraph(PROVIDER_CONCURRENCY, run_metrics)
+    sync_state = {}
+    sync_writes = WriteBuffer()
+
+    if "history" in stages:
+        async def load_state():
+            sync_state.update(await offload(load_sync_state, "understat"))
+        g.add("understat:state", load_state)
+
+        for league_name, config in LEAGUES_MAP.items():
+            for season in seasons:
+                g.add(f"understat:{league_name}:{season}",
+                      stage_writes(sync_writes, lambda l=league_name, c=config, s=season:
+                                   sync_understat_league(l, c, s, session, sync_state, today)),
+                      deps=["understat:state"], provider="understat")
+
+    if "fixtures" in stages and fd_enabled():
+        for league_name, config in LEAGUES_MAP.items():
+            g.add(f"fd:{league_name}",
+                  stage_writes(sync_writes, lambda l=league_name, c=config: fetch_fd_league(l, c, session, today)),
+                  provider="football-data")
+    elif "fixtures" in stages:
+        print("STEP 2 SKIP: API key missing.")
+
+    if "odds" in stages and odds_enabled():
+        if odds_leagues is None:
+            odds_leagues = list(LEAGUES_MAP)
+        if http_cache.mode != "replay":
+            # budget pred runom: pri nizki kvoti najprej lige z višjo prioriteto
+            odds_leagues, skipped = odds_budget.plan(
+                {l: LEAGUES_MAP[l].get("odds_priority", 1) for l in odds_leagues})
+            for league_name, reason in skipped.items():
+                print(f"STEP 4 SKIP odds for {league_name}: {reason}")
+        for league_name, config in LEAGUES_MAP.items():
+            if league_name not in odds_leagues:
+                continue
+            g.add(f"odds:{league_name}",
+                  lambda l=league_name, c=config: fetch_odds_league(l, c, session),
+                  provider="odds")
+    elif "odds" in stages:
+        print("STEP 4 SKIP: Odds API key missing.")
+
+    # STEP 1 + 2 pisanje: fixtures šele ko so Understat tekme v bazi
+    fd_tasks = g.names("fd:")
+
+    async def matches():
         try:
-            await asyncio.sleep(0.2)
-            predict_match(m, today, standings_map)
-        except Exception as e:
-            print(f"  ❌ ERROR predicting match_id={m.get('id')}: {e}")
+            await offload(flush_stage, "STEP 1 understat")
+            if fd_tasks:
+                await offload(write_fixtures, {n[len("fd:"):]: g.results.get(n) for n in fd_tasks}, today)
+        finally:
+            await offload(flush_stage, "STEP 2 fixtures/standings")
+    g.add("matches", stage_writes(sync_writes, matches), deps=g.names("understat:") + fd_tasks)
+
+    predict_deps = ["odds:link"]
+    if "history" in stages:
+        g.add("shots", stage_writes(WriteBuffer(), lambda: import_recent_shots(session)),
+              deps=["matches"], provider="understat")
+
+        async def team_features():
+            await offload(update_team_features, today, rebuild_features)
+        g.add("features", stage_writes(WriteBuffer(), team_features), deps=["shots"])
+        predict_deps.append("shots")
+
+    odds_tasks = g.names("odds:")
+
+    async def odds_link():
+        await offload(store_odds, {n[len("odds:"):]: g.results.get(n) for n in odds_tasks})
+    g.add("odds:link", stage_writes(WriteBuffer(), odds_link), deps=["matches"] + odds_tasks)
+
+    if "predictions" in stages:
+        async def predictions():
+            await offload(run_predictions, today, model, force)
+        g.add("predictions", predictions, deps=predict_deps)
+    return g
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="DDTips worker: Understat / football-data / odds sync and Over/Under 2.5 predictions."
+    )
+    parser.add_argument(
+        "--http-cache",
+        choices=HTTP_CACHE_MODES,
+        default=HTTP_CACHE_MODE,
+        help="Provider response cache: off, cache (TTL), record (always fetch + store) or replay (offline, recorded responses only).",
+    )
+    parser.add_argument(
+        "--storage",
+        default=STORAGE_URL,
+        help="Storage backend: supabase (default) or sqlite:///<path> for a local database file.",
+    )
+    parser.add_argument(
+        "--model",
+        choices=PREDICTION_MODELS,
+        default=PREDICTION_MODEL,
+        help="Prediction model for this run: form (blended last-N xG) or dixon-coles (per-league MLE team ratings).",
+    )
+    parser.add_argument(
+        "--backfill-match-xg",
+        action="store_true",
+        help="One-off: fill per-match xG / npxG / shot counts on matches from existing shots, then exit.",
+    )
+    parser.add_argument(
+        "--rebuild-features",
+        action="store_true",
+        help="Recompute team_features for every team from scratch instead of only teams with new matches.",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Recompute every prediction, not only fixtures whose input fingerprint "
+             "(form windows, latest odds, standings, model parameters) changed.",
+    )
+    parser.add_argument(
+        "--report",
+        default=RUN_REPORT_PATH,
+        help="Write the JSON run report (per task timings, HTTP / DB counters, retries, memory) here.",
+    )
+    parser.add_argument(
+        "--prom-textfile",
+        default=PROM_TEXTFILE,
+        help="Also write the run metrics as a Prometheus textfile (node_exporter textfile collector).",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="TASK",
+        help="cProfile one pipeline task (e.g. predictions, odds:link, understat:EPL:2025); "
+             f"stats go to {PROFILE_DIR} and the top entries are printed.",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Keep running and refresh each stage on its own schedule: history nightly at DAEMON_HISTORY_HOUR (UTC), "
+             "fixtures/standings every DAEMON_FIXTURES_INTERVAL, odds per league by time to kickoff (DAEMON_ODDS_TIERS).",
+    )
+    parser.add_argument(
+        "--live",
+        action="store_true",
+        help="Poll odds of events in play or starting within LIVE_WINDOW every LIVE_POLL_INTERVAL "
+             "(slower when the odds budget requires) and store changed prices as live snapshots. "
+             "Runs until stopped; combine with --daemon for the scheduled stages.",
+    )
+    parser.add_argument(
+        "--history-snapshot",
+        metavar="DIR",
+        help="Read the finished-match history behind the STEP 5 form windows from a Parquet snapshot "
+             "(snapshot.py export) instead of storage. Results synced in this run are not in it - "
+             "for replays and offline runs. Team features and the Dixon-Coles fit still read storage.",
+    )
+    return parser.parse_args()
+
+
+def report_run(graph: TaskGraph, wall: float, args: argparse.Namespace, **extra):
+    graph.summary(wall)
+    print(f"  {http_cache.stats()}")
+    for limiter in limiters.values():
+        print(f"  rate limit {limiter.stats()}")
+    print(f"  odds budget: {odds_budget.describe()}")
+    report = run_metrics.report(wall, graph.monitor, storage=db.name, model=args.model, http_cache=http_cache.stats(),
+                                rate_limits={n: l.stats() for n, l in limiters.items()},
+                                odds_budget=odds_budget.describe(), **extra)
+    run_metrics.summary(report)
+    metrics.write_json(args.report, report)
+    print(f"  Run report: {args.report}")
+    if args.prom_textfile:
+        metrics.write_prometheus(args.prom_textfile, report)
+        print(f"  Prometheus textfile: {args.prom_textfile}")
+
+
+def due_odds_leagues(next_odds: dict, now: datetime) -> list:
+    return [l for l in LEAGUES_MAP if next_odds.get(l, now) <= now]
+
+
+async def run_daemon(args: argparse.Namespace, session: aiohttp.ClientSession, stop: asyncio.Event):
+    """Run each stage on its own schedule in one long-lived process.
+
+    The HTTP session, alias map, limiters and match history stay in memory;
+    a cycle builds a graph with only the due stages (+ predictions). Odds are
+    scheduled per league from the time to its next kickoff. SIGINT / SIGTERM
+    finish the current cycle and exit.
+    """
+    global history_cache
+    history_cache = {}
+    # odds cache ne sme biti starejši od najkrajšega odds intervala, sicer cikel dobi stare kvote
+    http_cache.ttls["odds"] = min(http_cache.ttls.get("odds", 0), min(i for _, i in DAEMON_ODDS_TIERS) / 2)
+    schedules = {
+        "history": StageSchedule("history", at_hour=DAEMON_HISTORY_HOUR),
+        "fixtures": StageSchedule("fixtures", interval=DAEMON_FIXTURES_INTERVAL),
+    }
+    next_odds = {}   # liga -> naslednji odds refresh (UTC)
+    cycle = 0
+    while not stop.is_set():
+        now = now_utc()
+        stages = {name for name, sch in schedules.items() if sch.due(now)}
+        odds_due = due_odds_leagues(next_odds, now)
+        if odds_due:
+            stages.add("odds")
+        if stages:
+            cycle += 1
+            stages.add("predictions")
+            if stages & {"history", "fixtures"}:
+                history_cache.clear()   # končane tekme / fixtures se lahko spremenijo
+            print(f"\n=== CYCLE {cycle}: {', '.join(s for s in STAGES if s in stages)}"
+                  f"{' (odds: ' + ', '.join(odds_due) + ')' if odds_due else ''} ===")
+            run_metrics.reset()
+            graph = build_pipeline(session, now.date(), args.model, args.rebuild_features and cycle == 1,
+                                   stages=stages, odds_leagues=odds_due, force=args.force and cycle == 1)
+            wall = await graph.run()
+            for name in stages & set(schedules):
+                schedules[name].done(now)
+            done = now_utc()
+            kickoffs.prune(done)
+            for league in odds_due:
+                nk = kickoffs.next_kickoff(LEAGUES_MAP[league].get("odds_key"), done)
+                next_odds[league] = now + timedelta(seconds=odds_interval(DAEMON_ODDS_TIERS, nk, done))
+            report_run(graph, wall, args, cycle=cycle, stages=sorted(stages))
+            print("  next: " + ", ".join(
+                [f"{n} {sch.next_at(done):%H:%M}" for n, sch in schedules.items()] +
+                [f"odds {l} {t:%H:%M}" for l, t in sorted(next_odds.items(), key=lambda kv: kv[1])]))
+
+        now = now_utc()
+        wake = min([sch.next_at(now) for sch in schedules.values()] + list(next_odds.values()) or [now])
+        # najdlje DAEMON_MAX_SLEEP: novi kickoffi lahko prestavijo odds refresh
+        timeout = min(max(0.0, (wake - now).total_seconds()), DAEMON_MAX_SLEEP)
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+    print(f"\nDaemon stopped after {cycle} cycles")
+
+
+def live_poll_interval(credits: int) -> float:
+    """Seconds between live polls: LIVE_POLL_INTERVAL, or slower when the
+    odds budget's hourly rate (LIVE_BUDGET_SHARE of it) can't pay for it."""
+    rate = odds_budget.hourly_rate() * LIVE_BUDGET_SHARE
+    if rate <= 0:
+        return float("inf")
+    return max(LIVE_POLL_INTERVAL, credits * 3600 / rate)
+
+
+async def run_live(args: argparse.Namespace, session: aiohttp.ClientSession, stop: asyncio.Event):
+    """Poll odds of events in play or kicking off within LIVE_WINDOW.
+
+    Leagues without such events are not fetched at all; for the others one
+    request per league asks only for the active events (eventIds). Changed
+    prices are stored as is_live snapshots in one batch per poll.
+    """
+    if not odds_enabled():
+        print("LIVE SKIP: Odds API key missing.")
+        return
+    metrics.current_task.set("live")
+    current_writes.set(WriteBuffer())   # ločeno od stageov daemona
+    calendar = KickoffCalendar()
+    state = LiveOddsState()
+    window = timedelta(seconds=LIVE_WINDOW)
+    next_events = datetime.min.replace(tzinfo=timezone.utc)
+    polls = stored = 0
+    while not stop.is_set():
+        now = now_utc()
+        if now >= next_events:
+            for league, config in LEAGUES_MAP.items():
+                try:
+                    for ev in await fetch_odds_events(config["odds_key"], session):
+                        calendar.add(config["odds_key"], ev.get("id"), ev.get("commence_time"))
+                        kickoffs.add(config["odds_key"], ev.get("id"), ev.get("commence_time"))
+                except Exception as e:
+                    print(f"  ❌ LIVE events {league}: {e}")
+            calendar.prune(now)
+            next_events = now + timedelta(seconds=LIVE_EVENTS_INTERVAL)
+
+        active = {l: ids for l, c in LEAGUES_MAP.items() if (ids := calendar.active(c["odds_key"], now, window))}
+        delay = LIVE_EVENTS_INTERVAL
+        if active:
+            delay = live_poll_interval(len(active))
+            if delay == float("inf"):
+                print(f"  LIVE: odds budget exhausted ({odds_budget.describe()})")
+                delay = LIVE_EVENTS_INTERVAL
+            else:
+                results = await asyncio.gather(
+                    *(fetch_live_odds(LEAGUES_MAP[l]["odds_key"], ids, session) for l, ids in active.items()),
+                    return_exceptions=True)
+                rows = []
+                for league, res in zip(active, results):
+                    if isinstance(res, Exception):
+                        print(f"  ❌ LIVE odds {league}: {res}")
+                    else:
+                        rows.extend(res)
+                n = await offload(state.store, rows)
+                polls += 1
+                stored += n
+                if n:
+                    print(f"  LIVE {now:%H:%M:%S}: {len(rows)} events in {len(active)} leagues, {n} price changes stored")
+        else:
+            nxt = calendar.next_active(now, window)
+            if nxt:
+                delay = min(delay, (nxt - now).total_seconds())
+
+        delay = max(0.0, min(delay, (next_events - now_utc()).total_seconds()))
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+    print(f"\nLive odds stopped: {polls} polls, {stored} price changes stored")
+
+
+def stop_event() -> asyncio.Event:
+    """Event set on SIGINT / SIGTERM: long-running modes finish their cycle and exit."""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass   # Windows
+    return stop
+
+
+def set_run_clock():
+    """record: store the run's start time; replay: run as of the recorded start."""
+    global clock_shift
+    http_cache.save_recorded_at(datetime.now(timezone.utc).isoformat())
+    recorded = http_cache.recorded_at() if http_cache.mode == "replay" else None
+    if recorded:
+        clock_shift = utc(recorded) - datetime.now(timezone.utc)
+        print(f"Replaying responses recorded at {recorded[:19]}Z")
+
+
+async def main(args: argparse.Namespace):
+    global db, history_source
+    db = MeteredStorage(open_storage(args.storage), run_metrics)
+    if args.history_snapshot:
+        history_source = Snapshot(args.history_snapshot)
+    timeout = aiohttp.ClientTimeout(total=60) # Povečan timeout
+    http_cache.mode = args.http_cache
+    set_run_clock()
+    today = now_utc().date()
+    if args.backfill_match_xg:
+        await offload(backfill_match_xg)
+        return
+
+    mode = [m for m in ("daemon", "live") if getattr(args, m)]
+    print(f"=== STARTING WORKER ({', '.join([db.name] + mode)}) ===")
+    print(f"Loaded {await offload(aliases.load)} team aliases")
+
+    if args.profile:
+        run_metrics.enable_profiling(args.profile, PROFILE_DIR)
+
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        if mode:
+            stop = stop_event()
+            await asyncio.gather(*([run_daemon(args, session, stop)] if args.daemon else []),
+                                 *([run_live(args, session, stop)] if args.live else []))
+        else:
+            graph = build_pipeline(session, today, args.model, args.rebuild_features, force=args.force)
+            wall = await graph.run()
+            report_run(graph, wall, args)
 
+    run_metrics.dump_profile()
     print("\n=== WORKER FINISHED SUCCESSFULLY ===")
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main(parse_args()))
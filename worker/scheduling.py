@@ -0,0 +1,124 @@
+"""Refresh schedules for the daemon mode (run.py --daemon).
+
+Every stage has its own cadence instead of the one-shot "everything every run":
+
+  history    Understat sync, shots, team features - once a day at a fixed UTC hour
+  fixtures   football-data fixtures + standings    - every few hours
+  odds       per league, the closer the league's next kickoff, the more often
+             (tiers such as "1h:5m,3h:15m,24h:1h,*:6h")
+
+Kickoff times come from football-data utcDate and The Odds API commence_time
+(matches only store the date) and are kept in memory in a KickoffCalendar.
+The live loop (run.py --live) uses one filled from The Odds API /events to
+find the events that are in play or about to start.
+"""
+
+import re
+from datetime import datetime, timedelta, timezone
+
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+DEFAULT_ODDS_TIERS = "1h:5m,3h:15m,24h:1h,*:6h"
+
+
+def parse_duration(spec: str) -> float:
+    """'90' / '90s' / '15m' / '6h' / '1d' -> seconds."""
+    m = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([smhd]?)\s*", spec or "")
+    if not m:
+        raise ValueError(f"bad duration {spec!r} (expected e.g. 90s, 15m, 6h)")
+    return float(m.group(1)) * _UNITS[m.group(2) or "s"]
+
+
+def parse_tiers(spec: str) -> list:
+    """'1h:5m,24h:1h,*:6h' -> [(3600, 300), (86400, 3600), (inf, 21600)], by horizon."""
+    tiers = []
+    for part in (spec or "").split(","):
+        if not part.strip():
+            continue
+        horizon, _, interval = part.partition(":")
+        h = float("inf") if horizon.strip() == "*" else parse_duration(horizon)
+        tiers.append((h, parse_duration(interval)))
+    if not tiers:
+        raise ValueError(f"no odds refresh tiers in {spec!r}")
+    tiers.sort()
+    if tiers[-1][0] != float("inf"):
+        tiers.append((float("inf"), tiers[-1][1]))   # brez "*": najdaljši interval velja naprej
+    return tiers
+
+
+def utc(ts) -> datetime:
+    """ISO string ('...Z' / '+00:00') or datetime -> aware UTC datetime."""
+    if isinstance(ts, datetime):
+        return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+    return utc(datetime.fromisoformat(str(ts).replace("Z", "+00:00")))
+
+
+class KickoffCalendar:
+    """Upcoming (and running) kickoffs per odds sport key, filled as fixtures and odds arrive."""
+
+    def __init__(self, match_length: timedelta = timedelta(hours=2)):
+        self.match_length = match_length   # po tem času tekma ne šteje več kot v teku
+        self._kickoffs = {}                 # sport key -> {event: kickoff}
+
+    def add(self, key: str, event, kickoff):
+        if key and kickoff:
+            try:
+                self._kickoffs.setdefault(key, {})[event] = utc(kickoff)
+            except ValueError:
+                pass
+
+    def prune(self, now: datetime):
+        for events in self._kickoffs.values():
+            for event in [e for e, k in events.items() if k + self.match_length < now]:
+                del events[event]
+
+    def next_kickoff(self, key: str, now: datetime):
+        """Earliest kickoff that is still upcoming or in play (None when unknown)."""
+        pending = [k for k in self._kickoffs.get(key, {}).values() if k + self.match_length >= now]
+        return min(pending) if pending else None
+
+    def active(self, key: str, now: datetime, window: timedelta) -> list:
+        """Events in play or kicking off within `window`."""
+        return [e for e, k in self._kickoffs.get(key, {}).items() if k - window <= now <= k + self.match_length]
+
+    def next_active(self, now: datetime, window: timedelta):
+        """When the next event of any key enters its `window` (None when nothing is scheduled)."""
+        starts = [k - window for events in self._kickoffs.values() for k in events.values() if k - window > now]
+        return min(starts) if starts else None
+
+    def __len__(self):
+        return sum(len(e) for e in self._kickoffs.values())
+
+
+class StageSchedule:
+    """Interval schedule; with `at_hour` it runs once per UTC day from that hour on."""
+
+    def __init__(self, name: str, interval: float = None, at_hour: int = None):
+        self.name = name
+        self.interval = interval
+        self.at_hour = at_hour
+        self.last = None
+
+    def next_at(self, now: datetime) -> datetime:
+        if self.last is None:
+            return now
+        if self.at_hour is None:
+            return self.last + timedelta(seconds=self.interval)
+        slot = self.last.replace(hour=self.at_hour, minute=0, second=0, microsecond=0)
+        return slot if slot > self.last else slot + timedelta(days=1)
+
+    def due(self, now: datetime) -> bool:
+        return self.next_at(now) <= now
+
+    def done(self, now: datetime):
+        self.last = now
+
+
+def odds_interval(tiers: list, next_kickoff, now: datetime) -> float:
+    """Refresh interval for a league from the time to its next kickoff."""
+    if next_kickoff is None:
+        return tiers[-1][1]
+    to_kickoff = (next_kickoff - now).total_seconds()
+    for horizon, interval in tiers:
+        if to_kickoff <= horizon:
+            return interval
+    return tiers[-1][1]
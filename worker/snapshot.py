@@ -0,0 +1,400 @@
+"""Columnar Parquet snapshot of the betting data, for analysis without the API.
+
+  python snapshot.py export                 # incremental, into .cache/snapshot
+  python snapshot.py export --full --dir /data/ddtips
+  python snapshot.py info
+
+Layout: <dir>/<table>/league=<league>/season=<season>/part.parquet for
+matches, shots, odds_snapshots and predictions (rows without a match go to
+league=_none/season=0); standings have no league, so season=<season> only.
+Every file also carries its league / season columns and reads on its own.
+
+Export is incremental and driven by matches, which are always re-read (one
+narrow table):
+
+  matches, shots    a partition is rewritten only when one of its matches
+                    changed (row hash - the *_xg / *_shots aggregates move
+                    with the shots); shots are fetched for those matches only
+  odds_snapshots    append-only: rows past the exported max id, plus the rows
+                    of changed matches (last_seen_at is current as of the
+                    match's last change)
+  predictions,      small, re-read; a partition file is rewritten only when
+  standings         its content changed
+
+load_table() memory-maps the files (notebooks: load_table("shots").to_pandas());
+finished_matches(), standings_history() and pre_match_odds_history() return
+the same rows as the Storage methods, and Snapshot wraps them for the
+worker's history loading and backtests.
+"""
+
+import os
+import argparse
+import hashlib
+import json
+import shutil
+import time
+from datetime import date, datetime, timezone
+from urllib.parse import quote, unquote
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+
+from storage import DEFAULT_URL as DEFAULT_STORAGE_URL, Storage, open_storage
+
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env"))
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "snapshot")
+MANIFEST = "_manifest.json"
+PART_FILE = "part.parquet"
+NO_LEAGUE = "_none"
+
+TS = pa.timestamp("us", tz="UTC")
+PARTITION = [pa.field("league", pa.string()), pa.field("season", pa.int32())]
+
+SCHEMAS = {
+    "matches": pa.schema([
+        ("id", pa.int64()), ("match_date", pa.date32()), ("home_team", pa.string()), ("away_team", pa.string()),
+        ("home_goals", pa.int32()), ("away_goals", pa.int32()), ("status", pa.string()),
+        ("understat_match_id", pa.string()), ("understat_fp", pa.string()),
+        ("home_xg", pa.float64()), ("away_xg", pa.float64()), ("home_npxg", pa.float64()), ("away_npxg", pa.float64()),
+        ("home_shots", pa.int32()), ("away_shots", pa.int32()), *PARTITION,
+    ]),
+    "shots": pa.schema([
+        ("id", pa.int64()), ("match_id", pa.int64()), ("team_name", pa.string()), ("minute", pa.int32()),
+        ("xg", pa.float64()), ("is_goal", pa.bool_()), ("situation", pa.string()), *PARTITION,
+    ]),
+    "odds_snapshots": pa.schema([
+        ("id", pa.int64()), ("match_id", pa.int64()), ("match_date", pa.date32()),
+        ("home_team", pa.string()), ("away_team", pa.string()), ("market", pa.string()), ("line", pa.float64()),
+        ("is_live", pa.bool_()), ("over_odds", pa.float64()), ("under_odds", pa.float64()), ("bookmaker", pa.string()),
+        ("created_at", TS), ("last_seen_at", TS), *PARTITION,
+    ]),
+    "predictions": pa.schema([
+        ("id", pa.int64()), ("match_id", pa.int64()), ("run_id", pa.int64()),
+        ("lambda_home", pa.float64()), ("lambda_away", pa.float64()), ("p_over_25", pa.float64()), ("p_under_25", pa.float64()),
+        ("report", pa.string()), ("over_odds", pa.float64()), ("under_odds", pa.float64()),
+        ("edge_over", pa.float64()), ("edge_under", pa.float64()), ("value_side", pa.string()),
+        ("markets", pa.string()), ("input_fp", pa.string()), ("created_at", TS), *PARTITION,
+    ]),
+    "standings": pa.schema([
+        ("id", pa.int64()), ("as_of_date", pa.date32()), ("team_name", pa.string()), ("position", pa.int32()),
+        ("points", pa.int32()), ("played", pa.int32()), ("goal_diff", pa.int32()), ("season", pa.int32()),
+    ]),
+}
+TABLES = tuple(SCHEMAS)
+
+
+def _columns(table: str) -> list:
+    """Columns read from storage (league / season come from the match, except on matches and standings)."""
+    own = {"matches": ("league", "season"), "standings": ("season",)}.get(table, ())
+    return [f.name for f in SCHEMAS[table] if f.name not in ("league", "season") or f.name in own]
+
+
+# -------------------- Row conversion --------------------
+def _timestamp(v):
+    if v is None or isinstance(v, datetime):
+        return v
+    dt = datetime.fromisoformat(str(v).replace("Z", "+00:00").replace(" ", "T"))
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def _value(v, typ):
+    if v is None:
+        return None
+    if typ == pa.date32():
+        return v if isinstance(v, date) else date.fromisoformat(str(v)[:10])
+    if typ == TS:
+        return _timestamp(v)
+    if typ == pa.bool_():
+        return bool(v)
+    if typ == pa.string() and isinstance(v, (dict, list)):
+        return json.dumps(v, ensure_ascii=False, sort_keys=True)   # jsonb (markets)
+    return v
+
+
+def to_arrow(table: str, rows: list) -> pa.Table:
+    schema = SCHEMAS[table]
+    return pa.Table.from_pylist([{f.name: _value(r.get(f.name), f.type) for f in schema} for r in rows], schema=schema)
+
+
+def _row_hash(row: dict) -> str:
+    key = json.dumps(row, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+# -------------------- Layout --------------------
+def _part(league, season) -> tuple:
+    return (league or NO_LEAGUE, int(season or 0))
+
+
+def _part_dir(root: str, table: str, part) -> str:
+    if table == "standings":
+        return os.path.join(root, table, f"season={part}")
+    league, season = part
+    return os.path.join(root, table, f"league={quote(league, safe='')}", f"season={season}")
+
+
+def _part_key(table: str, part) -> str:
+    return f"{table}/{part}" if table == "standings" else f"{table}/{part[0]}/{part[1]}"
+
+
+def partition_files(table: str, root: str = SNAPSHOT_DIR, leagues=None, seasons=None) -> list:
+    """Parquet files of `table`, optionally only the given leagues / seasons."""
+    base = os.path.join(root, table)
+    if not os.path.isdir(base):
+        return []
+    leagues = set(leagues) if leagues else None
+    seasons = {int(s) for s in seasons} if seasons else None
+    out = []
+    for dirpath, _, files in os.walk(base):
+        if PART_FILE not in files:
+            continue
+        keys = dict(p.split("=", 1) for p in os.path.relpath(dirpath, base).split(os.sep) if "=" in p)
+        if leagues is not None and unquote(keys.get("league", "")) not in leagues:
+            continue
+        if seasons is not None and int(keys.get("season", 0)) not in seasons:
+            continue
+        out.append(os.path.join(dirpath, PART_FILE))
+    return sorted(out)
+
+
+def _write_part(root: str, table: str, part, data: pa.Table):
+    path = os.path.join(_part_dir(root, table, part), PART_FILE)
+    if data.num_rows == 0:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pq.write_table(data.sort_by("id"), path + ".tmp", compression="zstd")
+    os.replace(path + ".tmp", path)
+
+
+def _read_part(root: str, table: str, part) -> pa.Table:
+    path = os.path.join(_part_dir(root, table, part), PART_FILE)
+    if not os.path.exists(path):
+        return SCHEMAS[table].empty_table()
+    return pq.read_table(path, memory_map=True)
+
+
+def read_manifest(root: str = SNAPSHOT_DIR) -> dict:
+    path = os.path.join(root, MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_manifest(root: str, manifest: dict):
+    path = os.path.join(root, MANIFEST)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(path + ".tmp", path)
+
+
+# -------------------- Export --------------------
+def _export_hashed(store: Storage, root: str, table: str, part_of, old_files: dict, files: dict) -> int:
+    """Re-read a small table; rewrite only partitions whose content hash changed."""
+    parts = {}
+    for r in store.export_rows(table, _columns(table)):
+        parts.setdefault(part_of(r), []).append(r)
+    written = 0
+    for part, rows in parts.items():
+        key = _part_key(table, part)
+        files[key] = _row_hash(rows)
+        if old_files.get(key) != files[key]:
+            _write_part(root, table, part, to_arrow(table, rows))
+            written += 1
+    for key in set(old_files) - set(files):
+        if key.startswith(table + "/"):
+            part = key.split("/")[1:]
+            _write_part(root, table, int(part[0]) if table == "standings" else (part[0], int(part[1])),
+                        SCHEMAS[table].empty_table())
+            written += 1
+    return written
+
+
+def export_snapshot(store: Storage, root: str = SNAPSHOT_DIR, full: bool = False) -> dict:
+    """Bring the snapshot at `root` up to date with storage; returns per-table stats."""
+    t0 = time.perf_counter()
+    os.makedirs(root, exist_ok=True)
+    if full:
+        for table in TABLES:
+            shutil.rmtree(os.path.join(root, table), ignore_errors=True)
+    old = {} if full else read_manifest(root)
+    old_matches = old.get("matches", {})   # id -> [hash, league, season]
+
+    matches = store.export_rows("matches", _columns("matches"))
+    match_part = {m["id"]: _part(m.get("league"), m.get("season")) for m in matches}
+    new_matches = {str(m["id"]): [_row_hash(m), *match_part[m["id"]]] for m in matches}
+
+    changed = {int(i) for i, v in new_matches.items() if old_matches.get(i, [None])[0] != v[0]}
+    removed = {int(i) for i in old_matches if i not in new_matches}
+    dirty = {match_part[i] for i in changed}
+    dirty |= {tuple(old_matches[str(i)][1:]) for i in changed | removed if str(i) in old_matches}
+    stats = {"matches": {"changed": len(changed), "removed": len(removed), "partitions": len(dirty)}}
+
+    # matches: particija je v celoti v pomnilniku
+    by_part = {}
+    for m in matches:
+        m["league"], m["season"] = match_part[m["id"]]
+        by_part.setdefault(match_part[m["id"]], []).append(m)
+    for part in dirty:
+        _write_part(root, "matches", part, to_arrow("matches", by_part.get(part, [])))
+
+    # shots: nespremenjene tekme iz obstoječe datoteke, spremenjene na novo
+    shots = {}
+    for s in store.export_rows("shots", _columns("shots"), match_ids=changed) if changed else []:
+        s["league"], s["season"] = match_part[s["match_id"]]
+        shots.setdefault(match_part[s["match_id"]], []).append(s)
+    for part in dirty:
+        keep = [i for i, p in match_part.items() if p == part and i not in changed]
+        kept = _read_part(root, "shots", part)
+        kept = kept.filter(pc.is_in(kept["match_id"], pa.array(keep, pa.int64())))
+        _write_part(root, "shots", part, pa.concat_tables([kept, to_arrow("shots", shots.get(part, []))]))
+    stats["shots"] = {"fetched": sum(len(v) for v in shots.values()), "partitions": len(dirty)}
+
+    # odds: append-only po id + vrstice spremenjenih tekem
+    max_id = 0 if full else old.get("odds_max_id", 0)
+    fresh = {r["id"]: r for r in store.export_rows("odds_snapshots", _columns("odds_snapshots"), after_id=max_id)}
+    if changed and max_id:
+        fresh.update({r["id"]: r for r in store.export_rows("odds_snapshots", _columns("odds_snapshots"), match_ids=changed)})
+    odds = {}
+    for r in fresh.values():
+        r["league"], r["season"] = match_part.get(r.get("match_id"), _part(None, 0))
+        odds.setdefault((r["league"], r["season"]), []).append(r)
+    fresh_ids = pa.array(list(fresh), pa.int64())
+    for part in set(odds) | dirty:
+        kept = _read_part(root, "odds_snapshots", part)
+        if kept.num_rows:
+            mask = pc.invert(pc.is_in(kept["id"], fresh_ids))
+            if part != _part(None, 0):
+                here = [i for i, p in match_part.items() if p == part]
+                mask = pc.and_(mask, pc.is_in(kept["match_id"], pa.array(here, pa.int64())))
+            kept = kept.filter(mask)
+        _write_part(root, "odds_snapshots", part, pa.concat_tables([kept, to_arrow("odds_snapshots", odds.get(part, []))]))
+    stats["odds_snapshots"] = {"fetched": len(fresh), "partitions": len(set(odds) | dirty)}
+
+    old_files, files = old.get("files", {}), {}
+
+    def prediction_part(r):
+        r["league"], r["season"] = match_part.get(r["match_id"], _part(None, 0))
+        return (r["league"], r["season"])
+
+    stats["predictions"] = {"partitions": _export_hashed(store, root, "predictions", prediction_part, old_files, files)}
+    stats["standings"] = {"partitions": _export_hashed(store, root, "standings", lambda r: int(r.get("season") or 0),
+                                                       old_files, files)}
+
+    _write_manifest(root, {
+        "exported_at": datetime.now(timezone.utc).isoformat(),
+        "storage": store.name,
+        "matches": new_matches,
+        "odds_max_id": max([max_id, *fresh]),
+        "files": files,
+    })
+    stats["seconds"] = round(time.perf_counter() - t0, 2)
+    return stats
+
+
+# -------------------- Load --------------------
+def load_table(table: str, root: str = SNAPSHOT_DIR, leagues=None, seasons=None, columns=None) -> pa.Table:
+    """Memory-mapped read of a snapshot table (all partitions, or the given leagues / seasons)."""
+    files = partition_files(table, root, leagues, seasons)
+    if not files:
+        empty = SCHEMAS[table].empty_table()
+        return empty.select(columns) if columns else empty
+    return pa.concat_tables([pq.read_table(f, columns=columns, memory_map=True) for f in files])
+
+
+def _rows(data: pa.Table) -> list:
+    """Rows as dicts with ISO date strings, like the Storage methods return."""
+    cols = {}
+    for name in data.column_names:
+        col = data[name]
+        if pa.types.is_date(col.type):
+            col = pc.strftime(col, format="%Y-%m-%d")
+        elif pa.types.is_timestamp(col.type):
+            col = pc.strftime(col, format="%Y-%m-%dT%H:%M:%S+00:00")
+        cols[name] = col.to_pylist()
+    names = list(cols)
+    return [dict(zip(names, values)) for values in zip(*cols.values())]
+
+
+def finished_matches(root: str = SNAPSHOT_DIR, before: str = None) -> list:
+    """Same rows as Storage.finished_matches()."""
+    data = load_table("matches", root, columns=[
+        "id", "match_date", "league", "home_team", "away_team", "home_goals", "away_goals", "home_xg", "away_xg", "status"])
+    mask = pc.equal(data["status"], "FINISHED")
+    if before:
+        mask = pc.and_(mask, pc.less(data["match_date"], pa.scalar(date.fromisoformat(before[:10]))))
+    data = data.filter(mask).drop_columns(["status"])
+    return _rows(data.sort_by([("match_date", "ascending"), ("id", "ascending")]))
+
+
+def standings_history(root: str = SNAPSHOT_DIR) -> list:
+    """Same rows as Storage.standings_history()."""
+    data = load_table("standings", root, columns=["team_name", "position", "as_of_date"])
+    return _rows(data.sort_by([("as_of_date", "ascending"), ("team_name", "ascending")]))
+
+
+def pre_match_odds_history(root: str = SNAPSHOT_DIR) -> list:
+    """Same rows as Storage.pre_match_odds_history()."""
+    data = load_table("odds_snapshots", root,
+                      columns=["id", "match_id", "match_date", "over_odds", "under_odds", "created_at", "is_live"])
+    data = data.filter(pc.and_(pc.is_valid(data["match_id"]), pc.invert(data["is_live"]))).drop_columns(["is_live"])
+    return _rows(data.sort_by([("created_at", "ascending"), ("id", "ascending")]))
+
+
+class Snapshot:
+    """A snapshot directory behind the Storage read methods history loading uses
+    (the worker's --history-snapshot, backtest --snapshot)."""
+
+    name = "snapshot"
+
+    def __init__(self, root: str = SNAPSHOT_DIR):
+        self.root = root
+
+    def finished_matches(self, before: str = None) -> list:
+        return finished_matches(self.root, before)
+
+    def standings_history(self) -> list:
+        return standings_history(self.root)
+
+    def pre_match_odds_history(self) -> list:
+        return pre_match_odds_history(self.root)
+
+
+# -------------------- CLI --------------------
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("command", choices=["export", "info"])
+    parser.add_argument("--dir", default=SNAPSHOT_DIR, help="Snapshot directory.")
+    parser.add_argument("--storage", default=os.getenv("STORAGE_URL", DEFAULT_STORAGE_URL),
+                        help="Storage to export from: 'supabase' or 'sqlite:///<path>'.")
+    parser.add_argument("--full", action="store_true", help="Ignore the manifest and re-export everything.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.command == "export":
+        store = open_storage(args.storage)
+        print(f"Exporting {store.name} -> {args.dir}{' (full)' if args.full else ''}...")
+        stats = export_snapshot(store, args.dir, full=args.full)
+        for table in TABLES:
+            print(f"  {table:<15} " + ", ".join(f"{k}={v}" for k, v in stats[table].items()))
+        print(f"Done in {stats['seconds']}s")
+        return
+
+    manifest = read_manifest(args.dir)
+    print(f"Snapshot {args.dir} (exported {manifest.get('exported_at', 'never')} from {manifest.get('storage', '-')})")
+    for table in TABLES:
+        files = partition_files(table, args.dir)
+        rows = sum(pq.ParquetFile(f).metadata.num_rows for f in files)
+        size = sum(os.path.getsize(f) for f in files)
+        print(f"  {table:<15} {rows:>9} rows  {len(files):>4} files  {size / 1e6:8.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+-- Incremental Understat sync (STEP 1): per-match content fingerprint + per-league/season watermark.
+
+alter table matches add column if not exists understat_fp text;
+
+create table if not exists sync_state (
+    source      text        not null,
+    league      text        not null,
+    season      int         not null,
+    watermark   text,                   -- zadnji datetime končane tekme ob syncu
+    match_count int,
+    synced_at   timestamptz not null default now(),
+    primary key (source, league, season)
+);
@@ -0,0 +1,3 @@
+-- Vse linije/trgi iz vektoriziranega pricinga (O/U 0.5-5.5, 1X2, BTTS, Asian totals).
+
+alter table predictions add column if not exists markets jsonb;
@@ -0,0 +1,71 @@
+-- Verzionirani prediction runi: worker zapiše cel run v prediction_history
+-- (en bulk insert, označen z run_id) in ga nato z enim RPC klicem atomarno
+-- objavi v predictions, ki jo berejo bot_v2 in web.
+
+create table if not exists prediction_runs (
+    id           bigserial   primary key,
+    created_at   timestamptz not null default now(),
+    published_at timestamptz,
+    status       text        not null default 'building',  -- building | published | superseded | failed
+    model        text,
+    params       jsonb,
+    fixtures     int
+);
+
+create table if not exists prediction_history (
+    id          bigserial   primary key,
+    run_id      bigint      not null references prediction_runs (id) on delete cascade,
+    match_id    bigint      not null,
+    lambda_home double precision,
+    lambda_away double precision,
+    p_over_25   double precision,
+    p_under_25  double precision,
+    report      text,
+    over_odds   double precision,
+    under_odds  double precision,
+    edge_over   double precision,
+    edge_under  double precision,
+    value_side  text,
+    markets     jsonb,
+    created_at  timestamptz not null default now()
+);
+
+create index if not exists prediction_history_run_idx on prediction_history (run_id);
+create index if not exists prediction_history_match_idx on prediction_history (match_id, run_id);
+
+alter table predictions add column if not exists run_id bigint;
+
+-- Objavi run kot trenutni set (ena transakcija: bralci vidijo star ali nov set,
+-- nikoli manjkajočih vrstic) in pobriši rune starejše od retention okna.
+create or replace function publish_prediction_run(p_run_id bigint, p_retention_days int default 30)
+returns int
+language plpgsql
+as $$
+declare
+    n int;
+begin
+    delete from predictions p
+     using prediction_history h
+     where h.run_id = p_run_id
+       and p.match_id = h.match_id;
+
+    insert into predictions (match_id, run_id, lambda_home, lambda_away, p_over_25, p_under_25, report,
+                             over_odds, under_odds, edge_over, edge_under, value_side, markets)
+    select match_id, run_id, lambda_home, lambda_away, p_over_25, p_under_25, report,
+           over_odds, under_odds, edge_over, edge_under, value_side, markets
+      from prediction_history
+     where run_id = p_run_id;
+    get diagnostics n = row_count;
+
+    update prediction_runs set status = 'superseded'
+     where status = 'published' and id <> p_run_id;
+    update prediction_runs set status = 'published', published_at = now(), fixtures = n
+     where id = p_run_id;
+
+    delete from prediction_runs
+     where id <> p_run_id
+       and created_at < now() - make_interval(days => p_retention_days);
+
+    return n;
+end;
+$$;
@@ -0,0 +1,6 @@
+-- Odds zgodovina samo ob spremembi cene/bookmakerja; nespremenjene linije dobijo last_seen_at.
+
+alter table odds_snapshots add column if not exists last_seen_at timestamptz;
+
+create index if not exists odds_snapshots_event_idx
+    on odds_snapshots (match_date, home_team, away_team, created_at desc);
@@ -0,0 +1,13 @@
+-- Zadnji odds snapshot na tekmo; STEP 5 ga prebere z enim klicem za celo okno napovedi.
+
+create index if not exists odds_snapshots_match_latest_idx
+    on odds_snapshots (match_id, created_at desc, id desc)
+    where match_id is not null;
+
+create or replace view latest_odds as
+select distinct on (match_id)
+       id, match_id, match_date, home_team, away_team, market, line, is_live,
+       over_odds, under_odds, bookmaker, created_at, last_seen_at
+  from odds_snapshots
+ where match_id is not null
+ order by match_id, created_at desc, id desc;
@@ -0,0 +1,16 @@
+-- Parametri fittanih modelov (Dixon-Coles po ligah). Worker ob vsakem runu
+-- doda nov fit; zadnji fit lige je warm start za naslednjega.
+
+create table if not exists model_fits (
+    id         bigserial        primary key,
+    model      text             not null,
+    league     text             not null,
+    as_of      date             not null,
+    params     jsonb            not null,   -- {"teams": {ime: [attack, defence]}, "home_adv", "rho", "xi"}
+    matches    int,
+    log_lik    double precision,
+    fitted_at  timestamptz      not null default now()
+);
+
+create index if not exists model_fits_latest_idx
+    on model_fits (model, league, fitted_at desc);
@@ -0,0 +1,39 @@
+-- Drseča forma po ekipah (worker/features.py): ena vrstica na ekipo in dan
+-- tekme, izračunana po tej tekmi. Forma pred datumom D = zadnja vrstica z
+-- as_of_date < D. Worker jo posodablja inkrementalno (run.py --rebuild-features
+-- jo zgradi na novo).
+
+create table if not exists team_features (
+    team_name           text             not null,
+    as_of_date          date             not null,
+    match_id            bigint,
+    games               int              not null,
+
+    last3_games         int,
+    last3_gf_pm         double precision,
+    last3_ga_pm         double precision,
+    last3_xgf_pm        double precision,
+    last3_xga_pm        double precision,
+    last3_xg_coverage   double precision,
+
+    last10_games        int,
+    last10_gf_pm        double precision,
+    last10_ga_pm        double precision,
+    last10_xgf_pm       double precision,
+    last10_xga_pm       double precision,
+    last10_xg_coverage  double precision,
+
+    ewm_gf_pm           double precision,
+    ewm_ga_pm           double precision,
+    ewm_xgf_pm          double precision,
+    ewm_xga_pm          double precision,
+
+    updated_at          timestamptz      not null default now(),
+    primary key (team_name, as_of_date)
+);
+
+-- trenutna forma vsake ekipe (web)
+create or replace view latest_team_features as
+select distinct on (team_name) *
+  from team_features
+ order by team_name, as_of_date desc;
@@ -0,0 +1,52 @@
+-- xG agregati na tekmo: forma bere eno vrstico matches namesto ~25 shotov.
+-- Worker po vsakem STEP 3 pokliče refresh_match_xg za uvožene tekme;
+-- obstoječe tekme enkrat napolni `python run.py --backfill-match-xg`.
+
+alter table matches add column if not exists home_xg    double precision;
+alter table matches add column if not exists away_xg    double precision;
+alter table matches add column if not exists home_npxg  double precision;
+alter table matches add column if not exists away_npxg  double precision;
+alter table matches add column if not exists home_shots int;
+alter table matches add column if not exists away_shots int;
+
+-- Understat "situation" (OpenPlay, SetPiece, Penalty, ...), za npxG
+alter table shots add column if not exists situation text;
+
+create or replace function refresh_match_xg(p_match_ids bigint[])
+returns int
+language plpgsql
+as $$
+declare
+    n int;
+begin
+    with shot_side as (
+        select s.match_id,
+               s.team_name = m.home_team as is_home,
+               coalesce(s.xg, 0) as xg,
+               -- stari shoti nimajo situation; Understat da vsaki enajstmetrovki enak xG
+               case when s.situation is not null then s.situation = 'Penalty'
+                    else abs(coalesce(s.xg, 0) - 0.7611688375473022) < 1e-6 end as is_penalty
+          from shots s
+          join matches m on m.id = s.match_id
+         where s.match_id = any (p_match_ids)
+    ), agg as (
+        select match_id,
+               coalesce(sum(xg) filter (where is_home), 0)                       as home_xg,
+               coalesce(sum(xg) filter (where not is_home), 0)                   as away_xg,
+               coalesce(sum(xg) filter (where is_home and not is_penalty), 0)     as home_npxg,
+               coalesce(sum(xg) filter (where not is_home and not is_penalty), 0) as away_npxg,
+               count(*) filter (where is_home)                                    as home_shots,
+               count(*) filter (where not is_home)                                as away_shots
+          from shot_side
+         group by match_id
+    )
+    update matches m
+       set home_xg = a.home_xg, away_xg = a.away_xg,
+           home_npxg = a.home_npxg, away_npxg = a.away_npxg,
+           home_shots = a.home_shots, away_shots = a.away_shots
+      from agg a
+     where m.id = a.match_id;
+    get diagnostics n = row_count;
+    return n;
+end;
+$$;
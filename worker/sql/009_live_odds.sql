@@ -0,0 +1,11 @@
+-- Live odds (run.py --live): in-play cene so v odds_snapshots z is_live = true.
+-- STEP 5 napoveduje pred tekmo, zato latest_odds vrne samo pre-match snapshote.
+
+create or replace view latest_odds as
+select distinct on (match_id)
+       id, match_id, match_date, home_team, away_team, market, line, is_live,
+       over_odds, under_odds, bookmaker, created_at, last_seen_at
+  from odds_snapshots
+ where match_id is not null and not coalesce(is_live, false)
+ order by match_id, created_at desc, id desc;
+
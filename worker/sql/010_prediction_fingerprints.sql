@@ -0,0 +1,48 @@
+-- Inkrementalne napovedi: vsaka napoved hrani fingerprint svojih vhodov
+-- (forma obeh ekip, zadnje kvote, vrstica lestvice, parametri modela).
+-- STEP 5 ponovno izračuna samo tekme, ki se jim je fingerprint spremenil;
+-- run objavi samo te tekme, ostale napovedi ostanejo iz prejšnjih runov.
+-- Zato je run "superseded" oz. se po retention oknu pobriše šele, ko mu v
+-- predictions ne ostane nobena vrstica (sicer bi cascade pobrisal provenance
+-- napovedi, ki so še objavljene).
+
+alter table prediction_history add column if not exists input_fp text;
+alter table predictions        add column if not exists input_fp text;
+
+create index if not exists predictions_run_idx on predictions (run_id);
+
+create or replace function publish_prediction_run(p_run_id bigint, p_retention_days int default 30)
+returns int
+language plpgsql
+as $$
+declare
+    n int;
+begin
+    delete from predictions p
+     using prediction_history h
+     where h.run_id = p_run_id
+       and p.match_id = h.match_id;
+
+    insert into predictions (match_id, run_id, lambda_home, lambda_away, p_over_25, p_under_25, report,
+                             over_odds, under_odds, edge_over, edge_under, value_side, markets, input_fp)
+    select match_id, run_id, lambda_home, lambda_away, p_over_25, p_under_25, report,
+           over_odds, under_odds, edge_over, edge_under, value_side, markets, input_fp
+      from prediction_history
+     where run_id = p_run_id;
+    get diagnostics n = row_count;
+
+    update prediction_runs r set status = 'superseded'
+     where r.status = 'published'
+       and r.id <> p_run_id
+       and not exists (select 1 from predictions p where p.run_id = r.id);
+    update prediction_runs set status = 'published', published_at = now(), fixtures = n
+     where id = p_run_id;
+
+    delete from prediction_runs r
+     where r.id <> p_run_id
+       and r.created_at < now() - make_interval(days => p_retention_days)
+       and not exists (select 1 from predictions p where p.run_id = r.id);
+
+    return n;
+end;
+$$;
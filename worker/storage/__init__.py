@@ -0,0 +1,142 @@
+"""Storage backends for the worker, backtest and value bot.
+
+Storage is the set of table operations they actually run - bulk writes plus
+one method per query - so a backend never has to emulate PostgREST. Two
+backends:
+
+  supabase             hosted Postgres via supabase-py (SUPABASE_URL + key)
+  sqlite:///<path>     embedded SQLite file, schema created on open; runs the
+                       whole pipeline, backtests and benchmarks offline
+
+open_storage() picks one from a URL (STORAGE_URL / --storage).
+"""
+
+from abc import ABC, abstractmethod
+
+DEFAULT_URL = "supabase"
+
+
+class Storage(ABC):
+    name = "storage"
+
+    # -------------------- bulk writes (WriteBuffer) --------------------
+    @abstractmethod
+    def upsert(self, table: str, rows: list, on_conflict: str, ignore_duplicates: bool = False):
+        """Insert rows, updating the given columns of rows whose `on_conflict` key exists
+        (or leaving them untouched with ignore_duplicates)."""
+
+    @abstractmethod
+    def insert(self, table: str, rows: list):
+        ...
+
+    @abstractmethod
+    def export_rows(self, table: str, columns: list, match_ids=None, after_id: int = None) -> list:
+        """Raw rows of a table by id (snapshot export); optionally only rows of
+        `match_ids` and/or with id > `after_id`."""
+
+    # -------------------- team_aliases / sync_state --------------------
+    @abstractmethod
+    def team_aliases(self) -> list:
+        """[{source, source_name, canonical_name}]"""
+
+    @abstractmethod
+    def sync_state(self, source: str) -> list:
+        """[{league, season, watermark, match_count}]"""
+
+    # -------------------- matches / shots --------------------
+    @abstractmethod
+    def understat_fingerprints(self, league: str, season: int) -> dict:
+        """understat_match_id -> understat_fp"""
+
+    @abstractmethod
+    def matches_between(self, date_from: str, date_to: str) -> list:
+        """[{id, match_date, home_team, away_team, status, league}] by match_date, id."""
+
+    @abstractmethod
+    def latest_finished_matches(self, limit: int) -> list:
+        """Same columns as matches_between, newest first."""
+
+    @abstractmethod
+    def finished_matches(self, before: str = None) -> list:
+        """[{id, match_date, league, home_team, away_team, home_goals, away_goals, home_xg, away_xg}]
+        oldest first; all of them when `before` is None."""
+
+    @abstractmethod
+    def shot_candidates(self, limit: int) -> list:
+        """Latest `limit` finished Understat matches, newest first:
+        [{id, understat_match_id, home_team, away_team, match_date, shot_count}]"""
+
+    @abstractmethod
+    def finished_understat_match_ids(self) -> list:
+        ...
+
+    @abstractmethod
+    def refresh_match_xg(self, match_ids: list) -> int:
+        """Recompute matches.*_xg / *_npxg / *_shots from shots; returns matches updated."""
+
+    # -------------------- team_features --------------------
+    @abstractmethod
+    def team_feature_rows(self, teams: list, since: str) -> list:
+        """[{team_name, as_of_date, ewm_*_pm}] for `teams` from `since` on, oldest first."""
+
+    @abstractmethod
+    def clear_team_features(self):
+        ...
+
+    # -------------------- standings --------------------
+    @abstractmethod
+    def latest_standings(self, limit: int = 200) -> list:
+        """[{team_name, position, points, played, goal_diff, as_of_date}] newest first."""
+
+    @abstractmethod
+    def standings_history(self) -> list:
+        """[{team_name, position, as_of_date}] oldest first."""
+
+    # -------------------- odds_snapshots --------------------
+    @abstractmethod
+    def odds_snapshots_between(self, date_from: str, date_to: str) -> list:
+        """Snapshots of events in the window, newest first."""
+
+    @abstractmethod
+    def touch_odds_snapshots(self, ids: list, seen_at: str):
+        ...
+
+    @abstractmethod
+    def latest_odds(self, match_ids: list) -> dict:
+        """match_id -> latest snapshot {match_id, over_odds, under_odds, bookmaker, created_at}."""
+
+    @abstractmethod
+    def pre_match_odds_history(self) -> list:
+        """Linked, non-live snapshots {id, match_id, match_date, over_odds, under_odds, created_at}, oldest first."""
+
+    # -------------------- model_fits / prediction runs --------------------
+    @abstractmethod
+    def latest_model_fits(self, model: str) -> dict:
+        """league -> params of the latest fit."""
+
+    @abstractmethod
+    def create_prediction_run(self, row: dict) -> int:
+        ...
+
+    @abstractmethod
+    def set_prediction_run_status(self, run_id: int, status: str):
+        ...
+
+    @abstractmethod
+    def publish_prediction_run(self, run_id: int, retention_days: int) -> int:
+        """Atomically replace the run's matches in predictions; returns rows published."""
+
+    @abstractmethod
+    def prediction_fingerprints(self, match_ids: list) -> dict:
+        """match_id -> input_fp of its published prediction (None for rows from before fingerprints)."""
+
+
+def open_storage(url: str = None) -> Storage:
+    url = url or DEFAULT_URL
+    if url == "supabase":
+        from storage.supabase_backend import SupabaseStorage
+        return SupabaseStorage.from_env()
+    if url.startswith("sqlite:///"):
+        from storage.sqlite_backend import SQLiteStorage
+        return SQLiteStorage(url[len("sqlite:///"):])
+    raise ValueError(f"unknown storage {url!r} (expected 'supabase' or 'sqlite:///<path>')")
@@ -0,0 +1,264 @@
+"""Embedded SQLite backend (stdlib sqlite3, WAL).
+
+One connection shared by the DB threads and the write-behind thread behind a
+lock; every write call is one transaction. Postgres functions (latest_odds,
+refresh_match_xg, publish_prediction_run) are a view and plain SQL here.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+
+from storage import Storage
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sqlite_schema.sql")
+MAX_VARS = 500   # parametri na en IN (...)
+
+PENALTY_XG = 0.7611688375473022   # glej sql/008_match_xg.sql
+
+# stolpci, dodani po prvi verziji sheme: "create table if not exists" jih obstoječi bazi ne doda
+ADDED_COLUMNS = (
+    ("prediction_history", "input_fp", "text"),   # sql/010_prediction_fingerprints.sql
+    ("predictions", "input_fp", "text"),
+)
+
+
+def _chunks(items, size: int = MAX_VARS):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _cell(v):
+    return json.dumps(v, ensure_ascii=False) if isinstance(v, (dict, list)) else v
+
+
+class SQLiteStorage(Storage):
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self.conn.execute("pragma journal_mode = wal")
+            self.conn.execute("pragma synchronous = normal")
+            self.conn.execute("pragma foreign_keys = on")
+            with open(SCHEMA_PATH, encoding="utf-8") as f:
+                self.conn.executescript(f.read())
+            for table, column, type_ in ADDED_COLUMNS:
+                if column not in {r["name"] for r in self.conn.execute(f"pragma table_info({table})")}:
+                    self.conn.execute(f"alter table {table} add column {column} {type_}")
+
+    def _query(self, sql: str, params=()) -> list:
+        with self._lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [dict(r) for r in rows]
+
+    def _write(self, sql: str, params=()) -> int:
+        # total_changes: rowcount je -1 za "with ... update"
+        with self._lock, self.conn:
+            before = self.conn.total_changes
+            self.conn.execute(sql, params)
+            return self.conn.total_changes - before
+
+    # -------------------- bulk writes --------------------
+    def upsert(self, table: str, rows: list, on_conflict: str, ignore_duplicates: bool = False):
+        if not rows:
+            return
+        cols = list(rows[0])
+        keys = [c.strip() for c in on_conflict.split(",")]
+        updates = [c for c in cols if c not in keys]
+        action = "do nothing" if ignore_duplicates or not updates else \
+            "do update set " + ", ".join(f"{c} = excluded.{c}" for c in updates)
+        sql = (f"insert into {table} ({', '.join(cols)}) values ({', '.join('?' * len(cols))}) "
+               f"on conflict ({', '.join(keys)}) {action}")
+        with self._lock, self.conn:
+            self.conn.executemany(sql, [tuple(_cell(r.get(c)) for c in cols) for r in rows])
+
+    def insert(self, table: str, rows: list):
+        if not rows:
+            return
+        cols = list(rows[0])
+        sql = f"insert into {table} ({', '.join(cols)}) values ({', '.join('?' * len(cols))})"
+        with self._lock, self.conn:
+            self.conn.executemany(sql, [tuple(_cell(r.get(c)) for c in cols) for r in rows])
+
+    def export_rows(self, table: str, columns: list, match_ids=None, after_id: int = None) -> list:
+        sql = f"select {', '.join(columns)} from {table} where id > ?"
+        if match_ids is None:
+            return self._query(sql + " order by id", (after_id or 0,))
+        out = []
+        for chunk in _chunks(sorted(set(match_ids))):
+            out.extend(self._query(sql + f" and match_id in ({', '.join('?' * len(chunk))}) order by id",
+                                   (after_id or 0, *chunk)))
+        return out
+
+    # -------------------- team_aliases / sync_state --------------------
+    def team_aliases(self) -> list:
+        return self._query("select source, source_name, canonical_name from team_aliases order by source, source_name")
+
+    def sync_state(self, source: str) -> list:
+        return self._query("select league, season, watermark, match_count from sync_state where source = ?", (source,))
+
+    # -------------------- matches / shots --------------------
+    def understat_fingerprints(self, league: str, season: int) -> dict:
+        rows = self._query(
+            "select understat_match_id, understat_fp from matches "
+            "where league = ? and season = ? and understat_match_id is not null", (league, season))
+        return {str(r["understat_match_id"]): r["understat_fp"] for r in rows}
+
+    def matches_between(self, date_from: str, date_to: str) -> list:
+        return self._query(
+            "select id, match_date, home_team, away_team, status, league from matches "
+            "where match_date >= ? and match_date <= ? order by match_date, id", (date_from, date_to))
+
+    def latest_finished_matches(self, limit: int) -> list:
+        return self._query(
+            "select id, match_date, home_team, away_team, status, league from matches "
+            "where status = 'FINISHED' order by match_date desc, id desc limit ?", (limit,))
+
+    def finished_matches(self, before: str = None) -> list:
+        sql = ("select id, match_date, league, home_team, away_team, home_goals, away_goals, home_xg, away_xg "
+               "from matches where status = 'FINISHED'")
+        if before:
+            return self._query(sql + " and match_date < ? order by match_date, id", (before,))
+        return self._query(sql + " order by match_date, id")
+
+    def shot_candidates(self, limit: int) -> list:
+        return self._query(
+            "select m.id, m.understat_match_id, m.home_team, m.away_team, m.match_date, "
+            "       (select count(*) from shots s where s.match_id = m.id) as shot_count "
+            "  from matches m "
+            " where m.status = 'FINISHED' and m.understat_match_id is not null "
+            " order by m.match_date desc, m.id desc limit ?", (limit,))
+
+    def finished_understat_match_ids(self) -> list:
+        rows = self._query("select id from matches where status = 'FINISHED' and understat_match_id is not null order by id")
+        return [r["id"] for r in rows]
+
+    def refresh_match_xg(self, match_ids: list) -> int:
+        n = 0
+        for chunk in _chunks(sorted(set(match_ids))):
+            n += self._write(f"""
+                with shot_side as (
+                    select s.match_id,
+                           s.team_name = m.home_team as is_home,
+                           coalesce(s.xg, 0) as xg,
+                           case when s.situation is not null then s.situation = 'Penalty'
+                                else abs(coalesce(s.xg, 0) - {PENALTY_XG}) < 1e-6 end as is_penalty
+                      from shots s join matches m on m.id = s.match_id
+                     where s.match_id in ({', '.join('?' * len(chunk))})
+                ), agg as (
+                    select match_id,
+                           coalesce(sum(xg) filter (where is_home), 0)                       as home_xg,
+                           coalesce(sum(xg) filter (where not is_home), 0)                   as away_xg,
+                           coalesce(sum(xg) filter (where is_home and not is_penalty), 0)     as home_npxg,
+                           coalesce(sum(xg) filter (where not is_home and not is_penalty), 0) as away_npxg,
+                           count(*) filter (where is_home)                                    as home_shots,
+                           count(*) filter (where not is_home)                                as away_shots
+                      from shot_side group by match_id
+                )
+                update matches
+                   set home_xg = agg.home_xg, away_xg = agg.away_xg,
+                       home_npxg = agg.home_npxg, away_npxg = agg.away_npxg,
+                       home_shots = agg.home_shots, away_shots = agg.away_shots
+                  from agg
+                 where matches.id = agg.match_id""", chunk)
+        return n
+
+    # -------------------- team_features --------------------
+    def team_feature_rows(self, teams: list, since: str) -> list:
+        out = []
+        for chunk in _chunks(sorted(teams)):
+            out.extend(self._query(
+                "select team_name, as_of_date, ewm_gf_pm, ewm_ga_pm, ewm_xgf_pm, ewm_xga_pm from team_features "
+                f"where team_name in ({', '.join('?' * len(chunk))}) and as_of_date >= ?", (*chunk, since)))
+        out.sort(key=lambda r: (r["as_of_date"], r["team_name"]))
+        return out
+
+    def clear_team_features(self):
+        self._write("delete from team_features")
+
+    # -------------------- standings --------------------
+    def latest_standings(self, limit: int = 200) -> list:
+        return self._query(
+            "select team_name, position, points, played, goal_diff, as_of_date from standings "
+            "order by as_of_date desc limit ?", (limit,))
+
+    def standings_history(self) -> list:
+        return self._query("select team_name, position, as_of_date from standings order by as_of_date, team_name")
+
+    # -------------------- odds_snapshots --------------------
+    def odds_snapshots_between(self, date_from: str, date_to: str) -> list:
+        return self._query(
+            "select id, match_id, match_date, home_team, away_team, market, line, is_live, over_odds, under_odds, bookmaker "
+            "from odds_snapshots where match_date >= ? and match_date <= ? order by created_at desc, id desc",
+            (date_from, date_to))
+
+    def touch_odds_snapshots(self, ids: list, seen_at: str):
+        for chunk in _chunks(ids):
+            self._write(f"update odds_snapshots set last_seen_at = ? where id in ({', '.join('?' * len(chunk))})",
+                        (seen_at, *chunk))
+
+    def latest_odds(self, match_ids: list) -> dict:
+        out = {}
+        for chunk in _chunks(sorted({i for i in match_ids if i})):
+            for r in self._query(
+                    "select match_id, over_odds, under_odds, bookmaker, created_at from latest_odds "
+                    f"where match_id in ({', '.join('?' * len(chunk))})", chunk):
+                out[r["match_id"]] = r
+        return out
+
+    def pre_match_odds_history(self) -> list:
+        return self._query(
+            "select id, match_id, match_date, over_odds, under_odds, created_at from odds_snapshots "
+            "where match_id is not null and not is_live order by created_at, id")
+
+    # -------------------- model_fits / prediction runs --------------------
+    def latest_model_fits(self, model: str) -> dict:
+        out = {}
+        for r in self._query("select league, params from model_fits where model = ? order by fitted_at desc, id desc", (model,)):
+            out.setdefault(r["league"], json.loads(r["params"]))
+        return out
+
+    def create_prediction_run(self, row: dict) -> int:
+        cols = list(row)
+        with self._lock, self.conn:
+            cur = self.conn.execute(
+                f"insert into prediction_runs ({', '.join(cols)}) values ({', '.join('?' * len(cols))})",
+                tuple(_cell(row[c]) for c in cols))
+            return cur.lastrowid
+
+    def set_prediction_run_status(self, run_id: int, status: str):
+        self._write("update prediction_runs set status = ? where id = ?", (status, run_id))
+
+    def publish_prediction_run(self, run_id: int, retention_days: int) -> int:
+        cols = ("match_id, run_id, lambda_home, lambda_away, p_over_25, p_under_25, report, "
+                "over_odds, under_odds, edge_over, edge_under, value_side, markets, input_fp")
+        # isto kot plpgsql publish_prediction_run: ena transakcija
+        with self._lock, self.conn:
+            c = self.conn
+            c.execute("delete from predictions where match_id in (select match_id from prediction_history where run_id = ?)", (run_id,))
+            n = c.execute(f"insert into predictions ({cols}) select {cols} from prediction_history where run_id = ?", (run_id,)).rowcount
+            # run z vrsticami v predictions je še (delno) objavljen: ne superseded, ne brisati
+            owns_none = "not exists (select 1 from predictions p where p.run_id = prediction_runs.id)"
+            c.execute(f"update prediction_runs set status = 'superseded' where status = 'published' and id <> ? and {owns_none}",
+                      (run_id,))
+            c.execute("update prediction_runs set status = 'published', fixtures = ?, "
+                      "published_at = strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now') where id = ?", (n, run_id))
+            c.execute("delete from prediction_runs where id <> ? and created_at < strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now', ?) "
+                      f"and {owns_none}", (run_id, f"-{int(retention_days)} days"))
+        return n
+
+    def prediction_fingerprints(self, match_ids: list) -> dict:
+        out = {}
+        for chunk in _chunks(sorted(set(match_ids))):
+            for r in self._query(f"select match_id, input_fp from predictions where match_id in ({', '.join('?' * len(chunk))})",
+                                 chunk):
+                out[r["match_id"]] = r["input_fp"]
+        return out
@@ -0,0 +1,180 @@
+-- Lokalna SQLite shema: iste tabele in ključi kot v Supabase (worker/sql/*),
+-- v SQLite dialektu. jsonb stolpci so TEXT z JSON, boolean 0/1.
+
+create table if not exists matches (
+    id                 integer primary key autoincrement,
+    season             integer,
+    match_date         text,
+    league             text,
+    home_team          text,
+    away_team          text,
+    home_goals         integer,
+    away_goals         integer,
+    status             text,
+    understat_match_id text unique,
+    understat_fp       text,
+    home_xg            real,
+    away_xg            real,
+    home_npxg          real,
+    away_npxg          real,
+    home_shots         integer,
+    away_shots         integer
+);
+create index if not exists matches_date_idx on matches (match_date);
+create index if not exists matches_status_date_idx on matches (status, match_date);
+
+create table if not exists shots (
+    id        integer primary key autoincrement,
+    match_id  integer not null,
+    team_name text,
+    minute    integer,
+    xg        real,
+    is_goal   integer,
+    situation text
+);
+create index if not exists shots_match_idx on shots (match_id);
+
+create table if not exists team_aliases (
+    source         text not null,
+    source_name    text not null,
+    canonical_name text,
+    primary key (source, source_name)
+);
+
+create table if not exists sync_state (
+    source      text    not null,
+    league      text    not null,
+    season      integer not null,
+    watermark   text,
+    match_count integer,
+    synced_at   text,
+    primary key (source, league, season)
+);
+
+create table if not exists standings (
+    id         integer primary key autoincrement,
+    season     integer,
+    as_of_date text,
+    team_name  text,
+    position   integer,
+    points     integer,
+    played     integer,
+    goal_diff  integer,
+    unique (season, as_of_date, team_name)
+);
+
+create table if not exists odds_snapshots (
+    id           integer primary key autoincrement,
+    match_id     integer,
+    match_date   text,
+    home_team    text,
+    away_team    text,
+    market       text,
+    line         real,
+    is_live      integer,
+    over_odds    real,
+    under_odds   real,
+    bookmaker    text,
+    created_at   text not null default (strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now')),
+    last_seen_at text
+);
+create index if not exists odds_snapshots_event_idx on odds_snapshots (match_date, home_team, away_team);
+create index if not exists odds_snapshots_match_latest_idx on odds_snapshots (match_id, created_at desc, id desc);
+
+-- samo pre-match (sql/009_live_odds.sql); drop, da obstoječe baze dobijo nov filter
+drop view if exists latest_odds;
+create view latest_odds as
+select id, match_id, match_date, home_team, away_team, market, line, is_live,
+       over_odds, under_odds, bookmaker, created_at, last_seen_at
+  from (select o.*, row_number() over (partition by match_id order by created_at desc, id desc) as rn
+          from odds_snapshots o
+         where match_id is not null and not coalesce(is_live, 0))
+ where rn = 1;
+
+create table if not exists prediction_runs (
+    id           integer primary key autoincrement,
+    created_at   text not null default (strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now')),
+    published_at text,
+    status       text not null default 'building',
+    model        text,
+    params       text,
+    fixtures     integer
+);
+
+create table if not exists prediction_history (
+    id          integer primary key autoincrement,
+    run_id      integer not null references prediction_runs (id) on delete cascade,
+    match_id    integer not null,
+    lambda_home real,
+    lambda_away real,
+    p_over_25   real,
+    p_under_25  real,
+    report      text,
+    over_odds   real,
+    under_odds  real,
+    edge_over   real,
+    edge_under  real,
+    value_side  text,
+    markets     text,
+    input_fp    text,
+    created_at  text not null default (strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now'))
+);
+create index if not exists prediction_history_run_idx on prediction_history (run_id);
+
+create table if not exists predictions (
+    id          integer primary key autoincrement,
+    match_id    integer not null,
+    run_id      integer,
+    lambda_home real,
+    lambda_away real,
+    p_over_25   real,
+    p_under_25  real,
+    report      text,
+    over_odds   real,
+    under_odds  real,
+    edge_over   real,
+    edge_under  real,
+    value_side  text,
+    markets     text,
+    input_fp    text,
+    created_at  text not null default (strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now'))
+);
+create index if not exists predictions_match_idx on predictions (match_id);
+create index if not exists predictions_run_idx on predictions (run_id);
+
+create table if not exists model_fits (
+    id        integer primary key autoincrement,
+    model     text not null,
+    league    text not null,
+    as_of     text not null,
+    params    text not null,
+    matches   integer,
+    log_lik   real,
+    fitted_at text not null default (strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now'))
+);
+create index if not exists model_fits_latest_idx on model_fits (model, league, fitted_at desc);
+
+create table if not exists team_features (
+    team_name          text    not null,
+    as_of_date         text    not null,
+    match_id           integer,
+    games              integer not null,
+    last3_games        integer,
+    last3_gf_pm        real,
+    last3_ga_pm        real,
+    last3_xgf_pm       real,
+    last3_xga_pm       real,
+    last3_xg_coverage  real,
+    last10_games       integer,
+    last10_gf_pm       real,
+    last10_ga_pm       real,
+    last10_xgf_pm      real,
+    last10_xga_pm      real,
+    last10_xg_coverage real,
+    ewm_gf_pm          real,
+    ewm_ga_pm          real,
+    ewm_xgf_pm         real,
+    ewm_xga_pm         real,
+    updated_at         text not null default (strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now')),
+    primary key (team_name, as_of_date)
+);
@@ -0,0 +1,279 @@
+"""Supabase (PostgREST) backend. Responses are capped at 1000 rows, so list
+queries page with fetch_all(); id filters go in chunks to keep URLs short."""
+
+import os
+
+from supabase import create_client
+
+from storage import Storage
+
+
+def fetch_all(build_query, page_size: int = 1000, limit: int = None):
+    """Page through a select query (PostgREST caps responses at 1000 rows)."""
+    out = []
+    start = 0
+    while True:
+        size = page_size if limit is None else min(page_size, limit - len(out))
+        if size <= 0:
+            return out
+        rows = build_query().range(start, start + size - 1).execute().data or []
+        out.extend(rows)
+        if len(rows) < size:
+            return out
+        start += size
+
+
+def _chunks(items, size: int):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class SupabaseStorage(Storage):
+    name = "supabase"
+
+    def __init__(self, client):
+        # postgrest client deli en httpx.Client (keep-alive pool) med vsemi threadi
+        self.client = client
+
+    @classmethod
+    def from_env(cls):
+        url = os.getenv("SUPABASE_URL")
+        key = os.getenv("SUPABASE_SERVICE_ROLE_KEY") or os.getenv("SUPABASE_KEY")  # Podpora za oba imena
+        if not url or not key:
+            raise RuntimeError("Missing SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY in .env")
+        return cls(create_client(url, key))
+
+    def table(self, name: str):
+        return self.client.table(name)
+
+    # -------------------- bulk writes --------------------
+    def upsert(self, table: str, rows: list, on_conflict: str, ignore_duplicates: bool = False):
+        self.table(table).upsert(rows, on_conflict=on_conflict, ignore_duplicates=ignore_duplicates).execute()
+
+    def insert(self, table: str, rows: list):
+        self.table(table).insert(rows).execute()
+
+    def export_rows(self, table: str, columns: list, match_ids=None, after_id: int = None) -> list:
+        def query(chunk=None):
+            q = self.table(table).select(", ".join(columns))
+            if chunk is not None:
+                q = q.in_("match_id", chunk)
+            if after_id is not None:
+                q = q.gt("id", after_id)
+            return q.order("id", desc=False)
+
+        if match_ids is None:
+            return fetch_all(query)
+        out = []
+        for chunk in _chunks(sorted(set(match_ids)), 200):
+            out.extend(fetch_all(lambda: query(chunk)))
+        return out
+
+    # -------------------- team_aliases / sync_state --------------------
+    def team_aliases(self) -> list:
+        return fetch_all(lambda: (
+            self.table("team_aliases")
+            .select("source, source_name, canonical_name")
+            .order("source", desc=False)
+            .order("source_name", desc=False)
+        ))
+
+    def sync_state(self, source: str) -> list:
+        return self.table("sync_state").select("league, season, watermark, match_count").eq("source", source).execute().data or []
+
+    # -------------------- matches / shots --------------------
+    def understat_fingerprints(self, league: str, season: int) -> dict:
+        rows = fetch_all(lambda: (
+            self.table("matches")
+            .select("understat_match_id, understat_fp")
+            .eq("league", league)
+            .eq("season", season)
+            .not_.is_("understat_match_id", "null")
+            .order("id", desc=False)
+        ))
+        return {str(r["understat_match_id"]): r.get("understat_fp") for r in rows}
+
+    def matches_between(self, date_from: str, date_to: str) -> list:
+        return fetch_all(lambda: (
+            self.table("matches")
+            .select("id, match_date, home_team, away_team, status, league")
+            .gte("match_date", date_from)
+            .lte("match_date", date_to)
+            .order("match_date", desc=False)
+            .order("id", desc=False)
+        ))
+
+    def latest_finished_matches(self, limit: int) -> list:
+        return (
+            self.table("matches")
+            .select("id, match_date, home_team, away_team, status, league")
+            .eq("status", "FINISHED")
+            .order("match_date", desc=True)
+            .limit(limit)
+            .execute()
+            .data
+            or []
+        )
+
+    def finished_matches(self, before: str = None) -> list:
+        def query():
+            q = (
+                self.table("matches")
+                .select("id, match_date, league, home_team, away_team, home_goals, away_goals, home_xg, away_xg")
+                .eq("status", "FINISHED")
+            )
+            if before:
+                q = q.lt("match_date", before)
+            return q.order("match_date", desc=False).order("id", desc=False)
+        return fetch_all(query)
+
+    def shot_candidates(self, limit: int) -> list:
+        # število shotov pride kot embedded count, brez dodatnega klica na tekmo
+        rows = fetch_all(lambda: (
+            self.table("matches")
+            .select("id, understat_match_id, home_team, away_team, match_date, shots(count)")
+            .eq("status", "FINISHED")
+            .not_.is_("understat_match_id", "null")
+            .order("match_date", desc=True)
+            .order("id", desc=True)
+        ), limit=limit)
+        for m in rows:
+            counts = m.pop("shots", None) or [{}]
+            m["shot_count"] = counts[0].get("count") or 0
+        return rows
+
+    def finished_understat_match_ids(self) -> list:
+        rows = fetch_all(lambda: (
+            self.table("matches")
+            .select("id")
+            .eq("status", "FINISHED")
+            .not_.is_("understat_match_id", "null")
+            .order("id", desc=False)
+        ))
+        return [r["id"] for r in rows]
+
+    def refresh_match_xg(self, match_ids: list) -> int:
+        n = 0
+        for chunk in _chunks(sorted(set(match_ids)), 1000):
+            n += self.client.rpc("refresh_match_xg", {"p_match_ids": chunk}).execute().data or 0
+        return n
+
+    # -------------------- team_features --------------------
+    def team_feature_rows(self, teams: list, since: str) -> list:
+        out = []
+        for chunk in _chunks(sorted(teams), 100):
+            out.extend(fetch_all(lambda: (
+                self.table("team_features")
+                .select("team_name, as_of_date, ewm_gf_pm, ewm_ga_pm, ewm_xgf_pm, ewm_xga_pm")
+                .in_("team_name", chunk)
+                .gte("as_of_date", since)
+                .order("as_of_date", desc=False)
+                .order("team_name", desc=False)
+            )))
+        out.sort(key=lambda r: (str(r["as_of_date"]), r["team_name"]))
+        return out
+
+    def clear_team_features(self):
+        self.table("team_features").delete().neq("team_name", "").execute()
+
+    # -------------------- standings --------------------
+    def latest_standings(self, limit: int = 200) -> list:
+        return (
+            self.table("standings")
+            .select("team_name, position, points, played, goal_diff, as_of_date")
+            .order("as_of_date", desc=True)
+            .limit(limit)
+            .execute()
+            .data
+            or []
+        )
+
+    def standings_history(self) -> list:
+        return fetch_all(lambda: (
+            self.table("standings")
+            .select("team_name, position, as_of_date")
+            .order("as_of_date", desc=False)
+            .order("team_name", desc=False)
+        ))
+
+    # -------------------- odds_snapshots --------------------
+    def odds_snapshots_between(self, date_from: str, date_to: str) -> list:
+        return fetch_all(lambda: (
+            self.table("odds_snapshots")
+            .select("id, match_id, match_date, home_team, away_team, market, line, is_live, over_odds, under_odds, bookmaker")
+            .gte("match_date", date_from)
+            .lte("match_date", date_to)
+            .order("created_at", desc=True)
+            .order("id", desc=True)
+        ))
+
+    def touch_odds_snapshots(self, ids: list, seen_at: str):
+        for chunk in _chunks(ids, 200):
+            self.table("odds_snapshots").update({"last_seen_at": seen_at}).in_("id", chunk).execute()
+
+    def latest_odds(self, match_ids: list) -> dict:
+        out = {}
+        for chunk in _chunks(sorted({i for i in match_ids if i}), 300):
+            rows = (
+                self.table("latest_odds")
+                .select("match_id, over_odds, under_odds, bookmaker, created_at")
+                .in_("match_id", chunk)
+                .execute()
+                .data
+                or []
+            )
+            for r in rows:
+                out[r["match_id"]] = r
+        return out
+
+    def pre_match_odds_history(self) -> list:
+        return fetch_all(lambda: (
+            self.table("odds_snapshots")
+            .select("id, match_id, match_date, over_odds, under_odds, created_at")
+            .not_.is_("match_id", "null")
+            .eq("is_live", False)
+            .order("created_at", desc=False)
+            .order("id", desc=False)
+        ))
+
+    # -------------------- model_fits / prediction runs --------------------
+    def latest_model_fits(self, model: str) -> dict:
+        rows = (
+            self.table("model_fits")
+            .select("league, params")
+            .eq("model", model)
+            .order("fitted_at", desc=True)
+            .limit(50)
+            .execute()
+            .data
+            or []
+        )
+        out = {}
+        for r in rows:
+            out.setdefault(r["league"], r["params"])
+        return out
+
+    def create_prediction_run(self, row: dict) -> int:
+        return self.table("prediction_runs").insert(row).execute().data[0]["id"]
+
+    def set_prediction_run_status(self, run_id: int, status: str):
+        self.table("prediction_runs").update({"status": status}).eq("id", run_id).execute()
+
+    def publish_prediction_run(self, run_id: int, retention_days: int) -> int:
+        return self.client.rpc("publish_prediction_run", {"p_run_id": run_id, "p_retention_days": retention_days}).execute().data
+
+    def prediction_fingerprints(self, match_ids: list) -> dict:
+        out = {}
+        for chunk in _chunks(sorted(set(match_ids)), 300):
+            rows = (
+                self.table("predictions")
+                .select("match_id, input_fp")
+                .in_("match_id", chunk)
+                .execute()
+                .data
+                or []
+            )
+            for r in rows:
+                out[r["match_id"]] = r["input_fp"]
+        return out
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# testi uvažajo module workerja kot run.py (PYTHONPATH=worker)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+from scipy.optimize import approx_fprime
+
+import dixon_coles
+
+
+def synthetic_job(n_teams=8, rounds=12, home_adv=0.3, seed=3):
+    rng = np.random.default_rng(seed)
+    att = rng.normal(0, 0.3, n_teams)
+    att -= att.mean()
+    dfn = rng.normal(0, 0.2, n_teams)
+    home, away = [], []
+    for _ in range(rounds):
+        for h in range(n_teams):
+            for a in range(n_teams):
+                if h != a:
+                    home.append(h)
+                    away.append(a)
+    home, away = np.array(home), np.array(away)
+    hg = rng.poisson(np.exp(att[home] + dfn[away] + home_adv)).astype(float)
+    ag = rng.poisson(np.exp(att[away] + dfn[home])).astype(float)
+    job = {
+        "league": "L", "as_of": 0, "teams": [f"T{i}" for i in range(n_teams)],
+        "home": home, "away": away, "hg": hg, "ag": ag,
+        "w": np.exp(-0.002 * rng.integers(0, 700, len(home))), "xi": 0.002, "warm": None,
+    }
+    return job, att
+
+
+def masks(job):
+    hg, ag = job["hg"], job["ag"]
+    return (hg == 0) & (ag == 0), (hg == 0) & (ag == 1), (hg == 1) & (ag == 0), (hg == 1) & (ag == 1)
+
+
+def test_gradient_matches_finite_differences():
+    job, _ = synthetic_job()
+    rng = np.random.default_rng(0)
+    n = len(job["teams"])
+    theta = np.concatenate([rng.normal(0, 0.2, 2 * n), [0.25, -0.08]])
+    args = (job["home"], job["away"], job["hg"], job["ag"], job["w"], masks(job))
+
+    _, grad = dixon_coles._neg_log_lik(theta, *args)
+    numeric = approx_fprime(theta, lambda t: dixon_coles._neg_log_lik(t, *args)[0], 1e-6)
+    np.testing.assert_allclose(grad, numeric, rtol=1e-4, atol=1e-3)
+
+
+def test_fit_recovers_home_advantage_and_ratings():
+    job, att = synthetic_job(rounds=20)
+    fit = dixon_coles.fit_league(job)
+    assert fit["converged"]
+    assert fit["home_adv"] == pytest.approx(0.3, abs=0.08)
+    fitted = np.array([fit["teams"][t][0] for t in job["teams"]])
+    assert np.corrcoef(fitted, att)[0, 1] > 0.9
+    assert abs(fitted.sum()) < 1e-2                 # kazen drži sum(attack) = 0
+
+
+def test_warm_start_converges_to_same_fit():
+    job, _ = synthetic_job()
+    cold = dixon_coles.fit_league(job)
+    warm = dixon_coles.fit_league({**job, "warm": cold})
+    assert warm["warm_start"]
+    assert warm["iterations"] <= cold["iterations"]
+    assert warm["log_lik"] == pytest.approx(cold["log_lik"], abs=1e-4)
+
+
+def test_lambdas_treat_unknown_team_as_average():
+    fit = {"teams": {"A": [0.2, -0.1]}, "home_adv": 0.25, "rho": 0.0}
+    lam_home, lam_away = dixon_coles.lambdas(fit, "A", "Promoted")
+    assert lam_home == pytest.approx(np.exp(0.2 + 0.25))
+    assert lam_away == pytest.approx(np.exp(-0.1))
+
+
+def test_fit_leagues_in_process_pool_matches_serial():
+    jobs = [{**synthetic_job(seed=s)[0], "league": f"L{s}"} for s in (1, 2)]
+    serial = dixon_coles.fit_leagues(jobs, workers=1)
+    pooled = dixon_coles.fit_leagues(jobs, workers=2)
+    assert set(pooled) == {"L1", "L2"}
+    for league in serial:
+        assert pooled[league]["log_lik"] == pytest.approx(serial[league]["log_lik"])
@@ -0,0 +1,106 @@
+from datetime import date, timedelta
+
+import pytest
+
+import run
+from history import MatchHistory
+from storage.sqlite_backend import SQLiteStorage
+
+TODAY = date(2025, 3, 1)
+TEAMS = ["A", "B", "C", "D"]
+
+
+def history():
+    h = MatchHistory()
+    mid = 0
+    for k in range(12):
+        for home, away in (("A", "B"), ("C", "D")):
+            mid += 1
+            h.add(mid, (TODAY - timedelta(days=7 * (12 - k))).isoformat(), home, away, k % 3, k % 2, "L")
+    h.finalize()
+    return h
+
+
+def fp(match_row, h, standings=None, odds=None, fits=None, as_of=TODAY, params=None):
+    return run.prediction_fingerprint(match_row, as_of, "form", params or {"n": 5}, h, standings or {}, odds or {},
+                                      fits)
+
+
+def test_fingerprint_tracks_inputs():
+    h = history()
+    m = {"id": 100, "match_date": "2025-03-02", "league": "L", "home_team": "A", "away_team": "B"}
+    base = fp(m, h)
+    assert fp(m, h) == base
+    assert fp(m, h, odds={100: {"over_odds": 1.9, "under_odds": 1.9}}) != base
+    assert fp(m, h, odds={101: {"over_odds": 1.9, "under_odds": 1.9}}) == base       # kvote druge tekme
+    assert fp(m, h, standings={"A": {"position": 1, "points": 3}}) != base
+    assert fp(m, h, params={"n": 6}) != base
+    # nova tekma ekipe A spremeni njeno okno, tekma C-D se A ne tiče
+    h.add(999, (TODAY - timedelta(days=1)).isoformat(), "A", "C", 2, 2, "L")
+    h.finalize()
+    assert fp(m, h) != base
+    other = {"id": 101, "match_date": "2025-03-02", "league": "L", "home_team": "B", "away_team": "D"}
+    assert fp(other, h) == fp(other, history())
+
+
+def test_fingerprint_ignores_as_of_without_new_matches():
+    h = history()
+    m = {"id": 100, "match_date": "2025-03-09", "league": "L", "home_team": "A", "away_team": "B"}
+    assert fp(m, h, as_of=TODAY) == fp(m, h, as_of=TODAY + timedelta(days=3))
+
+
+def test_fingerprint_ignores_refit_noise():
+    h = history()
+    m = {"id": 100, "match_date": "2025-03-02", "league": "L", "home_team": "A", "away_team": "B"}
+    fit = {"teams": {"A": [0.1, -0.2], "B": [0.0, 0.1]}, "home_adv": 0.3, "rho": -0.05}
+    noisy = {**fit, "teams": {"A": [0.1 + 1e-6, -0.2], "B": [0.0, 0.1]}}
+    moved = {**fit, "teams": {"A": [0.15, -0.2], "B": [0.0, 0.1]}}
+    assert fp(m, h, fits={"L": fit}) == fp(m, h, fits={"L": noisy})
+    assert fp(m, h, fits={"L": fit}) != fp(m, h, fits={"L": moved})
+
+
+@pytest.fixture
+def db(monkeypatch, tmp_path):
+    db = SQLiteStorage(str(tmp_path / "p.db"))
+    monkeypatch.setattr(run, "db", db)
+    rows, mid = [], 0
+    for k in range(12):
+        for home, away in (("A", "B"), ("C", "D")):
+            mid += 1
+            rows.append({"id": mid, "season": 2024, "league": "L", "status": "FINISHED", "home_team": home,
+                         "away_team": away, "home_goals": k % 3, "away_goals": k % 2,
+                         "match_date": (TODAY - timedelta(days=7 * (12 - k))).isoformat()})
+    for mid, (home, away) in enumerate((("A", "C"), ("B", "D")), start=100):
+        rows.append({"id": mid, "season": 2024, "league": "L", "status": "SCHEDULED", "home_team": home,
+                     "away_team": away, "match_date": (TODAY + timedelta(days=2)).isoformat()})
+    db.insert("matches", rows)
+    return db
+
+
+def odds(match_id, over, created_at):
+    return {"match_id": match_id, "match_date": (TODAY + timedelta(days=2)).isoformat(), "home_team": "x",
+            "away_team": "y", "market": "totals", "line": 2.5, "is_live": False, "over_odds": over,
+            "under_odds": 1.9, "bookmaker": "b", "created_at": created_at}
+
+
+def prediction_runs(db):
+    return [(r["id"], r["fixtures"]) for r in db._query("select id, fixtures from prediction_runs order by id")]
+
+
+def test_run_predictions_recomputes_only_changed_fixtures(db):
+    db.insert("odds_snapshots", [odds(100, 1.9, "2025-02-28T10:00:00+00:00"),
+                                 odds(101, 2.1, "2025-02-28T10:00:00+00:00")])
+    run.run_predictions(TODAY, "form")
+    assert prediction_runs(db) == [(1, 2)]
+
+    run.run_predictions(TODAY, "form")
+    assert prediction_runs(db) == [(1, 2)]            # nič spremenjeno: ni novega runa
+
+    db.insert("odds_snapshots", [odds(101, 2.3, "2025-02-28T12:00:00+00:00")])
+    run.run_predictions(TODAY, "form")
+    assert prediction_runs(db) == [(1, 2), (2, 1)]
+    owners = {r["match_id"]: r["run_id"] for r in db._query("select match_id, run_id from predictions")}
+    assert owners == {100: 1, 101: 2}
+
+    run.run_predictions(TODAY, "form", force=True)
+    assert prediction_runs(db)[-1] == (3, 2)
@@ -0,0 +1,34 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import run
+from http_cache import CacheMiss, ResponseCache
+
+
+def test_replay_serves_recorded_entries_and_raises_on_miss(tmp_path):
+    ResponseCache(str(tmp_path), "record").store("odds", "k", [1])
+    replay = ResponseCache(str(tmp_path), "replay")
+    assert replay.cached("odds", "k") == (replay.load("odds", "k"), True)
+    with pytest.raises(CacheMiss):
+        replay.cached("odds", "other")
+
+
+def test_replay_runs_as_of_the_recording(tmp_path, monkeypatch):
+    ResponseCache(str(tmp_path), "record").save_recorded_at("2026-09-01T06:00:00+00:00")
+    assert ResponseCache(str(tmp_path), "cache").recorded_at() == "2026-09-01T06:00:00+00:00"
+
+    monkeypatch.setattr(run, "http_cache", ResponseCache(str(tmp_path), "replay"))
+    monkeypatch.setattr(run, "clock_shift", timedelta(0))
+    run.set_run_clock()
+    now = run.now_utc()
+    assert now.date().isoformat() == "2026-09-01"
+    assert abs(now - datetime(2026, 9, 1, 6, tzinfo=timezone.utc)) < timedelta(minutes=1)
+
+
+def test_record_stores_the_run_start(tmp_path, monkeypatch):
+    monkeypatch.setattr(run, "http_cache", ResponseCache(str(tmp_path), "record"))
+    monkeypatch.setattr(run, "clock_shift", timedelta(0))
+    run.set_run_clock()
+    assert run.clock_shift == timedelta(0)
+    assert run.http_cache.recorded_at()[:10] == datetime.now(timezone.utc).date().isoformat()
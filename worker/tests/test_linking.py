@@ -0,0 +1,51 @@
+from linking import FixtureIndex, norm_team
+
+ROWS = [
+    {"id": 1, "match_date": "2025-03-01", "home_team": "Manchester Utd", "away_team": "Wolverhampton Wanderers"},
+    {"id": 2, "match_date": "2025-03-01", "home_team": "Manchester United", "away_team": "Wolves"},
+    {"id": 3, "match_date": "2025-03-02", "home_team": "Inter", "away_team": "AC Milan"},
+    {"id": 4, "match_date": "2025-03-01", "home_team": "Arsenal FC", "away_team": "Chelsea FC"},
+]
+
+
+def test_norm_team():
+    assert norm_team("  Arsenal FC ") == "arsenal"
+    assert norm_team("Brighton & Hove") == "brighton and hove"
+    assert norm_team("Manchester Utd") == "manchester united"
+
+
+def test_exact_name_wins_over_normalized():
+    idx = FixtureIndex(ROWS)
+    # obe vrstici se normalizirata v isti par; točno ime mora izbrati svojo
+    assert idx.find("2025-03-01", "Manchester United", "Wolves") == 2
+    assert idx.find("2025-03-01", "Manchester Utd", "Wolverhampton Wanderers") == 1
+
+
+def test_normalized_then_adjacent_day():
+    idx = FixtureIndex(ROWS)
+    assert idx.find("2025-03-01", "Arsenal", "Chelsea") == 4
+    # večerna tekma je v drugem feedu že naslednji dan (UTC)
+    assert idx.find("2025-03-02", "Arsenal", "Chelsea") == 4
+    assert idx.find("2025-03-04", "Arsenal", "Chelsea") is None
+
+
+def test_same_day_beats_adjacent_day():
+    rows = ROWS + [{"id": 5, "match_date": "2025-03-02", "home_team": "Arsenal", "away_team": "Chelsea"}]
+    idx = FixtureIndex(rows)
+    assert idx.find("2025-03-02", "Arsenal", "Chelsea") == 5
+    assert idx.find("2025-03-01", "Arsenal", "Chelsea") == 4
+
+
+def test_fuzzy_needs_both_teams_and_is_memoized():
+    idx = FixtureIndex(ROWS)
+    assert idx.find("2025-03-02", "Inter Milan", "Milan AC") is None
+    assert idx.find("2025-03-02", "Napoli", "AC Milan") is None
+    assert idx.find("2025-03-02", "Inter Milan", "AC Milan") == 3
+    idx._by_date.clear()
+    assert idx.find("2025-03-02", "Inter Milan", "AC Milan") == 3
+
+
+def test_missing_fields():
+    idx = FixtureIndex(ROWS)
+    assert idx.find(None, "Arsenal", "Chelsea") is None
+    assert idx.find("2025-03-01", "", "Chelsea") is None
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+from scipy.stats import poisson
+
+import pricing
+
+LAM_HOME = np.array([1.4, 0.6, 2.2])
+LAM_AWAY = np.array([1.1, 0.9, 0.4])
+
+
+def total_dist(i):
+    # vsota dveh Poissonov je Poisson(lh + la)
+    return poisson(LAM_HOME[i] + LAM_AWAY[i])
+
+
+def test_probabilities_are_consistent():
+    p = pricing.price_scorelines(LAM_HOME, LAM_AWAY)
+    for line in pricing.TOTAL_LINES:
+        np.testing.assert_allclose(p[f"over_{line}"] + p[f"under_{line}"], 1.0)
+    np.testing.assert_allclose(p["home"] + p["draw"] + p["away"], 1.0)
+    np.testing.assert_allclose(p["btts_yes"] + p["btts_no"], 1.0)
+    for i in range(len(LAM_HOME)):
+        assert p["under_2.5"][i] == pytest.approx(total_dist(i).cdf(2), abs=1e-6)
+
+
+def test_rho_keeps_matrix_normalised():
+    mats = pricing.scoreline_matrices(LAM_HOME, LAM_AWAY, rho=-0.1)
+    plain = pricing.scoreline_matrices(LAM_HOME, LAM_AWAY)
+    # popravek samo prerazporedi verjetnost (vsota ostane do repa nad MAX_GOALS)
+    np.testing.assert_allclose(mats.sum(axis=(1, 2)), plain.sum(axis=(1, 2)))
+    assert (mats[:, 0, 0] > plain[:, 0, 0]).all()   # rho < 0 poveča 0-0
+
+
+def test_asian_half_line_is_plain_total():
+    p = pricing.price_scorelines(LAM_HOME, LAM_AWAY)
+    np.testing.assert_allclose(p["ah_over_2.5"], 1.0 / p["over_2.5"])
+    np.testing.assert_allclose(p["ah_under_2.5"], 1.0 / p["under_2.5"])
+
+
+def test_asian_whole_line_refunds_push():
+    p = pricing.price_scorelines(LAM_HOME, LAM_AWAY)
+    for i in range(len(LAM_HOME)):
+        d = total_dist(i)
+        win, lose = d.sf(2), d.cdf(1)           # total == 2 je push
+        assert p["ah_over_2.0"][i] == pytest.approx(1.0 + lose / win, rel=1e-5)
+        assert p["ah_under_2.0"][i] == pytest.approx(1.0 + win / lose, rel=1e-5)
+
+
+@pytest.mark.parametrize("line", [2.25, 2.75])
+def test_asian_quarter_line_breaks_even(line):
+    p = pricing.price_scorelines(LAM_HOME, LAM_AWAY)
+    cdf = np.cumsum(pricing.total_goals_dist(pricing.scoreline_matrices(LAM_HOME, LAM_AWAY)), axis=1)
+    for side in ("over", "under"):
+        odds = p[f"ah_{side}_{line}"]
+        ev = 0.0
+        # pol vložka na vsaki sosednji liniji; pri fair kvoti je pričakovani dobiček 0
+        for half in (line - 0.25, line + 0.25):
+            k = int(np.floor(half))
+            p_over = 1.0 - cdf[:, k]
+            p_under = cdf[:, k - 1] if half == k else cdf[:, k]
+            win, lose = (p_over, p_under) if side == "over" else (p_under, p_over)
+            ev = ev + 0.5 * (win * (odds - 1.0) - lose)
+        np.testing.assert_allclose(ev, 0.0, atol=1e-9)
+
+
+def test_markets_for_drops_infinite_odds():
+    p = pricing.price_scorelines(np.array([0.01]), np.array([0.01]))
+    m = pricing.markets_for(p, 0)
+    assert m["asian_fair_odds"]["0.5"]["over"] > 1.0
+    assert set(m) == {"ou", "1x2", "btts", "asian_fair_odds"}
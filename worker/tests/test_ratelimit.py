@@ -0,0 +1,48 @@
+import asyncio
+import os
+
+import aiohttp
+import pytest
+
+from http_cache import ResponseCache
+from ratelimit import OddsBudget, ProviderLimiter
+
+
+class FailingSession:
+    def get(self, url, headers=None):
+        raise aiohttp.ClientConnectionError("connection reset")
+
+
+def test_failed_requests_refund_their_reservation(tmp_path):
+    budget = OddsBudget(str(tmp_path / "budget.json"), daily=10)
+    limiter = ProviderLimiter("odds", quota=budget)
+    cache = ResponseCache(str(tmp_path / "http"), "off")
+
+    async def attempts():
+        for _ in range(3):   # kot retry(): vsak poskus rezervira znova
+            with pytest.raises(aiohttp.ClientConnectionError):
+                await cache.get_json(FailingSession(), "odds", "https://odds/x", limiter=limiter, cost=2)
+
+    asyncio.run(attempts())
+    assert limiter.requests == 3
+    assert (budget.state["day_used"], budget.state["month_used"]) == (0, 0)
+
+
+def test_settle_charges_only_what_the_provider_reports(tmp_path):
+    budget = OddsBudget(str(tmp_path / "budget.json"), daily=10)
+    budget.reserve(2)
+    budget.settle(429, {}, reserved=2)     # 429 brez x-requests-last: ni zaračunan
+    assert budget.state["day_used"] == 0
+    budget.reserve(2)
+    budget.settle(200, {"x-requests-last": "1", "x-requests-used": "40"}, reserved=2)
+    assert (budget.state["day_used"], budget.state["month_used"]) == (1, 40)
+
+
+def test_settle_leaves_the_write_to_save(tmp_path):
+    path = str(tmp_path / "budget.json")
+    budget = OddsBudget(path)
+    budget.reserve(1)
+    budget.settle(200, {"x-requests-last": "1"})
+    assert budget.dirty and not os.path.exists(path)
+    budget.save()
+    assert not budget.dirty and OddsBudget(path).state["day_used"] == 1
@@ -0,0 +1,65 @@
+import pytest
+
+pytest.importorskip("pyarrow")
+
+import snapshot as S  # noqa: E402
+from storage.sqlite_backend import SQLiteStorage  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = SQLiteStorage(str(tmp_path / "s.db"))
+    matches, shots, odds = [], [], []
+    mid = 0
+    for league in ("EPL", "La liga"):
+        for season in (2023, 2024):
+            for k in range(20):
+                mid += 1
+                d = f"{season}-09-{k + 1:02d}"
+                matches.append({"id": mid, "season": season, "match_date": d, "league": league,
+                                "home_team": f"{league} H{k}", "away_team": f"{league} A{k}",
+                                "home_goals": k % 4, "away_goals": k % 3, "status": "FINISHED",
+                                "understat_match_id": str(mid)})
+                shots += [{"match_id": mid, "team_name": f"{league} H{k}", "minute": j, "xg": 0.1,
+                           "is_goal": False, "situation": "OpenPlay"} for j in range(3)]
+                odds.append({"match_id": mid, "match_date": d, "home_team": "h", "away_team": "a", "market": "totals",
+                             "line": 2.5, "is_live": False, "over_odds": 1.9, "under_odds": 1.95, "bookmaker": "x",
+                             "created_at": f"{d}T08:00:00+00:00"})
+    db.insert("matches", matches)
+    db.insert("shots", shots)
+    db.insert("odds_snapshots", odds)
+    db.insert("standings", [{"season": 2024, "as_of_date": "2024-09-01", "team_name": "EPL H1", "position": 1,
+                             "points": 3, "played": 1, "goal_diff": 1}])
+    run_id = db.create_prediction_run({"status": "building", "model": "form"})
+    db.insert("prediction_history", [{"run_id": run_id, "match_id": m, "p_over_25": 0.5, "input_fp": "fp"}
+                                     for m in (1, 2)])
+    db.publish_prediction_run(run_id, 30)
+    return db
+
+
+def canon(root):
+    return {t: S.load_table(t, root).sort_by("id").to_pylist() for t in S.TABLES}
+
+
+def test_incremental_export_matches_full_export(db, tmp_path):
+    inc, full = str(tmp_path / "inc"), str(tmp_path / "full")
+    S.export_snapshot(db, inc)
+    again = S.export_snapshot(db, inc)
+    assert again["matches"]["partitions"] == 0 and again["predictions"]["partitions"] == 0
+
+    with db._lock, db.conn:
+        db.conn.execute("update matches set home_goals = 5 where id = 3")
+        db.conn.execute("update matches set league = 'La liga' where id = 4")   # tekma zamenja particijo
+        db.conn.execute("delete from shots where match_id = 5")
+        db.conn.execute("update matches set home_shots = 0 where id = 5")   # kot refresh_match_xg
+    db.insert("shots", [{"match_id": 3, "team_name": "x", "minute": 90, "xg": 0.7, "is_goal": True,
+                         "situation": "Penalty"}])
+    db.insert("odds_snapshots", [{"match_id": 6, "match_date": "2023-09-06", "home_team": "h", "away_team": "a",
+                                  "market": "totals", "line": 2.5, "is_live": False, "over_odds": 2.0,
+                                  "under_odds": 1.8, "bookmaker": "y", "created_at": "2023-09-06T09:00:00+00:00"}])
+    stats = S.export_snapshot(db, inc)
+    assert stats["matches"]["changed"] == 3
+
+    S.export_snapshot(db, full, full=True)
+    assert canon(inc) == canon(full)
+    assert {r["input_fp"] for r in S.load_table("predictions", inc).to_pylist()} == {"fp"}
@@ -0,0 +1,59 @@
+import pytest
+
+from storage.sqlite_backend import SQLiteStorage
+
+
+@pytest.fixture
+def db(tmp_path):
+    return SQLiteStorage(str(tmp_path / "t.db"))
+
+
+def publish(db, match_ids, fp="a"):
+    run_id = db.create_prediction_run({"status": "building", "model": "form"})
+    db.insert("prediction_history", [{"run_id": run_id, "match_id": m, "p_over_25": 0.5, "input_fp": fp}
+                                     for m in match_ids])
+    return run_id, db.publish_prediction_run(run_id, 30)
+
+
+def runs(db):
+    return {r["id"]: r["status"] for r in db._query("select id, status from prediction_runs")}
+
+
+def test_publish_replaces_only_the_runs_matches(db):
+    r1, n1 = publish(db, [1, 2, 3])
+    r2, n2 = publish(db, [2], fp="b")
+    assert (n1, n2) == (3, 1)
+    owners = {r["match_id"]: r["run_id"] for r in db._query("select match_id, run_id from predictions")}
+    assert owners == {1: r1, 2: r2, 3: r1}
+    assert db.prediction_fingerprints([1, 2, 3, 4]) == {1: "a", 2: "b", 3: "a"}
+
+
+def test_run_owning_live_predictions_is_not_superseded(db):
+    r1, _ = publish(db, [1, 2])
+    r2, _ = publish(db, [2])
+    assert runs(db) == {r1: "published", r2: "published"}
+    r3, _ = publish(db, [1])
+    assert runs(db) == {r1: "superseded", r2: "published", r3: "published"}
+
+
+def test_retention_keeps_runs_that_still_own_predictions(db):
+    r1, _ = publish(db, [1, 2])
+    r2, _ = publish(db, [2])
+    with db._lock, db.conn:
+        db.conn.execute("update prediction_runs set created_at = '2000-01-01T00:00:00+00:00'")
+    r3, _ = publish(db, [2])
+    # r1 ima še napoved za tekmo 1: provenance (prediction_history) mora ostati
+    assert runs(db) == {r1: "published", r3: "published"}
+    assert db._query("select count(*) n from prediction_history where run_id = ?", (r1,))[0]["n"] == 2
+    r4, _ = publish(db, [1])
+    assert runs(db) == {r3: "published", r4: "published"}
+
+
+def test_added_columns_are_migrated(tmp_path):
+    path = str(tmp_path / "old.db")
+    db = SQLiteStorage(path)
+    with db._lock, db.conn:
+        db.conn.execute("alter table predictions drop column input_fp")
+    db.conn.close()
+    db = SQLiteStorage(path)
+    assert "input_fp" in {r["name"] for r in db._query("pragma table_info(predictions)")}
@@ -0,0 +1,117 @@
+import contextvars
+
+import pytest
+
+import run
+from storage.sqlite_backend import SQLiteStorage
+
+
+class FakeStorage:
+    """Records bulk writes; a chunk containing a row with bad=True fails."""
+
+    def __init__(self):
+        self.calls = []
+
+    def insert(self, table, rows):
+        self.calls.append((table, [r["id"] for r in rows]))
+        if any(r.get("bad") for r in rows):
+            raise RuntimeError("constraint violation")
+
+    def upsert(self, table, rows, on_conflict):
+        self.calls.append((table, [r["id"] for r in rows]))
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    store = FakeStorage()
+    monkeypatch.setattr(run, "db", store)
+    return store
+
+
+@pytest.fixture
+def sqlite_db(monkeypatch, tmp_path):
+    store = SQLiteStorage(str(tmp_path / "t.db"))
+    monkeypatch.setattr(run, "db", store)
+    return store
+
+
+def test_failed_chunk_is_retried_row_by_row(fake_db):
+    buf = run.WriteBuffer(batch_size=3)
+    for i in range(7):
+        buf.insert("shots", {"id": i, "bad": i == 4})
+    buf.flush()
+    assert buf.written == 6
+    assert [f[:2] for f in buf.failed] == [("shots", "id=4")]
+    # chunki [0,1,2] [3,4,5] [6], padli chunk po vrsticah
+    assert fake_db.calls == [("shots", [0, 1, 2]), ("shots", [3, 4, 5]), ("shots", [3]), ("shots", [4]),
+                             ("shots", [5]), ("shots", [6])]
+    assert buf.requests == 6
+
+
+def test_upserts_dedupe_on_conflict_key_and_split_by_columns(fake_db):
+    buf = run.WriteBuffer(batch_size=10)
+    buf.upsert("matches", {"id": 1, "x": 1}, on_conflict="id")
+    buf.upsert("matches", {"id": 1, "x": 2}, on_conflict="id")
+    buf.upsert("matches", {"id": 2, "x": 1, "y": 1}, on_conflict="id")
+    assert buf.pending() == 2
+    buf.flush()
+    assert sorted(fake_db.calls) == [("matches", [1]), ("matches", [2])]
+
+
+def test_report_resets_only_its_own_buffer(fake_db, capsys):
+    a, b = run.WriteBuffer(), run.WriteBuffer()
+    a.insert("shots", {"id": 1, "bad": True})
+    b.insert("odds_snapshots", {"id": 2})
+    a.flush()
+    b.flush()
+    b.report("STEP 4 odds")
+    assert "odds: wrote 1 rows" in capsys.readouterr().out
+    assert len(a.failed) == 1
+
+
+def test_writes_follows_the_stage_buffer(fake_db):
+    stage = run.WriteBuffer()
+
+    def in_stage():
+        run.current_writes.set(stage)
+        run.writes.insert("shots", {"id": 1})
+
+    contextvars.copy_context().run(in_stage)
+    assert stage.pending() == 1
+    assert run.writes.pending() == 0      # zunaj stagea: privzeti buffer
+
+
+def in_prediction_run(fn):
+    """Call fn with its own write buffer, as run_predictions does."""
+    ctx = contextvars.copy_context()
+    ctx.run(run.current_writes.set, run.WriteBuffer())
+    return ctx.run(fn)
+
+
+def test_publish_refuses_run_with_failed_history_rows(sqlite_db):
+    def build_and_publish():
+        run_id = sqlite_db.create_prediction_run({"status": "building", "model": "form"})
+        run.writes.insert("prediction_history", {"run_id": run_id, "match_id": 1, "p_over_25": 0.5})
+        run.writes.insert("prediction_history", {"run_id": run_id, "match_id": None, "p_over_25": 0.5})
+        # drug stage medtem flusha in resetira svoj buffer: run mora vseeno videti svojo napako
+        other = contextvars.copy_context()
+        other.run(run.current_writes.set, run.WriteBuffer())
+        other.run(run.flush_stage, "STEP 4 odds")
+        run.publish_prediction_run(run_id)
+        return run_id
+
+    run_id = in_prediction_run(build_and_publish)
+    status = sqlite_db._query("select status from prediction_runs where id = ?", (run_id,))[0]["status"]
+    assert status == "failed"
+    assert sqlite_db._query("select count(*) n from predictions")[0]["n"] == 0
+
+
+def test_publish_waits_for_the_runs_rows(sqlite_db):
+    def build_and_publish():
+        run_id = sqlite_db.create_prediction_run({"status": "building", "model": "form"})
+        for mid in range(1, 1201):   # več batchev: del jih writer pošlje že med gradnjo
+            run.writes.insert("prediction_history", {"run_id": run_id, "match_id": mid, "p_over_25": 0.5})
+        run.publish_prediction_run(run_id)
+
+    in_prediction_run(build_and_publish)
+    assert sqlite_db._query("select count(*) n from predictions")[0]["n"] == 1200